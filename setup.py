@@ -146,8 +146,11 @@ if __name__ == "__main__":
             # that you indicate whether you support Python 2, Python 3 or both.
             'Programming Language :: Python :: 2',
             'Programming Language :: Python :: 2.7',
-            #'Programming Language :: Python :: 3',
-            #'Programming Language :: Python :: 3.5',
+            'Programming Language :: Python :: 3',
+            'Programming Language :: Python :: 3.10',
+            'Programming Language :: Python :: 3.11',
+            'Programming Language :: Python :: 3.12',
+            'Programming Language :: Python :: 3.13',
         ],
 
         # What does your project relate to?
@@ -181,6 +184,9 @@ if __name__ == "__main__":
         extras_require={
             'dev': INSTALL_REQUIRES,
             'test': TESTS_REQUIRE,
+            'can': ['python-can'],
+            'parquet': ['pyarrow'],
+            'numpy': ['numpy'],
         },
 
         # If there are data files included in your packages that need to be
@@ -197,9 +203,11 @@ if __name__ == "__main__":
         # To provide executable scripts, use entry points in preference to the
         # "scripts" keyword. Entry points provide cross-platform support and allow
         # pip to create the appropriate form of executable for the target platform.
-        # entry_points={
-        #     'console_scripts': [
-        #         'sample=sample:main',
-        #     ],
-        # },
+        entry_points={
+            'console_scripts': [
+                'mdfwriter=mdfwriter.convert:main',
+                'mdfwriter-recover=mdfwriter.recovery:main',
+                'mdfwriter-loadgen=mdfwriter.loadgen:main',
+            ],
+        },
     )
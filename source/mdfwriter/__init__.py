@@ -1,4 +1,7 @@
 from __future__ import absolute_import
+import importlib
+import sys
+
 __author__ = "sadaleo"
 
 try:
@@ -9,4 +12,58 @@ except ImportError:
 
 version = __version__
 
-from .mdf import *
+# Public names -> submodule. Submodules are imported on first attribute access (PEP 562), so import mdfwriter stays
+# cheap for short-lived tools. Other names, e.g. STRUCT_TYPE or the block classes, resolve from the mdf module as
+# with the former star import.
+_LAZY_NAMES = {'MDF': 'mdf',
+               'ChannelGroup': 'mdf',
+               'CANmsg': 'mdf',
+               'Channel': 'mdf',
+               'StringChannel': 'mdf',
+               'CANSignal': 'mdf',
+               'DEJ': 'mdf',
+               'MDF4': 'mdf4',
+               'MDFTemplate': 'template',
+               'ShardLayout': 'shard',
+               'ShardWriter': 'shard',
+               'merge_shards': 'shard',
+               'TriggeredMDF': 'trigger',
+               'CANBridge': 'canbridge',
+               'open_bus': 'canbridge'}
+# Names of the mdf module that the former "from .mdf import *" exported, resolved by __getattr__ as well
+_MDF_NAMES = ('CANSignal', 'CAN_FD_PAYLOAD_SIZES', 'CAN_PAYLOAD_SIZE', 'CANmsg', 'CCBlock', 'CEBlock', 'CGBlock',
+              'CNBlock', 'Channel', 'ChannelGroup', 'DEJ', 'DGBlock', 'HDBlock', 'IDBlock', 'INTEGER_TYPES', 'MDF',
+              'MDFMetrics', 'NULL_SPAN', 'PhaseTimer', 'STRUCT_TYPE', 'SpillBuffer', 'StringChannel', 'TEXT_TYPE',
+              'TXBlock', 'clock', 'encode_field', 'monotonic_ns', 'pack_field', 'time_ns')
+_SUBMODULES = ('canbridge', 'compression', 'convert', 'loadgen', 'mdf', 'mdf4', 'mdf4blocks', 'mdfblocks', 'metrics',
+               'policies', 'profiling', 'reader', 'recovery', 'shard', 'spill', 'template', 'trigger', 'utils')
+
+__all__ = sorted(set(_LAZY_NAMES) | set(_MDF_NAMES))
+
+
+def __getattr__(name):
+    if name in _SUBMODULES:
+        return importlib.import_module('.' + name, __name__)
+    if name.startswith('__'):
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+    module = importlib.import_module('.' + _LAZY_NAMES.get(name, 'mdf'), __name__)
+    try:
+        value = getattr(module, name)
+    except AttributeError:
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__) | set(_SUBMODULES))
+
+
+if sys.version_info < (3, 7):
+    # No module __getattr__, import everything up front
+    from .mdf import *
+    from .mdf4 import MDF4
+    from .shard import ShardLayout, ShardWriter, merge_shards
+    from .template import MDFTemplate
+    from .trigger import TriggeredMDF
+    from .canbridge import CANBridge, open_bus
@@ -0,0 +1,147 @@
+"""Bridge from a python-can bus to an MDF or MDF4 writer. CANBridge receives frames in batches, looks up the CANmsg
+group of each arbitration ID (e.g. imported with MDF.import_dej) and writes every batch with one write_many() per
+message, so the write lock is taken once per message and batch instead of once per frame.
+
+    mdf = MDF('drive.mdf', author, project, dut)
+    mdf.import_dej('vehicle.json')
+    mdf.start_file()
+    bridge = CANBridge(mdf, open_bus('vcan0'))
+    bridge.start()
+    ...
+    bridge.stop()
+    mdf.close_file()
+    print(bridge.counts())
+
+python-can is optional, it is only imported by open_bus. Any object with the recv(timeout) method of can.BusABC that
+returns can.Message like frames works as bus.
+"""
+import logging
+import threading
+from .metrics import clock
+
+logger = logging.getLogger(__name__)
+
+
+def open_bus(channel='vcan0', interface='socketcan', **kwargs):
+    """Opens a python-can bus, by default the SocketCAN interface vcan0.
+    :param str channel: CAN channel, e.g. 'vcan0' or 'can0'
+    :param str interface: python-can interface, e.g. 'socketcan' or 'virtual'
+    :param kwargs: Further arguments of can.Bus, e.g. fd=True
+    """
+    try:
+        import can
+    except ImportError:
+        raise ImportError("open_bus needs python-can, install mdfwriter[can]")
+    return can.Bus(channel=channel, interface=interface, **kwargs)
+
+
+class CANBridge(object):
+    """Feeds the frames of a python-can bus into the CAN groups of an MDF. Frames are written with timestamps relative
+    to the start time of the MDF, within one batch the frames of each message are written together.
+    :param mdf: MDF or MDF4 with CANmsg groups, started with start_file before frames are written
+    :param bus: python-can bus
+    :param int batch_size: Maximum number of frames received before they are written
+    :param float timeout: Seconds to wait for the first frame of a batch
+    :param dict id_map: Arbitration ID -> channel group name. By default the messageID of every CANmsg group.
+    :param float start_time: Seconds since 01.01.1970 UTC that frame timestamps are relative to, defaults to the start
+        time of the MDF. Use 0 for buses that timestamp frames relative to their own start.
+    """
+    def __init__(self, mdf, bus, batch_size=256, timeout=0.1, id_map=None, start_time=None):
+        self.mdf = mdf
+        self.bus = bus
+        self.batchSize = batch_size
+        self.timeout = timeout
+        if id_map is None:
+            id_map = dict((cg_block.messageID, cg_block.name) for cg_block in mdf.cgBlockList if cg_block.isCAN)
+        self.idMap = id_map
+        if start_time is None:
+            start_time = mdf.HDBlock.startTimeNs / 1e9
+        self.startTime = start_time
+        self.busFrames = 0  # frames received from the bus
+        self.writtenFrames = 0  # frames written to the MDF
+        self.unknownFrames = 0  # frames of arbitration IDs without a group
+        self.skippedFrames = 0  # error and remote frames
+        self.running = False
+        self.thread = None
+        self.error = None  # exception that stopped the background thread
+
+    def poll(self, timeout=None):
+        """Receives one batch: waits up to timeout for a frame, then takes frames as long as the bus has some ready
+        and the batch is not full. Returns the number of frames received.
+        :param float timeout: Seconds to wait for the first frame, defaults to the timeout of the bridge
+        """
+        recv = self.bus.recv
+        message = recv(self.timeout if timeout is None else timeout)
+        if message is None:
+            return 0
+        id_map = self.idMap
+        start_time = self.startTime
+        batch_size = self.batchSize
+        batches = {}
+        received = unwritten = 0
+        while message is not None:
+            received += 1
+            name = id_map.get(message.arbitration_id)
+            if message.is_error_frame or message.is_remote_frame:
+                self.skippedFrames += 1
+                unwritten += 1
+            elif name is None:
+                self.unknownFrames += 1
+                unwritten += 1
+            else:
+                records = batches.get(name)
+                if records is None:
+                    records = batches[name] = []
+                records.append((message.timestamp - start_time, message.data))
+            if received >= batch_size:
+                break
+            message = recv(0)
+        self.busFrames += received
+        if unwritten and self.mdf.metrics is not None:
+            self.mdf.metrics.add_dropped(unwritten)
+        write_many = self.mdf.write_many
+        for name, records in batches.items():
+            write_many(name, records)
+            self.writtenFrames += len(records)
+        return received
+
+    def run(self, duration=None):
+        """Writes frames until stop() is called or duration seconds of polling passed.
+        :param float duration: Seconds to run, None runs until stop()
+        """
+        self.running = True
+        end = None if duration is None else clock() + duration
+        while self.running and (end is None or clock() < end):
+            self.poll()
+
+    def start(self):
+        """Runs the bridge in a background thread."""
+        self.error = None
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="can-bridge")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        """Stops the background thread after its current batch is written."""
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def counts(self):
+        """Returns the frame counters as dictionary. busFrames - writtenFrames frames were not written, they are
+        counted as unknownFrames or skippedFrames."""
+        return {'busFrames': self.busFrames,
+                'writtenFrames': self.writtenFrames,
+                'unknownFrames': self.unknownFrames,
+                'skippedFrames': self.skippedFrames}
+
+    def _run(self):
+        try:
+            while self.running:
+                self.poll()
+        except Exception as error:
+            logger.exception("CAN bridge stopped")
+            self.error = error
+            self.running = False
@@ -0,0 +1,59 @@
+"""Compression helpers for the DZ data blocks of MDF 4 files. A DZ block holds a deflated copy of a DT block. With the
+transposition variant, the data is first viewed as a matrix with one row per record and transposed, so that bytes of
+the same channel end up next to each other. That compresses much better for slowly changing signals."""
+import zlib
+
+DEFLATE = 0  # dz_zip_type: Deflate
+TRANSPOSE_DEFLATE = 1  # dz_zip_type: Transposition + Deflate
+
+
+def transpose(data, columns):
+    """Transposes data seen as a matrix of rows with columns bytes each. Bytes that do not fill a complete row are
+    appended unchanged, as required by the MDF 4 specification.
+    :param bytes data: Data of complete records
+    :param int columns: Record size in bytes (dz_zip_parameter)
+    """
+    rows = len(data) // columns
+    if rows < 2 or columns < 2:
+        return bytes(data)
+    end = rows * columns
+    return b''.join([data[i:end:columns] for i in range(columns)]) + data[end:]
+
+
+def untranspose(data, columns):
+    """Reverses transpose.
+    :param bytes data: Transposed data
+    :param int columns: Record size in bytes (dz_zip_parameter)
+    """
+    rows = len(data) // columns
+    if rows < 2 or columns < 2:
+        return bytes(data)
+    end = rows * columns
+    result = bytearray(end)
+    for i in range(columns):
+        result[i:end:columns] = data[i * rows:(i + 1) * rows]
+    return bytes(result) + data[end:]
+
+
+def compress(data, zip_type, columns=0, level=6):
+    """Returns the DZ payload for data.
+    :param bytes data: Uncompressed DT block data
+    :param int zip_type: DEFLATE or TRANSPOSE_DEFLATE
+    :param int columns: Record size in bytes, only used for TRANSPOSE_DEFLATE
+    :param int level: zlib compression level
+    """
+    if zip_type == TRANSPOSE_DEFLATE:
+        data = transpose(data, columns)
+    return zlib.compress(data, level)
+
+
+def decompress(data, zip_type, columns=0):
+    """Reverses compress.
+    :param bytes data: DZ payload
+    :param int zip_type: DEFLATE or TRANSPOSE_DEFLATE
+    :param int columns: Record size in bytes, only used for TRANSPOSE_DEFLATE
+    """
+    data = zlib.decompress(data)
+    if zip_type == TRANSPOSE_DEFLATE:
+        data = untranspose(data, columns)
+    return data
@@ -0,0 +1,415 @@
+"""Conversion of tabular files to MDF: CSV, Parquet (with pyarrow) and .npy (with NumPy). Inputs are read in chunks of
+rows and every chunk is written with one write_many() per channel group, so memory does not grow with the input size.
+Several inputs are converted in parallel worker processes.
+
+    mdfwriter bench.csv -o bench.mdf
+    mdfwriter run1.csv run2.csv run3.parquet --output-dir converted --processes 3 --group "Engine=rpm,torque"
+
+A CSV file has one header row with the channel names. Units are taken from names like "Speed [km/h]" or
+"Speed (km/h)", or from a second header row (--units-row, detected automatically when the time column of the second
+row is not a number). The time column is the first column named time, timestamp or t, or --time-column, in seconds.
+Without one, rows are --period seconds apart. Columns with text values become StringChannels.
+"""
+import argparse
+import csv
+import io
+import logging
+import os
+import re
+import sys
+from .mdf import MDF, ChannelGroup, Channel, StringChannel
+from .utils import TEXT_TYPE
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 10000  # rows per write_many
+TIME_COLUMNS = ('time', 'timestamp', 't', 'zeit')
+NAME_AND_UNIT = re.compile(r'^\s*(.*?)\s*[\[(]\s*(.*?)\s*[\])]\s*$')
+MAX_STRING_WIDTH = 255  # bytes, widest StringChannel inferred from the data
+NAN = float('nan')
+
+
+def split_unit(header):
+    """Splits a column header like "Speed [km/h]" into ("Speed", "km/h"). Headers without unit get ""."""
+    match = NAME_AND_UNIT.match(header)
+    if match is None or not match.group(1):
+        return header.strip(), ''
+    return match.group(1), match.group(2)
+
+
+def _number(value):
+    """Value of a numeric cell, NaN for empty cells. Raises ValueError for text."""
+    if value is None or value == '':
+        return NAN
+    return float(value)
+
+
+def _time(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return NAN
+
+
+def _text(value):
+    """Bytes of a text cell. Text is encoded once here, characters outside latin-1 become '?'."""
+    if value is None:
+        return b''
+    if isinstance(value, bytes):
+        return value
+    if not isinstance(value, TEXT_TYPE):
+        value = TEXT_TYPE(value)
+    return value.encode('latin-1', 'replace')
+
+
+def _is_number(value):
+    """True for numbers and numeric strings, None for empty cells that do not tell."""
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, float)):
+        return True
+    try:
+        float(value)
+        return True
+    except (TypeError, ValueError):
+        return False
+
+
+def _decode_row(row):
+    return [cell.decode('utf-8-sig') for cell in row]
+
+
+class CSVSource(object):
+    """Rows of a CSV file, as lists of strings.
+    :param str file_name: CSV file
+    :param str delimiter: Column delimiter
+    :param bool units_row: The second row holds units. None detects it from the time column.
+    :param str time_column: Name of the time column, see find_time_column
+    """
+    def __init__(self, file_name, delimiter=',', units_row=None, time_column=None):
+        if sys.version_info[0] < 3:
+            # The Python 2 csv module reads bytes, the cells are decoded like the text of Python 3
+            self.file = open(file_name, 'rb')
+            self.reader = (_decode_row(row) for row in csv.reader(self.file, delimiter=str(delimiter)))
+        else:
+            self.file = io.open(file_name, 'r', newline='', encoding='utf-8-sig')
+            self.reader = csv.reader(self.file, delimiter=delimiter)
+        headers = next(self.reader)
+        self.columns, self.units = [], []
+        for header in headers:
+            name, unit = split_unit(header)
+            self.columns.append(name)
+            self.units.append(unit)
+        self.pending = []
+        time_index = find_time_column(self.columns, time_column)
+        if units_row is None:
+            row = next(self.reader, None)
+            if row is not None:
+                if time_index is not None and time_index < len(row) and _is_number(row[time_index]) is False:
+                    units_row = True
+                else:
+                    self.pending = [row]
+            if units_row:
+                self._set_units(row)
+        elif units_row:
+            self._set_units(next(self.reader, []))
+
+    def _set_units(self, row):
+        for index, unit in enumerate(row[:len(self.units)]):
+            if unit.strip():
+                self.units[index] = unit.strip()
+
+    def chunks(self, chunk_size):
+        chunk = self.pending
+        self.pending = []
+        for row in self.reader:
+            if row:
+                chunk.append(row)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetSource(object):
+    """Rows of a Parquet file, read one record batch at a time with pyarrow. Units come from the "unit" metadata of
+    the fields."""
+    def __init__(self, file_name, **kwargs):
+        try:
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError("Parquet input needs pyarrow")
+        self.file = pyarrow.parquet.ParquetFile(file_name)
+        schema = self.file.schema_arrow
+        self.columns = list(schema.names)
+        self.units = [(field.metadata or {}).get(b'unit', b'').decode('utf-8') for field in schema]
+
+    def chunks(self, chunk_size):
+        for batch in self.file.iter_batches(batch_size=chunk_size):
+            yield list(zip(*[column.to_pylist() for column in batch.columns]))
+
+    def close(self):
+        pass
+
+
+class NumpySource(object):
+    """Rows of a .npy file, memory mapped. Structured arrays give one column per field, 2D arrays one column per
+    array column."""
+    def __init__(self, file_name, **kwargs):
+        try:
+            import numpy
+        except ImportError:
+            raise ImportError(".npy input needs NumPy")
+        self.array = numpy.load(file_name, mmap_mode='r')
+        if self.array.dtype.names:
+            self.columns = list(self.array.dtype.names)
+        elif self.array.ndim == 2:
+            self.columns = ['Column%d' % index for index in range(self.array.shape[1])]
+        else:
+            self.columns = ['Value']
+        self.units = [''] * len(self.columns)
+
+    def chunks(self, chunk_size):
+        for start in range(0, len(self.array), chunk_size):
+            rows = self.array[start:start + chunk_size].tolist()
+            if self.array.ndim == 1 and not self.array.dtype.names:
+                rows = [(value,) for value in rows]
+            yield rows
+
+    def close(self):
+        pass
+
+
+SOURCES = {'.csv': CSVSource, '.txt': CSVSource, '.parquet': ParquetSource, '.npy': NumpySource}
+
+
+def open_source(file_name, **kwargs):
+    """Opens a tabular input by its file extension, CSV for unknown ones."""
+    source_class = SOURCES.get(os.path.splitext(file_name)[1].lower(), CSVSource)
+    return source_class(file_name, **kwargs)
+
+
+def find_time_column(columns, time_column=None):
+    """Index of the time column: the column named time_column, else the first column with a usual time name."""
+    if time_column is not None:
+        if time_column not in columns:
+            raise ValueError("no column %r" % time_column)
+        return columns.index(time_column)
+    for index, column in enumerate(columns):
+        if column.lower() in TIME_COLUMNS:
+            return index
+    return None
+
+
+def parse_groups(specifications):
+    """Parses --group options "Name=col1,col2" into [(name, [columns])]."""
+    groups = []
+    for specification in specifications or []:
+        name, _, columns = specification.partition('=')
+        if not name or not columns:
+            raise ValueError("group %r is not Name=column,column" % specification)
+        groups.append((name.strip(), [column.strip() for column in columns.split(',')]))
+    return groups
+
+
+def convert_file(input_name, output_name, mdf_class=MDF, groups=None, time_column=None, period=1.0,
+                 chunk_size=CHUNK_SIZE, string_width=None, author='', project='', dut='', **source_options):
+    """Converts one tabular file to MDF and returns the number of rows written. Rows without valid time are skipped.
+    :param str input_name: CSV, Parquet or .npy file
+    :param str output_name: MDF file to write
+    :param mdf_class: MDF or MDF4
+    :param list groups: [(group name, [column names])], columns in no group go to a group named after the input
+    :param str time_column: Name of the time column in seconds, found by name if None
+    :param float period: Seconds between rows of inputs without time column
+    :param int chunk_size: Rows read and written at once
+    :param int string_width: Bytes of text channels, by default the longest value of the first chunk
+    :param source_options: delimiter and units_row of CSV inputs
+    """
+    source = open_source(input_name, time_column=time_column, **source_options)
+    try:
+        chunks = source.chunks(chunk_size)
+        first = next(chunks, [])
+        time_index = find_time_column(source.columns, time_column)
+        channel_groups, layout = _channel_groups(source, first, groups or [], time_index,
+                                                 os.path.splitext(os.path.basename(input_name))[0], string_width)
+        mdf = mdf_class(output_name, author, project, dut, 'Converted from %s' % os.path.basename(input_name))
+        for channel_group in channel_groups:
+            mdf.add_channel_group(channel_group)
+        mdf.start_file()
+        try:
+            read = rows = 0
+            chunk = first
+            truncated = set()
+            while chunk:
+                rows += _write_chunk(mdf, layout, source.columns, chunk, time_index, read, period, truncated)
+                read += len(chunk)
+                chunk = next(chunks, None)
+        except Exception:
+            mdf.file.close()
+            os.remove(output_name)
+            raise
+        mdf.close_file()
+    finally:
+        source.close()
+    logger.info("%s: %d rows written to %s", input_name, rows, output_name)
+    return rows
+
+
+def _channel_groups(source, first, groups, time_index, default_name, string_width):
+    """Builds the channel groups from the columns and the values of the first chunk. Returns the ChannelGroups and
+    their layout [(group name, [(converter, column index, text width or None)])]."""
+    grouped = set(column for _, columns in groups for column in columns)
+    rest = [column for index, column in enumerate(source.columns) if index != time_index and column not in grouped]
+    if rest:
+        groups = groups + [(default_name, rest)]
+    channel_groups, layout = [], []
+    for name, columns in groups:
+        channel_group = ChannelGroup(name, 'Converted columns')
+        fields = []
+        for column in columns:
+            if column not in source.columns:
+                raise ValueError("no column %r for group %r" % (column, name))
+            index = source.columns.index(column)
+            values = [row[index] for row in first if index < len(row)]
+            kinds = set(_is_number(value) for value in values)
+            if False in kinds:
+                # Longer values of later chunks are truncated to the width with a warning
+                width = string_width or min(max(len(_text(value)) for value in values) or 1, MAX_STRING_WIDTH)
+                channel_group.add_channel(StringChannel(column, width, column))
+                fields.append((_text, index, width))
+            else:
+                channel_group.add_channel(Channel(column, source.units[index], column))
+                fields.append((_number, index, None))
+        channel_groups.append(channel_group)
+        layout.append((name, fields))
+    return channel_groups, layout
+
+
+def _write_chunk(mdf, layout, columns, chunk, time_index, first_row, period, truncated):
+    """Writes one chunk of rows, one write_many per group, and returns the number of rows written. Rows without a
+    valid time are skipped, text in numeric columns raises ValueError. Text longer than its channel is truncated with
+    one warning per column, the indexes of the columns warned about are added to truncated."""
+    if time_index is None:
+        times = [(first_row + offset) * period for offset in range(len(chunk))]
+    else:
+        times = [_time(row[time_index]) if time_index < len(row) else NAN for row in chunk]
+    width = max(index for _, fields in layout for _, index, _ in fields) + 1 if layout else 0
+    padding = [None] * width
+    for name, fields in layout:
+        records = []
+        for offset, (timestamp, row) in enumerate(zip(times, chunk)):
+            if timestamp != timestamp:
+                continue  # NaN, no time
+            if len(row) < width:
+                row = list(row) + padding[len(row):]
+            try:
+                records.append((timestamp, [convert(row[index]) for convert, index, _ in fields]))
+            except (TypeError, ValueError):
+                for convert, index, _ in fields:
+                    try:
+                        convert(row[index])
+                    except (TypeError, ValueError):
+                        raise ValueError('data row %d: column "%s" is numeric in the first chunk, but holds "%s". '
+                                         'Use a larger --chunk-size so the column becomes a text channel.'
+                                         % (first_row + offset + 1, columns[index], row[index]))
+                raise
+        for position, (_, index, text_width) in enumerate(fields):
+            if text_width is None or index in truncated:
+                continue
+            longest = max([len(values[position]) for _, values in records] or [0])
+            if longest > text_width:
+                truncated.add(index)
+                logger.warning('Column "%s" holds text of up to %d bytes from data row %d on, which is truncated to '
+                               'the %d bytes of its channel. Use --string-width for longer text.',
+                               columns[index], longest, first_row + 1, text_width)
+        mdf.write_many(name, records)
+    return sum(1 for timestamp in times if timestamp == timestamp)
+
+
+def _convert_job(job):
+    """Worker process entry of convert_files. Errors are returned as text, so one bad input does not end the batch."""
+    input_name, output_name, options = job
+    try:
+        return input_name, output_name, convert_file(input_name, output_name, **options), None
+    except Exception as error:
+        logger.debug("Converting %s failed", input_name, exc_info=True)
+        return input_name, output_name, None, '%s: %s' % (type(error).__name__, error)
+
+
+def output_name_for(input_name, output_dir=None, extension='.mdf'):
+    """Output file of an input: same name with extension, in output_dir or next to the input."""
+    base = os.path.splitext(os.path.basename(input_name))[0] + extension
+    return os.path.join(output_dir if output_dir is not None else os.path.dirname(input_name), base)
+
+
+def convert_files(jobs, processes=None):
+    """Converts (input name, output name, convert_file options) jobs, in parallel worker processes if processes is
+    not 1. Yields (input name, output name, rows, error) as the conversions finish. error is None on success, else
+    the error message of a failed conversion and rows is None. The other jobs continue after a failure."""
+    if processes == 1 or len(jobs) < 2:
+        for job in jobs:
+            yield _convert_job(job)
+        return
+    import multiprocessing
+    pool = multiprocessing.Pool(processes)
+    try:
+        for result in pool.imap_unordered(_convert_job, jobs):
+            yield result
+    finally:
+        pool.close()
+        pool.join()
+
+
+def main(argv=None):
+    """Command line entry point (mdfwriter): converts CSV, Parquet and .npy files to MDF. Returns 1 if a conversion
+    failed, else 0."""
+    parser = argparse.ArgumentParser(prog='mdfwriter', description="Converts CSV, Parquet and .npy files to MDF.")
+    parser.add_argument('inputs', nargs='+', help="CSV, Parquet or .npy files")
+    parser.add_argument('-o', '--output', help="output file, for a single input")
+    parser.add_argument('--output-dir', help="directory of the output files, default next to the inputs")
+    parser.add_argument('--format', choices=('mdf', 'mf4'), default='mdf', help="MDF 3.3 or MDF 4.1 output")
+    parser.add_argument('--group', action='append', metavar='NAME=COL,COL',
+                        help="channel group of the given columns, repeatable. Other columns go to one group.")
+    parser.add_argument('--time-column', help="time column in seconds, default a column named time/timestamp/t")
+    parser.add_argument('--period', type=float, default=1.0, help="seconds between rows without time column")
+    parser.add_argument('--units-row', action='store_true', default=None, help="the second CSV row holds units")
+    parser.add_argument('--delimiter', default=',', help="CSV delimiter")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="rows per batch")
+    parser.add_argument('--string-width', type=int, help="bytes of text channels")
+    parser.add_argument('--processes', type=int, help="parallel conversions, default one per CPU")
+    parser.add_argument('--author', default='')
+    parser.add_argument('--project', default='')
+    parser.add_argument('--dut', default='')
+    arguments = parser.parse_args(argv)
+    if arguments.output and len(arguments.inputs) > 1:
+        parser.error("--output needs a single input, use --output-dir")
+    if arguments.format == 'mf4':
+        from .mdf4 import MDF4
+        mdf_class, extension = MDF4, '.mf4'
+    else:
+        mdf_class, extension = MDF, '.mdf'
+    options = {'mdf_class': mdf_class, 'groups': parse_groups(arguments.group), 'time_column': arguments.time_column,
+               'period': arguments.period, 'chunk_size': arguments.chunk_size, 'string_width': arguments.string_width,
+               'author': arguments.author, 'project': arguments.project, 'dut': arguments.dut,
+               'delimiter': arguments.delimiter, 'units_row': arguments.units_row}
+    jobs = [(input_name, arguments.output or output_name_for(input_name, arguments.output_dir, extension), options)
+            for input_name in arguments.inputs]
+    failed = 0
+    for input_name, output_name, rows, error in convert_files(jobs, arguments.processes):
+        if error is None:
+            print("%s -> %s: %d rows" % (input_name, output_name, rows))
+        else:
+            failed += 1
+            sys.stderr.write("%s: failed, %s\n" % (input_name, error))
+    if failed:
+        sys.stderr.write("%d of %d conversions failed\n" % (failed, len(jobs)))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,202 @@
+"""Synthetic CAN load for sizing loggers without a vehicle. LoadGenerator builds periodic frames for every CANmsg of a
+DEJ, paces them in real time at the target frame rate or bus load and writes them to an MDF like a bus bridge would.
+run() reports the achieved frame rate, the latency from the scheduled time of a frame until its write returned, and
+the frames dropped because the writer fell too far behind.
+
+    messages = DEJ('vehicle.json').get_message_list()
+    mdf = MDF('load.mdf', author, project, dut)
+    for message in messages:
+        mdf.add_channel_group(message)
+    mdf.start_file()
+    report = LoadGenerator(mdf, messages, rate=20000).run(60)
+    mdf.close_file()
+
+Also a command line tool: python -m mdfwriter.loadgen vehicle.json load.mdf --rate 20000 --duration 60
+"""
+import argparse
+import heapq
+import json
+import logging
+import random
+import time
+from .mdf import MDF, DEJ, CAN_PAYLOAD_SIZE
+from .metrics import Histogram, clock
+
+logger = logging.getLogger(__name__)
+
+PAYLOAD_PATTERNS = ('random', 'counter', 'zeros')
+RANDOM_PAYLOADS = 16  # random payloads per message, cycled to keep the generator cheap
+FRAME_OVERHEAD_BITS = 47  # classic CAN data frame with 11 bit ID, without stuffing bits
+
+
+def frame_bits(length):
+    """Bits of a CAN frame with length payload bytes on the bus, without stuffing bits. CAN FD frames are counted as if
+    the data phase ran at the arbitration bitrate, which overestimates their load."""
+    return FRAME_OVERHEAD_BITS + 8 * length
+
+
+def bus_load(messages, periods, bitrate=500000):
+    """Fraction of the bus bandwidth used by the messages.
+    :param list messages: CANmsg objects
+    :param dict periods: Message name -> period in seconds
+    :param int bitrate: Bus bitrate in bit/s
+    """
+    bits = sum(frame_bits(message.length or CAN_PAYLOAD_SIZE) / periods[message.name] for message in messages)
+    return bits / float(bitrate)
+
+
+class LoadGenerator(object):
+    """Generates the periodic frames of CAN messages and writes them to an MDF.
+    :param MDF mdf: Started MDF or MDF4 that holds a group for every message
+    :param list messages: CANmsg objects, e.g. from DEJ.get_message_list()
+    :param float period: Period in seconds of messages without an entry in periods
+    :param dict periods: Message name -> period in seconds
+    :param float rate: Target frames per second of all messages. The periods are scaled to reach it, keeping their
+        ratios.
+    :param float load: Target bus load (0-1) at bitrate, instead of rate
+    :param int bitrate: Bus bitrate in bit/s for load
+    :param str payload: 'random', 'counter' (every byte counts up by one per frame) or 'zeros'
+    :param int seed: Seed of the random payloads and the start phases of the messages
+    """
+    def __init__(self, mdf, messages, period=0.01, periods=None, rate=None, load=None, bitrate=500000,
+                 payload='random', seed=0):
+        if payload not in PAYLOAD_PATTERNS:
+            raise ValueError("payload must be one of %s" % ', '.join(PAYLOAD_PATTERNS))
+        if not messages:
+            raise ValueError("no messages to generate")
+        self.mdf = mdf
+        self.messages = list(messages)
+        self.periods = dict((message.name, period) for message in self.messages)
+        self.periods.update(periods or {})
+        scale = 1.0
+        if rate is not None:
+            scale = self.frame_rate() / rate
+        elif load is not None:
+            scale = bus_load(self.messages, self.periods, bitrate) / load
+        for name in self.periods:
+            self.periods[name] *= scale
+        self.payload = payload
+        self.random = random.Random(seed)
+        self.payloads = dict((message.name, self._payloads(message)) for message in self.messages)
+
+    def frame_rate(self):
+        """Frames per second of all messages at the current periods."""
+        return sum(1.0 / self.periods[message.name] for message in self.messages)
+
+    def frames(self, duration):
+        """Yields the (timestamp, message name, payload) frames of duration seconds in timestamp order. Every message
+        starts at a random phase within its period."""
+        streams = self._streams()
+        while streams[0][0] < duration:
+            yield self._next_frame(streams)
+
+    def run(self, duration, batch_size=64, max_lag=0.5, realtime=True):
+        """Writes the frames of duration seconds and returns a report dictionary: frames, written, dropped, seconds,
+        targetRate, achievedRate and the latency histogram snapshot. Frames are generated as they come due, so memory
+        does not grow with the rate or the duration.
+        :param float duration: Seconds of traffic to generate
+        :param int batch_size: Maximum frames written at once, one write_many() per message
+        :param float max_lag: Frames that are due longer than this many seconds when the writer gets to them are
+            dropped, like a full receive queue would drop them
+        :param bool realtime: False writes all frames as fast as possible, without pacing and drops
+        """
+        streams = self._streams()
+        next_frame = self._next_frame
+        latency = Histogram()
+        write_many = self.mdf.write_many
+        frames = written = dropped = 0
+        start = clock()
+        while streams[0][0] < duration:
+            now = clock() - start
+            if realtime and streams[0][0] > now:
+                time.sleep(min(streams[0][0] - now, 0.01))
+                continue
+            batches = {}
+            taken = 0
+            batch_dropped = dropped
+            while taken < batch_size and streams[0][0] < duration and (not realtime or streams[0][0] <= now):
+                timestamp, name, payload = next_frame(streams)
+                taken += 1
+                if realtime and now - timestamp > max_lag:
+                    dropped += 1
+                    continue
+                records = batches.get(name)
+                if records is None:
+                    records = batches[name] = []
+                records.append((timestamp, payload))
+            frames += taken
+            if dropped > batch_dropped and self.mdf.metrics is not None:
+                self.mdf.metrics.add_dropped(dropped - batch_dropped)
+            for name, records in batches.items():
+                write_many(name, records)
+            done = clock() - start
+            for records in batches.values():
+                written += len(records)
+                for timestamp, _ in records:
+                    latency.add(max(done - timestamp, 0.0) if realtime else done - now)
+        seconds = clock() - start
+        return {'frames': frames,
+                'written': written,
+                'dropped': dropped,
+                'seconds': seconds,
+                'targetRate': self.frame_rate(),
+                'achievedRate': written / seconds if seconds else 0.0,
+                'latency': latency.snapshot()}
+
+    def _streams(self):
+        """Heap of (next timestamp, name, count, phase, period) per message, every message at a random phase."""
+        streams = []
+        for message in self.messages:
+            period = self.periods[message.name]
+            phase = self.random.uniform(0, period)
+            streams.append((phase, message.name, 0, phase, period))
+        heapq.heapify(streams)
+        return streams
+
+    def _next_frame(self, streams):
+        """Takes the next due frame from the stream heap and schedules the following frame of its message."""
+        timestamp, name, count, phase, period = streams[0]
+        payloads = self.payloads[name]
+        count += 1
+        heapq.heapreplace(streams, (phase + count * period, name, count, phase, period))
+        return timestamp, name, payloads[(count - 1) % len(payloads)]
+
+    def _payloads(self, message):
+        """Payloads of a message, cycled by frames()."""
+        length = message.length or CAN_PAYLOAD_SIZE
+        if self.payload == 'zeros':
+            return [b'\0' * length]
+        if self.payload == 'counter':
+            return [bytes(bytearray((count + byte) & 0xFF for byte in range(length))) for count in range(256)]
+        return [bytes(bytearray(self.random.getrandbits(8) for _ in range(length))) for _ in range(RANDOM_PAYLOADS)]
+
+
+def main(argv=None):
+    """Command line entry point: writes synthetic traffic of a DEJ to an MDF file and prints the report as JSON."""
+    parser = argparse.ArgumentParser(description="Writes synthetic CAN traffic of a DEJ to an MDF file.")
+    parser.add_argument('dej', help="DEJ file with the CAN messages")
+    parser.add_argument('output', help="MDF file to write")
+    parser.add_argument('--duration', type=float, default=10.0, help="seconds of traffic")
+    parser.add_argument('--period', type=float, default=0.01, help="period of every message in seconds")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument('--rate', type=float, help="target frames per second")
+    target.add_argument('--load', type=float, help="target bus load, 0-1")
+    parser.add_argument('--bitrate', type=int, default=500000, help="bus bitrate for --load")
+    parser.add_argument('--payload', choices=PAYLOAD_PATTERNS, default='random')
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--seed', type=int, default=0)
+    arguments = parser.parse_args(argv)
+    messages = DEJ(arguments.dej).get_message_list()
+    mdf = MDF(arguments.output, 'loadgen', 'loadgen', 'loadgen')
+    for message in messages:
+        mdf.add_channel_group(message)
+    mdf.start_file()
+    generator = LoadGenerator(mdf, messages, arguments.period, rate=arguments.rate, load=arguments.load,
+                              bitrate=arguments.bitrate, payload=arguments.payload, seed=arguments.seed)
+    report = generator.run(arguments.duration, arguments.batch_size)
+    mdf.close_file()
+    print(json.dumps(report, indent=2, sort_keys=True))
+
+
+if __name__ == '__main__':
+    main()
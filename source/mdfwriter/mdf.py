@@ -1,11 +1,15 @@
 """Import this file to create MDF files. See documentation for class definitions and example use.
 Author: Samuel Daleo, III"""
 
+import os
 import struct
-import json
 import threading
 import logging
-from mdfblocks import *
+from .mdfblocks import *
+from .utils import TEXT_TYPE, encode_field, pack_field
+from .spill import SpillBuffer
+from .metrics import MDFMetrics, clock
+from .profiling import PhaseTimer, NULL_SPAN
 
 # This dictionary contains the format codes for the struct package to correctly format the binary output of input python
 # datatypes.
@@ -13,6 +17,7 @@ STRUCT_TYPE = {'CHAR': struct.Struct('<c'),
                'UINT8': struct.Struct('<B'),
                'UINT16': struct.Struct('<H'),
                'UINT32': struct.Struct('<I'),
+               'INT16': struct.Struct('<h'),
                'FLOAT': struct.Struct('<f'),
                'DOUBLE': struct.Struct('<d'),
                'BOOL': struct.Struct('<H'),
@@ -20,12 +25,18 @@ STRUCT_TYPE = {'CHAR': struct.Struct('<c'),
                'LINK': struct.Struct('<l'),
                'LONG': struct.Struct('<Q')}
 
+INTEGER_TYPES = (int, type(2 ** 64))  # int and long on Python 2, int on Python 3
+CAN_PAYLOAD_SIZE = 8  # bytes, classic CAN. CAN FD frames carry up to 64 bytes.
+CAN_FD_PAYLOAD_SIZES = (0, 1, 2, 3, 4, 5, 6, 7, 8, 12, 16, 20, 24, 32, 48, 64)  # of the DLC codes 0 to 15
+
 logger = logging.getLogger(__name__)
 
 
 class ChannelGroup(object):
     def __init__(self, name, description=None, channel_list=None):
         self.name = str(name)
+        if channel_list is None:
+            channel_list = []
         self.channel_list = self.signal_list = channel_list
         self.cgBlock = None
         if description is not None:
@@ -49,13 +60,16 @@ class CANmsg(ChannelGroup):
     def __init__(self, message_name, signal_list=None):
         self.name = message_name
         self.sender = ""
+        if signal_list is None:
+            signal_list = []
         self.signalList = signal_list
         self.messageID = 0
         self.length = 0
         self.index = 0
         self.cgBlock = None
         """Class for CAN messages to be added to MDF. Extends :class: ChannelGroup, and adds necessary properties
-         for proper CAN data parsing in CANape
+         for proper CAN data parsing in CANape. Set length to the payload size in bytes before the CANmsg is added to
+         the MDF: 8 for classic CAN (also used when length is 0), up to 64 for CAN FD.
             :param str messagename: Name of CAN message
             :param [CANSignal] signal_list: List of CANSignal objects associated with CANmsg.
         """
@@ -79,6 +93,18 @@ class Channel(object):
         """
 
 
+class StringChannel(Channel):
+    def __init__(self, name, width=32, description=None):
+        Channel.__init__(self, name, "", description)
+        self.width = width
+        """Fixed size text Channel. Values may be str, bytes, bytearray or memoryview; they are truncated to width
+        bytes and NULL padded.
+        :param str name: Name of Channel
+        :param int width: Size of the string field in bytes
+        :param str description: Text description of Channel. Max 128 characters.
+        """
+
+
 class CANSignal(Channel):
     def __init__(self, name, description=None):
         self.name = name
@@ -103,6 +129,7 @@ class CANSignal(Channel):
 
 class DEJ(object):
     def __init__(self, dej_path):
+        import json  # only needed for DEJ files, keeps import mdfwriter fast
         with open(dej_path, 'r') as f:
             json_object = json.load(f)
         self.messageList = []
@@ -146,61 +173,167 @@ class DEJ(object):
 
 
 class MDF(object):
-    HEADER_SIZE = 228  # bytes
+    HEADER_SIZE = 272  # bytes, ID block + HD block
+    # A new file is started once this size is passed. 1GB limit chosen due to third-party package having difficult
+    # time parsing files larger than that. None disables the rollover.
+    FILE_SIZE_LIMIT = 1000000000  # bytes, 1000000000 == 1 GB
+    LATE_GROUPS = True  # channel groups can be added after start_file
+    CHECKPOINTS = True  # record counts can be checkpointed into the open file, see enable_checkpoints
+    CG_COUNTS = struct.Struct('<HI')  # data_size and numberOfRecords, adjacent in the CG block
+    TEMPLATES = True  # files can be created from an MDFTemplate, see from_template
     
-    def __init__(self, file_name, author, project, dut, file_description=None):
+    def __init__(self, file_name, author, project, dut, file_description=None, sorted_output=False,
+                 spill_budget=None, spill_dir=None, buffer_size=-1, header_reserve=0):
+        if file_description is None:
+            file_description = ""
         self.IDBlock = IDBlock()
         self.HDBlock = HDBlock(author, project, dut)
-        self.TXBlock = TXBlock(formatstring(file_description, len(file_description)+1))
+        # Monotonic clock reading at the HD start time, the reference of write_ticks
+        self.startTick = monotonic_ns()
+        self.TXBlock = TXBlock(encode_field(file_description, len(file_description) + 1))
         self.HDBlock.firstDGPointer = self.HEADER_SIZE + self.TXBlock.blocksize
-        self.DGBlock = DGBlock()
-        self.DGBlock.nextCGPointer += self.TXBlock.blocksize
+        self.sortedOutput = sorted_output
+        self.spillBuffer = SpillBuffer(spill_budget, spill_dir)
+        if sorted_output:
+            # One DG per channel group, created in add_channel_group
+            self.DGBlock = None
+            self.dgBlockList = []
+        else:
+            self.DGBlock = DGBlock()
+            self.DGBlock.nextCGPointer += self.TXBlock.blocksize
+            self.dgBlockList = [self.DGBlock]
+        self.dgPointers = {}
         self.cgBlockList = []
         self.cnBlockList = []
-        self.cc_blockList = []
+        self.cc_blockList = []  # unique CC blocks, see _add_conversion
+        self.ccBlockDictionary = {}  # CCBlock.key() -> CCBlock
         self.ceBlockList = []
+        self.txBlockList = []  # TX blocks of long channel names and descriptions, see _add_text
+        self.txBlockDictionary = {}  # text -> TXBlock
         self.lock = threading.Lock()
         self.cgPointers = {}
         self.cnPointers = {}
         self.cnTypeList = []
         self.datapointer = 0
         self.timepointer = 0
+        self.timestampPointer = 0
         self.channelGroupDictionary = {}
         self.fileIndex = 1
+        self.bufferSize = buffer_size
+        self.headerReserve = header_reserve
+        self.reservePointer = 0
+        self.reserveEnd = 0
+        self.lateGroups = []  # groups added after start_file that did not fit into the reserve
+        self.dgLinkPointer = 0
+        self.dgCountPointer = 0
         self.file = self.open_file(file_name)
         self.filename = file_name
         self.dataRecordCount = 0
+        self.checkpointing = False
+        self.checkpointRecords = None
+        self.checkpointInterval = None
+        self.checkpointFsync = False
+        self.checkpointRecordCount = 0  # dataRecordCount at the last checkpoint
+        self.nextCheckpoint = None
+        self.metrics = None
+        self.profiler = None
         # self.blankChannelGroup = ChannelGroup('Blank Channel Group')
         # self.addChannelGroup(self.blankChannelGroup)   #See docstring
         """Main class of package. MDF object that holds all necessary information to write file correctly.
             Note Line 170: The initialization adds a blank ChannelGroup to the MDF file to avoid a bug with CANape. 
             If the file contains only one ChannelGroup, it will be considered "sorted" and will not parse correctly.
+            If sorted_output is True, records are not interleaved in the file as they arrive. Each ChannelGroup gets
+            its own DG block without record IDs and its records are buffered until close_file, where they are
+            written contiguously behind the header. Readers can then map each group's data without sorting the file.
+            The buffers share a memory budget; once it is used up, records are spilled to temporary files.
         :param str filename: Name of file to be created (.mdf automatically appended)
         :param str author: Creator of file
         :param str project: Name of Project of test
         :param str dut: Device under test
+        :param str file_description: Text stored in the file comment TX block
+        :param bool sorted_output: Write one DG block per ChannelGroup (sorted file) instead of one unsorted DG block
+        :param int spill_budget: Sorted output only. Bytes of records held in memory across all ChannelGroups before
+            the largest group buffers are spilled to temporary files. None keeps everything in memory, 0 spills every
+            record.
+        :param str spill_dir: Directory for the temporary spill files, defaults to the system temp directory
+        :param int buffer_size: Write buffer of the file in bytes, -1 uses the system default. Large buffers help
+            bulk writers such as reader.merge_files.
+        :param int header_reserve: Bytes left free behind the header for the blocks of channel groups added after
+            start_file. A CAN message group takes about 26 + 356 bytes per signal.
         """
 
+    @classmethod
+    def from_template(cls, template, file_name, author='', project='', dut='', file_description=None, **kwargs):
+        """Creates a file with the channel groups of an MDFTemplate and writes its header. Only the HD date and time,
+        author, project, DUT and the file comment are set per file, the blocks and record structs of the template are
+        reused, so the returned MDF is ready for write() right away. Further groups can be added as after start_file.
+        :param MDFTemplate template: Layout shared by the files
+        :param str file_name: Name of file to be created
+        :param str author: Creator of file
+        :param str project: Name of Project of test
+        :param str dut: Device under test
+        :param str file_description: Text of the file comment, up to template.descriptionSize - 1 characters.
+            Defaults to the description of the template.
+        :param kwargs: Further arguments of the constructor, e.g. buffer_size. sorted_output and header_reserve come
+            from the template.
+        """
+        if not cls.TEMPLATES:
+            raise ValueError("%s does not support templates" % cls.__name__)
+        mdf = cls(file_name, author, project, dut, sorted_output=template.sortedOutput,
+                  header_reserve=template.headerReserve, **kwargs)
+        try:
+            template.apply(mdf, file_description)
+        except Exception:
+            mdf.file.close()
+            raise
+        return mdf
+
     def add_channel_group(self, channelgroup):
         """Method to add ChannelGroup object to MDF.
-        All ChannelGroup objects (or CANmsg objects) must be added to MDF before file header is written.
+        ChannelGroup objects (or CANmsg objects) are usually added before the file header is written. A group added
+        after start_file, e.g. for a CAN ID first seen at runtime, is linked into the open file: its blocks are
+        written into the header_reserve space and the previous DG/CG link is patched, which only holds the write lock
+        for a moment. Once the reserve is used up, the blocks are written behind the data by close_file.
         :param ChannelGroup channelgroup: New ChannelGroup/CANmsg object to be added to MDF."""
+        with self._span('add_channel_group'):
+            if not self.datapointer:
+                self._add_channel_group(channelgroup)
+                return
+            if not self.LATE_GROUPS:
+                raise ValueError("%s does not support adding channel groups after start_file"
+                                 % type(self).__name__)
+            with self.lock:
+                self._add_channel_group(channelgroup)
+                self._write_late_group(self.cgBlockList[-1])
+
+    def _add_channel_group(self, channelgroup):
+        """Builds the DG (sorted mode), CG, CN, CC and CE blocks of a new ChannelGroup."""
+        if isinstance(channelgroup, CANmsg) and channelgroup.length not in CAN_FD_PAYLOAD_SIZES:
+            raise ValueError("CAN message %s has a length of %s bytes, which is not a CAN FD payload size %s"
+                             % (channelgroup.name, channelgroup.length, CAN_FD_PAYLOAD_SIZES))
         string_size_limit = 32
-        channel_group = CGBlock(self.DGBlock, len(self.cgBlockList)+1)
+        if self.sortedOutput:
+            dg_block = DGBlock(number_of_record_ids=0)
+            self.dgBlockList.append(dg_block)
+        else:
+            dg_block = self.DGBlock
+        channel_group = CGBlock(dg_block, len(self.cgBlockList)+1)
         channel_group.name = channelgroup.name
         self.cgBlockList.append(channel_group)
         self.channelGroupDictionary[channel_group.name] = channel_group
         # Creates a mandatory time channel for the new channel group to be added to MDF
         time_channel = CNBlock(channel_group, "TIME")
-        time_channel.signalname = formatstring("Zeitkanal", string_size_limit)
+        time_channel.signalName = encode_field("Zeitkanal", string_size_limit)
         channel_group.cnBlockList.append(time_channel)
         self.cnBlockList.append(time_channel)
         index = len(self.cgBlockList) - 1
         self.cgBlockList[index].numberOfChannels += 1
-        cc_time = CCBlock(time_channel, 's')
-        self.cc_blockList.append(cc_time)
+        self._add_conversion(time_channel, CCBlock(time_channel, 's'))
         if isinstance(channelgroup, CANmsg):
             channel_group.isCAN = True
+            channel_group.payloadSize = channelgroup.length or CAN_PAYLOAD_SIZE
+            channel_group.messageID = channelgroup.messageID
+            ce = None  # one CE block per message, shared by its signals like CC blocks
             for channel in channelgroup.signalList:
                 signal_channel = CNBlock(channel_group, "CAN", str(channel.name), str(channel.description))
                 signal_channel.valueRangeBool = 1 if channel.validRange else 0
@@ -217,56 +350,209 @@ class MDF(object):
                 cc_block.maxValue = channel.max
                 if len(channel.value_dict) > 1:
                     cc_block.conversionID = 11  # bytes
-                    for x in range(len(channel.value_dict)):
-                        cc_block.paramList.append(formatstring(channel.value_dict.values()[x], string_size_limit))
-                        cc_block.paramList.append(float(channel.value_dict.keys()[x]))
-                        cc_block.blockSize += 40  # bytes
-                    cc_block.pairs = len(cc_block.paramList) / 2
+                    for value, text in sorted((float(key), text) for key, text in channel.value_dict.items()):
+                        cc_block.paramList.append(encode_field(text, string_size_limit))
+                        cc_block.paramList.append(value)
+                    cc_block.pairs = len(cc_block.paramList) // 2
+                    cc_block.blockSize += 40 * cc_block.pairs  # bytes
                 else:
                     cc_block.conversionID = 0
                     cc_block.paramList = [float(channel.offset), float(channel.scale)]
                     cc_block.blockSize = 62  # bytes
                     cc_block.pairs = 2
-                self.cc_blockList.append(cc_block)
-                ce = CEBlock(channelgroup.messageID, channelgroup.index, "SenderName", "SenderDescription")
-                self.ceBlockList.append(ce)
+                self._add_conversion(signal_channel, cc_block)
+                if ce is None:
+                    ce = CEBlock(channelgroup.messageID, channelgroup.index, "SenderName", "SenderDescription")
+                    self.ceBlockList.append(ce)
+                signal_channel.ceBlock = ce
         elif isinstance(channelgroup, ChannelGroup):
             for channel in channelgroup.channel_list:
-                    data_channel = CNBlock(channel_group, "DATA", str(channel.name), str(channel.description))
+                    if isinstance(channel, StringChannel):
+                        data_channel = CNBlock(channel_group, "STRING", str(channel.name), str(channel.description))
+                        data_channel.numberOfBits = channel.width * 8
+                    else:
+                        data_channel = CNBlock(channel_group, "DATA", str(channel.name), str(channel.description))
                     channel_group.cnBlockList.append(data_channel)
                     self.cnBlockList.append(data_channel)
                     self.cgBlockList[index].numberOfChannels += 1
-                    cc_block = CCBlock(data_channel, channel.units)
-                    self.cc_blockList.append(cc_block)
+                    self._add_conversion(data_channel, CCBlock(data_channel, channel.units))
+        for cn_block in channel_group.cnBlockList:
+            if cn_block.longName is not None:
+                cn_block.longNameBlock = self._add_text(cn_block.longName)
+            if cn_block.longDescription is not None:
+                cn_block.longDescriptionBlock = self._add_text(cn_block.longDescription)
+        # The group name is stored as CG comment, so readers can tell groups apart by name
+        channel_group.commentBlock = self._add_text(channel_group.name)
+        self._compile_record(channel_group)
+        channel_group.data_size = self._record_size(channel_group)
+
+    def _write_late_group(self, cg_block):
+        """Writes the blocks of a group added after start_file into the reserved space, or queues them for
+        close_file if they do not fit. Called with the write lock held."""
+        if self.lateGroups or self._group_blocks_size(cg_block) > self.reserveEnd - self.reservePointer:
+            self.lateGroups.append(cg_block)  # later groups queue up as well, so the links stay in order
+            return
+        self.file.seek(self.reservePointer)
+        self._write_group_blocks(cg_block)
+        self.reservePointer = self.file.tell()
+        self.file.seek(0, 2)
+
+    def _new_group_blocks(self, cg_block):
+        """CC, CE and TX blocks of cg_block that are not in the file yet, each shared block once. CC and TX blocks
+        shared with groups that are already written have an address."""
+        cc_blocks, ce_blocks, tx_blocks = [], [], []
+        if cg_block.commentBlock is not None and not cg_block.commentBlock.address:
+            tx_blocks.append(cg_block.commentBlock)
+        for cn_block in cg_block.cnBlockList:
+            if not cn_block.ccBlock.address and cn_block.ccBlock not in cc_blocks:
+                cc_blocks.append(cn_block.ccBlock)
+            if cn_block.ceBlock is not None and not cn_block.ceBlock.address and cn_block.ceBlock not in ce_blocks:
+                ce_blocks.append(cn_block.ceBlock)
+            for tx_block in (cn_block.longNameBlock, cn_block.longDescriptionBlock):
+                if tx_block is not None and not tx_block.address and tx_block not in tx_blocks:
+                    tx_blocks.append(tx_block)
+        return cc_blocks, ce_blocks, tx_blocks
+
+    def _group_blocks_size(self, cg_block):
+        """Bytes _write_group_blocks would write for cg_block."""
+        cc_blocks, ce_blocks, tx_blocks = self._new_group_blocks(cg_block)
+        size = DGBlock.BLOCKSIZE if self.sortedOutput else 0
+        size += CGBlock.BLOCKSIZE + CNBlock.BLOCKSIZE * len(cg_block.cnBlockList) + CEBlock.BLOCKSIZE * len(ce_blocks)
+        return size + sum(cc_block.blockSize for cc_block in cc_blocks) + sum(tx.blocksize for tx in tx_blocks)
+
+    def _write_group_blocks(self, cg_block):
+        """Writes the DG (sorted mode), CG, CN and the new CC, CE and TX blocks of a group added after start_file
+        at the current file position, then links the group into the file. The blocks are complete before the link is
+        patched, so a reader never follows a link to a partly written group."""
+        cc_blocks, ce_blocks, tx_blocks = self._new_group_blocks(cg_block)
+        number = cg_block.recordID
+        address = group_address = self.file.tell()
+        dg_block = None
+        if self.sortedOutput:
+            dg_block = self.dgBlockList[number - 1]
+            dg_block.nextDGPointer = 0
+            dg_block.nextCGPointer = address + DGBlock.BLOCKSIZE
+            address += DGBlock.BLOCKSIZE
+        cg_block.nextCGPointer = 0
+        cg_block.CNPointer = address + CGBlock.BLOCKSIZE
+        address = cg_block.CNPointer + CNBlock.BLOCKSIZE * len(cg_block.cnBlockList)
+        for cc_block in cc_blocks:
+            cc_block.address = address
+            address += cc_block.blockSize
+        for ce_block in ce_blocks:
+            ce_block.address = address
+            address += CEBlock.BLOCKSIZE
+        for tx_block in tx_blocks:
+            tx_block.address = address
+            address += tx_block.blocksize
+        cg_block.TXPointer = cg_block.commentBlock.address if cg_block.commentBlock is not None else 0
+        for n, cn_block in enumerate(cg_block.cnBlockList):
+            last = n + 1 == len(cg_block.cnBlockList)
+            cn_block.nextCNPointer = 0 if last else cg_block.CNPointer + CNBlock.BLOCKSIZE * (n + 1)
+            cn_block.CCPointer = cn_block.ccBlock.address
+            cn_block.CEPointer = cn_block.ceBlock.address if cn_block.ceBlock is not None else 0
+            if cn_block.longNameBlock is not None:
+                cn_block.ASAMPointer = cn_block.longNameBlock.address
+            if cn_block.longDescriptionBlock is not None:
+                cn_block.TXPointer = cn_block.longDescriptionBlock.address
+
+        if dg_block is not None:
+            self._write_dg_block(dg_block, 'dg' + str(number))
+        self._write_cg_block(cg_block, 'cg' + str(number))
+        cn_index = self.cnBlockList.index(cg_block.cnBlockList[0]) + 1
+        for n, cn_block in enumerate(cg_block.cnBlockList):
+            self._write_cn_block(cn_block, 'cn' + str(cn_index + n))
+        for cc_block in cc_blocks:
+            self._write_cc_block(cc_block)
+        for ce_block in ce_blocks:
+            self._write_ce_block(ce_block)
+        for tx_block in tx_blocks:
+            self._write_tx_block(tx_block)
+        self.cgPointers['cgCount'] = number
+        self.cnPointers['numberOfCNs'] = cn_index + len(cg_block.cnBlockList) - 1
+
+        # Link the group: sorted groups behind the previous DG block, unsorted groups behind the previous CG block
+        end = self.file.tell()
+        if dg_block is not None:
+            link = self.dgPointers['dg' + str(number - 1)]['dgPointerPointer'] if number > 1 else self.dgLinkPointer
+            self.file.seek(link)
+            self._write_to_file(STRUCT_TYPE['LINK'].pack(group_address))
+            self.file.seek(self.dgCountPointer)
+        else:
+            if number > 1:
+                link = self.cgPointers['cg' + str(number - 1)]['cgPointerPointer']
+            else:
+                link = self.dgPointers['dg1']['dgPointerPointer'] + 4  # nextCGPointer of the DG block
+            self.file.seek(link)
+            self._write_to_file(STRUCT_TYPE['LINK'].pack(group_address))
+            self.file.seek(self.dgPointers['dg1']['cgCountPointer'])
+        self._write_to_file(STRUCT_TYPE['UINT16'].pack(number))
+        self.file.seek(end)
+
+    def _add_conversion(self, cn_block, cc_block):
+        """Links cn_block to cc_block, or to an earlier CC block with the same content. Value tables and unit
+        conversions repeated across messages are written once."""
+        key = cc_block.key()
+        shared = self.ccBlockDictionary.get(key)
+        if shared is None:
+            shared = self.ccBlockDictionary[key] = cc_block
+            self.cc_blockList.append(cc_block)
+        cn_block.ccBlock = shared
+
+    def _add_text(self, text):
+        """Returns the TX block of text. Equal texts share one block, which is written after the CE blocks."""
+        tx_block = self.txBlockDictionary.get(text)
+        if tx_block is None:
+            tx_block = self.txBlockDictionary[text] = TXBlock(encode_field(text, len(text) + 1))
+            self.txBlockList.append(tx_block)
+        return tx_block
 
     def get_channelgroup_list(self):
         """Use this method to get the list of ChannelGroup names. Names are used to reference low level structures
             in the file when using the mdf.write() method.
         """
-        return self.channelGroupDictionary.keys()
+        return list(self.channelGroupDictionary.keys())
 
     def open_file(self, file_name):
         """Automatically called upon instantation of MDF object.
         :param str file_name: Name of file to be created.
         """
         if self.fileIndex == 1:
-            self.file = open(str(file_name), 'wb+')
+            self.file = open(str(file_name), 'wb+', self.bufferSize)
             logger.debug(str(file_name) + ".mdf created @" + str(time.strftime("%X")))
         elif self.fileIndex > 1:
-            self.file = open(str(file_name + str(self.fileIndex) + ".mdf"), 'wb+')
+            self.file = open(str(file_name + str(self.fileIndex) + ".mdf"), 'wb+', self.bufferSize)
             logger.debug(str(file_name) + str(self.fileIndex) + ".mdf created @" 
                          + str(time.strftime("%X")))
         return self.file
 
     def start_file(self):
         """Method to write header and respective pointers to tie everything together."""
-        print("Writing header...")
-        self._write_header()
-        self._write_pointers()
+        logger.info("Writing header...")
+        with self._span('_write_header'):
+            self._write_header()
+        with self._span('_write_pointers'):
+            self._write_pointers()
 
     def close_file(self):
         """Method to close file once data is finished being written. Must be called, otherwise file will corrupt."""
-        print("Closing MDF...")
+        logger.info("Closing MDF...")
+        with self._span('close_file'):
+            self._finish_file()
+        self._report_metrics()
+        if self.profiler is not None:
+            self.profiler.dump()
+        logger.info("MDF Closed Successfully!")
+
+    def _finish_file(self):
+        """Called by close_file. Writes buffered data, patches the record counts and closes the file."""
+        for cg_block in self.lateGroups:
+            # Groups added after start_file that did not fit into the reserve go behind the data
+            self.file.seek(0, 2)
+            self._write_group_blocks(cg_block)
+        self.lateGroups = []
+        if self.sortedOutput:
+            self._write_sorted_data()
         for k in range(len(self.cgBlockList)):
             location = self.cgPointers['cg' + str(k + 1)]['numberOfRecordsPointer']
             count = self.cgBlockList[k].numberOfRecords  # List of records for each CG
@@ -278,72 +564,326 @@ class MDF(object):
             self.file.seek(location)
             self._write_to_file(STRUCT_TYPE['UINT16'].pack(self.cgBlockList[l].data_size))
         self.file.close()
-        print("MDF Closed Successfully!")
+
+    def enable_metrics(self, metrics=None):
+        """Starts collecting runtime metrics (records and bytes per ChannelGroup, lock wait and hold times, write
+        latencies, rollovers, queue depth, dropped records). Returns the MDFMetrics object, use its snapshot() method
+        or its callback to export them.
+        :param MDFMetrics metrics: Metrics object to fill, e.g. with a callback. A new one is created if None.
+        """
+        if metrics is None:
+            metrics = MDFMetrics()
+        metrics.queueDepth = self._queue_depth
+        self.metrics = metrics
+        return metrics
+
+    def disable_metrics(self):
+        """Stops collecting runtime metrics."""
+        self.metrics = None
+
+    def metrics_snapshot(self):
+        """Returns the current metrics as dictionary, or None if metrics are not enabled."""
+        if self.metrics is None:
+            return None
+        return self.metrics.snapshot()
+
+    def enable_profiling(self, profiler=None):
+        """Attaches a profiler that receives a span around every writer phase: add_channel_group, import_dej and its
+        JSON parsing (import_dej.parse), _write_header, _write_pointers, write, write_many, rollover and close_file.
+        Enable it before adding channel groups to include them. Returns the profiler.
+        :param Profiler profiler: Profiler hook, e.g. profiling.CProfileHook. A PhaseTimer that dumps a per-phase
+            breakdown at close is created if None.
+        """
+        if profiler is None:
+            profiler = PhaseTimer()
+        self.profiler = profiler
+        return profiler
+
+    def disable_profiling(self):
+        """Detaches the profiler."""
+        self.profiler = None
+
+    def set_recording_policy(self, channelgroup_name, policy):
+        """Thins out the records of a ChannelGroup before they are packed, e.g. policies.EveryNth(10),
+        policies.MinInterval(0.1) or policies.Deadband(0.5). Can be changed while logging.
+        :param str channelgroup_name: Name of the ChannelGroup
+        :param RecordingPolicy policy: Policy of the group, None writes every record
+        """
+        with self.lock:
+            self.channelGroupDictionary[channelgroup_name].policy = policy
+
+    def enable_checkpoints(self, records=None, interval=None, fsync=False):
+        """Periodically writes the record count and record size of every ChannelGroup into the open file, so a
+        file that is never closed, e.g. after a power loss, still lists the records written up to the last
+        checkpoint. A checkpoint flushes the write buffer and patches every CG block with one pwrite, which leaves
+        the file position of the writers alone. Checkpoints are taken by write() and write_many() under the write
+        lock, so the interval is checked on every write call. Use recovery.recover_counts for files that were not
+        checkpointed. Unsorted output only: sorted records stay buffered until close_file.
+        :param int records: Take a checkpoint once this many records were written since the last one
+        :param float interval: Take a checkpoint once this many seconds passed since the last one
+        :param bool fsync: Also fsync the file after each checkpoint, so the checkpoint survives an OS crash
+        """
+        if not self.CHECKPOINTS or self.sortedOutput:
+            raise ValueError("Checkpoints need unsorted output of MDF or ShardWriter")
+        if records is None and interval is None:
+            raise ValueError("Set records or interval")
+        with self.lock:
+            self.checkpointRecords = records
+            self.checkpointInterval = interval
+            self.checkpointFsync = fsync
+            self.checkpointRecordCount = self.dataRecordCount
+            self.nextCheckpoint = None if interval is None else clock() + interval
+            self.checkpointing = True
+
+    def disable_checkpoints(self):
+        """Stops taking checkpoints. close_file still writes the final counts."""
+        with self.lock:
+            self.checkpointing = False
+
+    def checkpoint(self):
+        """Takes a checkpoint of the record counts right away, see enable_checkpoints."""
+        with self.lock:
+            self._checkpoint()
+
+    def _check_checkpoint(self):
+        """Takes a checkpoint if enough records or time passed. Called with the write lock held."""
+        if self.checkpointRecords is not None and \
+                self.dataRecordCount - self.checkpointRecordCount >= self.checkpointRecords:
+            self._checkpoint()
+        elif self.nextCheckpoint is not None and clock() >= self.nextCheckpoint:
+            self._checkpoint()
+
+    def _checkpoint(self):
+        """Flushes the records written so far and patches the counts returned by _checkpoint_patches. Called with
+        the write lock held."""
+        if self.datapointer and not self.file.closed:
+            self.file.flush()
+            fd = self.file.fileno()
+            for location, data in self._checkpoint_patches():
+                if hasattr(os, 'pwrite'):
+                    os.pwrite(fd, data, location)
+                else:
+                    # No pwrite on Python 2. Unsorted records are only appended, so the position is restored by
+                    # seeking to the end.
+                    self.file.seek(location)
+                    self.file.write(data)
+                    self.file.seek(0, 2)
+                    self.file.flush()
+            if self.checkpointFsync:
+                os.fsync(fd)
+        self.checkpointRecordCount = self.dataRecordCount
+        if self.checkpointInterval is not None:
+            self.nextCheckpoint = clock() + self.checkpointInterval
+
+    def _checkpoint_patches(self):
+        """(file offset, bytes) of the data size and record count of every CG block in the file."""
+        patches = []
+        for index, cg_block in enumerate(self.cgBlockList):
+            pointers = self.cgPointers.get('cg' + str(index + 1))
+            if pointers is not None:  # groups added after start_file may not be written yet
+                patches.append((pointers['dataSizePointer'],
+                                self.CG_COUNTS.pack(cg_block.data_size, cg_block.numberOfRecords)))
+        return patches
 
     def import_dej(self, dej_path):
         """Method to import a DEJ into the MDF.
         :param str dej_path: System path to .dej file"""
-        dej = DEJ(dej_path)
-        messages = dej.get_message_list()
-        for message in messages:
-            self.add_channel_group(message)
+        with self._span('import_dej'):
+            with self._span('import_dej.parse'):
+                dej = DEJ(dej_path)
+            messages = dej.get_message_list()
+            for message in messages:
+                self.add_channel_group(message)
 
     def write(self, channelgroup_name, timestamp_offset, value):
         """Method to write data record to file. Only to be called once file is open and header is written.
         :param str channelgroup_name: Name of ChannelGroup object in which the data belongs to.
         :param int timestamp_offset: Decimal offset from timestamp in header.
         :param list value: Either raw CAN message data from CAN bus, or a List [] 
-        of data for each signal in ChannelGroup"""
-        string_size_limit = 32
-        file_size_limit = 1000000000  # bytes, 1000000000 == 1 GB
-        self.lock.acquire()
+        of data for each signal in ChannelGroup. CAN payloads are bytes, bytearray or memoryview of up to
+        CANmsg.length bytes (shorter payloads are NULL padded), or an int for classic 8 byte CAN."""
+        if self.profiler is None:
+            self._write_records(channelgroup_name, ((timestamp_offset, value),))
+        else:
+            with self.profiler.span('write'):
+                self._write_records(channelgroup_name, ((timestamp_offset, value),))
+
+    def write_many(self, channelgroup_name, records):
+        """Writes a batch of data records of one ChannelGroup while holding the write lock once.
+        :param str channelgroup_name: Name of ChannelGroup object in which the data belongs to.
+        :param iterable records: (timestamp_offset, value) pairs, see write()"""
+        if self.profiler is None:
+            self._write_records(channelgroup_name, records)
+        else:
+            with self.profiler.span('write_many'):
+                self._write_records(channelgroup_name, records)
+
+    def _write_records(self, channelgroup_name, records, start_tick=None):
+        """Packs and writes (timestamp_offset, value) records of one ChannelGroup under the write lock.
+        :param int start_tick: If given, the records are (tick, value) pairs of monotonic_ns() readings that are
+            converted to offsets from start_tick while they are packed."""
+        metrics = self.metrics
+        if metrics is None:
+            self.lock.acquire()
+        else:
+            wait_start = clock()
+            self.lock.acquire()
+            hold_start = clock()
+            metrics.lockWait.add(hold_start - wait_start)
         try:
             cg = self.channelGroupDictionary[channelgroup_name]
-            index = cg.recordID - 1
-            packet = STRUCT_TYPE['UINT8'].pack(cg.recordID)
-            packet += STRUCT_TYPE['DOUBLE'].pack(timestamp_offset)
-            packetsize = 8   # Starts with 8 bytes for timestamp.
-            if cg.isCAN:
-                packet += ('<Q', value)
-                packetsize += 8    # 8 bytes
+            if cg.policy is not None:
+                if start_tick is not None:  # policies see time offsets
+                    records = [((tick - start_tick) / 1e9, value) for tick, value in records]
+                    start_tick = None
+                batch = records if isinstance(records, (list, tuple)) else list(records)
+                records = cg.policy.keep(batch)
+                if metrics is not None:
+                    metrics.add_filtered(len(batch) - len(records))
+            if start_tick is None:
+                for timestamp_offset, value in records:
+                    packet, packetsize = self._pack_record(cg, timestamp_offset, value)
+                    self._store_record(cg, packet, packetsize)
             else:
-                for datum in value:
-                    if type(datum) == str:
-                        datum = formatstring(datum, string_size_limit)
-                        for letter in datum:
-                            packet += STRUCT_TYPE['CHAR'].pack(letter)
-                        packetsize += string_size_limit
-                    else:
-                        packet += STRUCT_TYPE['FLOAT'].pack(float(datum))
-                        packetsize += 4
-            # Checks filesize limit of 1GB. If file is over limit, starts new file.
-            # 1GB limit chosen due to third-party package having difficult time parsing files larger than that
-            if self.file.tell() > file_size_limit:
-                self.close_file()
-                self.fileIndex = int(self.filename[len(self.filename)-5]) + 1
-                self.filename = self.filename[0:len(self.filename)-5] + str(self.fileIndex) + ".mdf"
-                self.file = self.open_file(self.filename)
-                self._write_header()
-                self._write_pointers()
-            self._write_string(packet)
-            self.cgBlockList[index].numberOfRecords += 1
-            self.cgBlockList[index].data_size = packetsize
-            self.dataRecordCount += 1
+                for tick, value in records:
+                    packet, packetsize = self._pack_record(cg, (tick - start_tick) / 1e9, value)
+                    self._store_record(cg, packet, packetsize)
+            if self.checkpointing:
+                self._check_checkpoint()
         finally:
+            if metrics is not None:
+                release_time = clock()
+                metrics.lockHold.add(release_time - hold_start)
             self.lock.release()
+        if metrics is not None:
+            metrics.report(release_time)
+
+    def _store_record(self, cg, packet, packetsize):
+        """Appends a packed record and counts it, in the metrics too. Called with the write lock held."""
+        # Checks filesize limit of 1GB. If file is over limit, starts new file.
+        if self.FILE_SIZE_LIMIT is not None and self._file_size() > self.FILE_SIZE_LIMIT:
+            self._rollover()
+        self._append_record(cg, packet)
+        cg.numberOfRecords += 1
+        cg.data_size = packetsize
+        self.dataRecordCount += 1
+        if self.metrics is not None:
+            self.metrics.add_record(cg.name, len(packet))
+
+    def _pack_record(self, cg, timestamp_offset, value):
+        """Returns the packed data record and its size without record ID, using the record struct compiled for the
+        ChannelGroup. String values are copied into their NULL padded fields after the numeric fields are packed."""
+        packer = cg.recordStruct
+        if cg.isCAN:
+            if isinstance(value, INTEGER_TYPES):
+                if value >> (8 * cg.payloadSize):
+                    raise ValueError("CAN payload 0x%X of %s does not fit into %d bytes"
+                                     % (value, cg.name, cg.payloadSize))
+                value = STRUCT_TYPE['LONG'].pack(value)  # classic CAN payload as little endian integer
+            else:
+                if not isinstance(value, bytes):
+                    value = memoryview(value).tobytes()  # bytearray and memoryview payloads
+                if len(value) > cg.payloadSize:
+                    raise ValueError("CAN payload of %d bytes does not fit into the %d bytes of %s"
+                                     % (len(value), cg.payloadSize, cg.name))
+            values = (timestamp_offset, value)
+        elif cg.stringFields:
+            return self._pack_string_record(cg, timestamp_offset, value)
+        else:
+            values = (timestamp_offset,) + tuple(value)
+        if self.sortedOutput:
+            return packer.pack(*values), packer.size  # Sorted DG blocks have no record ID prefix
+        return packer.pack(cg.recordID, *values), packer.size - 1
+
+    def _pack_string_record(self, cg, timestamp_offset, value):
+        """_pack_record for ChannelGroups with string channels. bytes, bytearray and memoryview values are sliced
+        straight into the record buffer, text is encoded as latin-1."""
+        packer = cg.recordStruct
+        record = bytearray(packer.size)
+        numbers = [value[index] for index in cg.numericFields]
+        if self.sortedOutput:
+            packer.pack_into(record, 0, timestamp_offset, *numbers)
+        else:
+            packer.pack_into(record, 0, cg.recordID, timestamp_offset, *numbers)
+        for index, offset, width in cg.stringFields:
+            pack_field(record, offset, value[index], width, False)
+        return bytes(record), packer.size - (0 if self.sortedOutput else 1)
+
+    def _compile_record(self, cg_block):
+        """Builds the struct that packs one record of cg_block: record ID (unsorted only), timestamp, one field per
+        channel. String fields are pad bytes in the struct, their offsets are kept in cg_block.stringFields."""
+        codes = ['<d'] if self.sortedOutput else ['<Bd']
+        offset = 8 if self.sortedOutput else 9
+        cg_block.stringFields = []  # (value index, record offset, width)
+        cg_block.numericFields = []  # value indexes of the numeric channels
+        if cg_block.isCAN:
+            codes.append('%ds' % cg_block.payloadSize)  # struct pads short payloads, _pack_record rejects long ones
+        else:
+            for index, cn_block in enumerate(cg_block.cnBlockList[1:]):
+                width = cn_block.numberOfBits // 8
+                if cn_block.signalType == 7:
+                    codes.append('%dx' % width)
+                    cg_block.stringFields.append((index, offset, width))
+                else:
+                    codes.append('f')
+                    cg_block.numericFields.append(index)
+                offset += width
+        cg_block.recordStruct = struct.Struct(''.join(codes))
+
+    def write_ticks(self, channelgroup_name, tick, value):
+        """Like write(), but the timestamp is an integer monotonic_ns() reading instead of an offset in seconds.
+        :param str channelgroup_name: Name of ChannelGroup object in which the data belongs to.
+        :param int tick: monotonic_ns() (time.monotonic_ns) reading when the data was sampled
+        :param list value: See write()"""
+        self.write(channelgroup_name, (tick - self.startTick) / 1e9, value)
+
+    def write_many_ticks(self, channelgroup_name, records):
+        """Like write_many(), with (tick, value) pairs of integer monotonic_ns() readings. Each tick is converted to its
+        offset in the packing loop, so the batch is not copied into a list of offsets first. The conversion is still
+        one subtraction and division per record in Python.
+        :param str channelgroup_name: Name of ChannelGroup object in which the data belongs to.
+        :param iterable records: (tick, value) pairs, see write_ticks()"""
+        if self.profiler is None:
+            self._write_records(channelgroup_name, records, self.startTick)
+        else:
+            with self.profiler.span('write_many'):
+                self._write_records(channelgroup_name, records, self.startTick)
+
+    def set_start_time_ns(self, start_time_ns, tick=None):
+        """Sets the absolute start time of the recording, which all time offsets reference. Can be called before or
+        after the header is written.
+        :param int start_time_ns: Nanoseconds since 01.01.1970 UTC, e.g. from time.time_ns()
+        :param int tick: monotonic_ns() reading taken at start_time_ns. By default the tick reference moves by the
+            same amount as the start time.
+        """
+        if tick is None:
+            tick = self.startTick + start_time_ns - self.HDBlock.startTimeNs
+        self.startTick = tick
+        self.HDBlock.set_start_time(start_time_ns)
+        if self.datapointer:  # header already written
+            self._patch_start_time()
 
     def define_start_time(self, timestamp):
         """To change timestamp in header. All time offsets in data block of file will reference this time.
         :param str timestamp: HH:MM:SS"""
-        if type(timestamp) is str and timestamp[2] is ":" and timestamp[5] is ":":
-            self.file.seek(self.timepointer)
-            self.file.write(timestamp)
+        if type(timestamp) is str and timestamp[2] == ":" and timestamp[5] == ":":
+            seconds = int(time.mktime(time.strptime(self.HDBlock.date + " " + timestamp, '%d:%m:%Y %H:%M:%S')))
+            self.set_start_time_ns(seconds * 1000000000)
 
     def get_epoch_time(self):
-        """Translates MDF spec timestamp format to epoch time for conversion to time offset float value"""
-        datetime = self.HDBlock.date + " " + self.HDBlock.time
-        epochtime = int(time.mktime(time.strptime(datetime, '%d:%m:%Y %H:%M:%S')))
-        return epochtime
+        """Start time of the recording in whole seconds since 01.01.1970 UTC"""
+        return self.HDBlock.startTimeNs // 1000000000
+
+    def _patch_start_time(self):
+        """Rewrites the start time fields of the written HD block."""
+        with self.lock:
+            self.file.seek(self.timepointer - len(self.HDBlock.date))
+            self._write_string(self.HDBlock.date)
+            self._write_string(self.HDBlock.time)
+            self.file.seek(self.timestampPointer)
+            self._write_to_file(STRUCT_TYPE['LONG'].pack(self.HDBlock.local_time_ns()))
+            self._write_to_file(STRUCT_TYPE['INT16'].pack(self.HDBlock.utcOffset))
+            self.file.seek(0, 2)
 
     def _write_header(self):
         """Private method that writes necessary file contents in a specific order. Should NOT be altered.
@@ -354,6 +894,7 @@ class MDF(object):
                                 "cn#": {'cnPointerPointer': value}, {'ccPointerPointer': value},
                                 {'cePointerPointer':  value}}"""
         self.file.seek(0)
+        self.HDBlock.numberOfDGs = len(self.dgBlockList)
         # ID Block
         self._write_string(self.IDBlock.FILEID)
         self._write_string(self.IDBlock.FORMATID)
@@ -366,9 +907,11 @@ class MDF(object):
         # HDBlock
         self._write_string(self.HDBlock.BLOCKID)
         self._write_to_file(STRUCT_TYPE['UINT16'].pack(self.HDBlock.BLOCKSIZE))
+        self.dgLinkPointer = self.file.tell()
         self._write_to_file(STRUCT_TYPE['LINK'].pack(self.HDBlock.firstDGPointer))
         self._write_to_file(STRUCT_TYPE['LINK'].pack(self.HDBlock.firstTXPointer))
         self._write_to_file(STRUCT_TYPE['LINK'].pack(self.HDBlock.firstPRPointer))
+        self.dgCountPointer = self.file.tell()
         self._write_to_file(STRUCT_TYPE['UINT16'].pack(self.HDBlock.numberOfDGs))
         self._write_string(self.HDBlock.date)
         self.timepointer = self.file.tell()
@@ -377,6 +920,11 @@ class MDF(object):
         self._write_string(self.HDBlock.ORG)
         self._write_string(self.HDBlock.project)
         self._write_string(self.HDBlock.dut)
+        self.timestampPointer = self.file.tell()
+        self._write_to_file(STRUCT_TYPE['LONG'].pack(self.HDBlock.local_time_ns()))
+        self._write_to_file(STRUCT_TYPE['INT16'].pack(self.HDBlock.utcOffset))
+        self._write_to_file(STRUCT_TYPE['UINT16'].pack(self.HDBlock.TIME_QUALITY))
+        self._write_string(self.HDBlock.TIMER_ID)
 
         # TXBlock
         self._write_string(self.TXBlock.BLOCKID)
@@ -384,127 +932,182 @@ class MDF(object):
         self._write_string(self.TXBlock.text)
 
         # DGBlock
-        self._write_string(self.DGBlock.BLOCKID)
-        self._write_to_file(STRUCT_TYPE['UINT16'].pack(self.DGBlock.BLOCKSIZE))
-        self._write_to_file(STRUCT_TYPE['LINK'].pack(self.DGBlock.nextDGPointer))
-        self._write_to_file(STRUCT_TYPE['LINK'].pack(self.DGBlock.nextCGPointer))
-        self._write_to_file(STRUCT_TYPE['LINK'].pack(self.DGBlock.reserved))
-        data_pointer_pointer = self.file.tell()
-        self._write_to_file(STRUCT_TYPE['LINK'].pack(self.DGBlock.dataPointer))
-        self._write_to_file(STRUCT_TYPE['UINT16'].pack(self.DGBlock.numberofCGs))
-        self._write_to_file(STRUCT_TYPE['UINT16'].pack(self.DGBlock.numberofRecordIDs))
-        self._write_to_file(STRUCT_TYPE['UINT32'].pack(self.DGBlock.reserved))
+        # All DG blocks are written back to back, followed by the CG blocks. In sorted mode DG n owns CG n,
+        # otherwise the single DG block owns every CG.
+        dg_offset = self.HEADER_SIZE + self.TXBlock.blocksize
+        cg_offset = dg_offset + DGBlock.BLOCKSIZE * len(self.dgBlockList)
+        for list_index, dg_block in enumerate(self.dgBlockList):
+            if list_index + 1 < len(self.dgBlockList):
+                dg_block.nextDGPointer = dg_offset + DGBlock.BLOCKSIZE * (list_index + 1)
+            dg_block.nextCGPointer = cg_offset + CGBlock.BLOCKSIZE * list_index
+            self._write_dg_block(dg_block, 'dg' + str(list_index + 1))
 
         # CGBlock
         self.cgPointers['cgCount'] = len(self.cgBlockList)
         for list_index, cg_block in enumerate(self.cgBlockList):
-            self.cgPointers['cg' + str(list_index + 1)] = {}
-            self.cgPointers['cg' + str(list_index + 1)]['cnCount'] = cg_block.numberOfChannels
-            self._write_string(cg_block.BLOCKID)
-            self._write_to_file(STRUCT_TYPE['UINT16'].pack(cg_block.BLOCKSIZE))
-            self.cgPointers['cg' + str(list_index + 1)]['cgPointerPointer'] = self.file.tell()
-            self._write_to_file(STRUCT_TYPE['LINK'].pack(cg_block.nextCGPointer))
-            self.cgPointers['cg' + str(list_index + 1)]['cnPointerPointer'] = self.file.tell()
-            self._write_to_file(STRUCT_TYPE['LINK'].pack(cg_block.CNPointer))
-            self._write_to_file(STRUCT_TYPE['LINK'].pack(cg_block.TXPointer))
-            self._write_to_file(STRUCT_TYPE['UINT16'].pack(cg_block.recordID))
-            self._write_to_file(STRUCT_TYPE['UINT16'].pack(cg_block.numberOfChannels))
-            self.cgPointers['cg' + str(list_index + 1)]['dataSizePointer'] = self.file.tell()
-            self._write_to_file(STRUCT_TYPE['UINT16'].pack(cg_block.data_size))
-            self.cgPointers['cg' + str(list_index + 1)]['numberOfRecordsPointer'] = self.file.tell()
-            self.cgPointers['cg' + str(list_index + 1)]['numberOfRecords'] = 0
-            self._write_to_file(STRUCT_TYPE['UINT32'].pack(cg_block.numberOfRecords))
+            self._write_cg_block(cg_block, 'cg' + str(list_index + 1))
 
         # CNBlock
         self.cnPointers['numberOfCNs'] = len(self.cnBlockList)
         for list_index, cn_block in enumerate(self.cnBlockList):
-            self.cnPointers['cn' + str(list_index + 1)] = {}
-            if cn_block.channelType == 0:
-                self.cnTypeList.append(0)
-            if cn_block.channelType == 1:
-                self.cnTypeList.append(1)
-            self._write_string(cn_block.BLOCKID)
-            self._write_to_file(STRUCT_TYPE['UINT16'].pack(cn_block.BLOCKSIZE))
-            self.cnPointers['cn' + str(list_index + 1)]['cnPointerPointer'] = self.file.tell()
-            self._write_to_file(STRUCT_TYPE['LINK'].pack(cn_block.nextCNPointer))
-            self.cnPointers['cn' + str(list_index + 1)]['ccPointerPointer'] = self.file.tell()
-            self._write_to_file(STRUCT_TYPE['LINK'].pack(cn_block.CCPointer))
-            self.cnPointers['cn' + str(list_index + 1)]['cePointerPointer'] = self.file.tell()
-            self._write_to_file(STRUCT_TYPE['LINK'].pack(cn_block.CEPointer))
-            self._write_to_file(STRUCT_TYPE['LINK'].pack(cn_block.reserved))
-            self._write_to_file(STRUCT_TYPE['LINK'].pack(cn_block.TXPointer))
-            self._write_to_file(STRUCT_TYPE['UINT16'].pack(cn_block.channelType))
-            self._write_string(cn_block.signalName)
-            self._write_string(cn_block.signalDescription)
-            self._write_to_file(STRUCT_TYPE['UINT16'].pack(cn_block.firstBitNo))
-            self._write_to_file(STRUCT_TYPE['UINT16'].pack(cn_block.numberOfBits))
-            self._write_to_file(STRUCT_TYPE['UINT16'].pack(cn_block.signalType))
-            self._write_to_file(STRUCT_TYPE['BOOL'].pack(cn_block.valueRangeBool))
-            self._write_to_file(STRUCT_TYPE['REAL'].pack(cn_block.minValue))
-            self._write_to_file(STRUCT_TYPE['REAL'].pack(cn_block.maxValue))
-            self._write_to_file(STRUCT_TYPE['REAL'].pack(cn_block.sampleRate))
-            self._write_to_file(STRUCT_TYPE['LINK'].pack(cn_block.ASAMPointer))
-            self._write_to_file(STRUCT_TYPE['LINK'].pack(cn_block.TXPointer2))
-            self._write_to_file(STRUCT_TYPE['UINT16'].pack(cn_block.byteOffset))
+            self._write_cn_block(cn_block, 'cn' + str(list_index + 1))
 
         # CCBlock
         for list_index, cc_block in enumerate(self.cc_blockList):
-            self._write_string(cc_block.BLOCKID)
-            self._write_to_file(STRUCT_TYPE['UINT16'].pack(cc_block.blockSize))
-            self._write_to_file(STRUCT_TYPE['BOOL'].pack(cc_block.valueRangeBool))
-            self._write_to_file(STRUCT_TYPE['REAL'].pack(cc_block.minValue))
-            self._write_to_file(STRUCT_TYPE['REAL'].pack(cc_block.maxValue))
-            self._write_string(cc_block.physUnit)
-            self._write_to_file(STRUCT_TYPE['UINT16'].pack(cc_block.conversionID))
-            self._write_to_file(STRUCT_TYPE['UINT16'].pack(cc_block.pairs))
-            if cc_block.conversionID == 0:
-                for p in range(len(cc_block.paramList)):
-                    self._write_to_file(STRUCT_TYPE['REAL'].pack(cc_block.paramList[p]))
-            elif cc_block.conversionID == 11:
-                for s in six.xrange(0, len(cc_block.paramList), 2):
-                    self._write_string(str(cc_block.paramList[s]))
-                    self._write_to_file(STRUCT_TYPE['REAL'].pack(cc_block.paramList[s + 1]))
+            self._write_cc_block(cc_block)
 
         # CEBlock
         self.cecount = 0
         for list_index, ce_block in enumerate(self.ceBlockList):
-            self._write_string(ce_block.BLOCKID)
-            self._write_to_file(STRUCT_TYPE['UINT16'].pack(ce_block.BLOCKSIZE))
-            self._write_to_file(STRUCT_TYPE['UINT16'].pack(ce_block.EXTENSIONID))
-            self._write_to_file(STRUCT_TYPE['UINT32'].pack(ce_block.canID))
-            self._write_to_file(STRUCT_TYPE['UINT32'].pack(ce_block.canIndex))
-            self._write_string(ce_block.messagename)
-            self._write_string(ce_block.senderName)
+            self._write_ce_block(ce_block)
+
+        # TXBlocks of long names and descriptions, linked in _write_pointers
+        for tx_block in self.txBlockList:
+            self._write_tx_block(tx_block)
+
+        # Space for the blocks of channel groups added after start_file, see _write_late_group
+        self.reservePointer = self.file.tell()
+        self._write_to_file(b'\0' * self.headerReserve)
+        self.reserveEnd = self.file.tell()
+        self.lateGroups = []
+        self.file.seek(0, 2)
+        self.datapointer = self.file.tell()
+        if not self.sortedOutput:
+            # Unsorted records are appended directly behind the header. Sorted data is linked in close_file.
+            self.file.seek(self.dgPointers['dg1']['dataPointerPointer'])
+            self._write_to_file(STRUCT_TYPE['LINK'].pack(self.datapointer))
         self.file.seek(0, 2)
-        datapointer = self.file.tell()
-        self.file.seek(data_pointer_pointer)
-        self._write_to_file(STRUCT_TYPE['LINK'].pack(datapointer))
-        self.file.seek(0,2)
+
+    def _write_dg_block(self, dg_block, key):
+        """Writes a DG block at the current file position and records its link locations in dgPointers[key]."""
+        self.dgPointers[key] = {}
+        self._write_string(dg_block.BLOCKID)
+        self._write_to_file(STRUCT_TYPE['UINT16'].pack(dg_block.BLOCKSIZE))
+        self.dgPointers[key]['dgPointerPointer'] = self.file.tell()
+        self._write_to_file(STRUCT_TYPE['LINK'].pack(dg_block.nextDGPointer))
+        self._write_to_file(STRUCT_TYPE['LINK'].pack(dg_block.nextCGPointer))
+        self._write_to_file(STRUCT_TYPE['LINK'].pack(dg_block.reserved))
+        self.dgPointers[key]['dataPointerPointer'] = self.file.tell()
+        self._write_to_file(STRUCT_TYPE['LINK'].pack(dg_block.dataPointer))
+        self.dgPointers[key]['cgCountPointer'] = self.file.tell()
+        self._write_to_file(STRUCT_TYPE['UINT16'].pack(dg_block.numberofCGs))
+        self._write_to_file(STRUCT_TYPE['UINT16'].pack(dg_block.numberofRecordIDs))
+        self._write_to_file(STRUCT_TYPE['UINT32'].pack(dg_block.reserved))
+
+    def _write_cg_block(self, cg_block, key):
+        """Writes a CG block at the current file position and records its link and count locations in
+        cgPointers[key]."""
+        self.cgPointers[key] = {}
+        self.cgPointers[key]['cnCount'] = cg_block.numberOfChannels
+        self._write_string(cg_block.BLOCKID)
+        self._write_to_file(STRUCT_TYPE['UINT16'].pack(cg_block.BLOCKSIZE))
+        self.cgPointers[key]['cgPointerPointer'] = self.file.tell()
+        self._write_to_file(STRUCT_TYPE['LINK'].pack(cg_block.nextCGPointer))
+        self.cgPointers[key]['cnPointerPointer'] = self.file.tell()
+        self._write_to_file(STRUCT_TYPE['LINK'].pack(cg_block.CNPointer))
+        self.cgPointers[key]['txPointerPointer'] = self.file.tell()
+        self._write_to_file(STRUCT_TYPE['LINK'].pack(cg_block.TXPointer))
+        self._write_to_file(STRUCT_TYPE['UINT16'].pack(cg_block.recordID))
+        self._write_to_file(STRUCT_TYPE['UINT16'].pack(cg_block.numberOfChannels))
+        self.cgPointers[key]['dataSizePointer'] = self.file.tell()
+        self._write_to_file(STRUCT_TYPE['UINT16'].pack(cg_block.data_size))
+        self.cgPointers[key]['numberOfRecordsPointer'] = self.file.tell()
+        self.cgPointers[key]['numberOfRecords'] = 0
+        self._write_to_file(STRUCT_TYPE['UINT32'].pack(cg_block.numberOfRecords))
+
+    def _write_cn_block(self, cn_block, key):
+        """Writes a CN block at the current file position and records its link locations in cnPointers[key]."""
+        self.cnPointers[key] = {}
+        if cn_block.channelType == 0:
+            self.cnTypeList.append(0)
+        if cn_block.channelType == 1:
+            self.cnTypeList.append(1)
+        self._write_string(cn_block.BLOCKID)
+        self._write_to_file(STRUCT_TYPE['UINT16'].pack(cn_block.BLOCKSIZE))
+        self.cnPointers[key]['cnPointerPointer'] = self.file.tell()
+        self._write_to_file(STRUCT_TYPE['LINK'].pack(cn_block.nextCNPointer))
+        self.cnPointers[key]['ccPointerPointer'] = self.file.tell()
+        self._write_to_file(STRUCT_TYPE['LINK'].pack(cn_block.CCPointer))
+        self.cnPointers[key]['cePointerPointer'] = self.file.tell()
+        self._write_to_file(STRUCT_TYPE['LINK'].pack(cn_block.CEPointer))
+        self._write_to_file(STRUCT_TYPE['LINK'].pack(cn_block.reserved))
+        self.cnPointers[key]['txPointerPointer'] = self.file.tell()
+        self._write_to_file(STRUCT_TYPE['LINK'].pack(cn_block.TXPointer))
+        self._write_to_file(STRUCT_TYPE['UINT16'].pack(cn_block.channelType))
+        self._write_string(cn_block.signalName)
+        self._write_string(cn_block.signalDescription)
+        self._write_to_file(STRUCT_TYPE['UINT16'].pack(cn_block.firstBitNo))
+        self._write_to_file(STRUCT_TYPE['UINT16'].pack(cn_block.numberOfBits))
+        self._write_to_file(STRUCT_TYPE['UINT16'].pack(cn_block.signalType))
+        self._write_to_file(STRUCT_TYPE['BOOL'].pack(cn_block.valueRangeBool))
+        self._write_to_file(STRUCT_TYPE['REAL'].pack(cn_block.minValue))
+        self._write_to_file(STRUCT_TYPE['REAL'].pack(cn_block.maxValue))
+        self._write_to_file(STRUCT_TYPE['REAL'].pack(cn_block.sampleRate))
+        self.cnPointers[key]['asamPointerPointer'] = self.file.tell()
+        self._write_to_file(STRUCT_TYPE['LINK'].pack(cn_block.ASAMPointer))
+        self._write_to_file(STRUCT_TYPE['LINK'].pack(cn_block.TXPointer2))
+        self._write_to_file(STRUCT_TYPE['UINT16'].pack(cn_block.byteOffset))
+
+    def _write_cc_block(self, cc_block):
+        """Writes a CC block at the current file position."""
+        self._write_string(cc_block.BLOCKID)
+        self._write_to_file(STRUCT_TYPE['UINT16'].pack(cc_block.blockSize))
+        self._write_to_file(STRUCT_TYPE['BOOL'].pack(cc_block.valueRangeBool))
+        self._write_to_file(STRUCT_TYPE['REAL'].pack(cc_block.minValue))
+        self._write_to_file(STRUCT_TYPE['REAL'].pack(cc_block.maxValue))
+        self._write_string(cc_block.physUnit)
+        self._write_to_file(STRUCT_TYPE['UINT16'].pack(cc_block.conversionID))
+        self._write_to_file(STRUCT_TYPE['UINT16'].pack(cc_block.pairs))
+        if cc_block.conversionID == 0:
+            for p in range(len(cc_block.paramList)):
+                self._write_to_file(STRUCT_TYPE['REAL'].pack(cc_block.paramList[p]))
+        elif cc_block.conversionID == 11:
+            # VTAB pairs are stored as value, then text
+            for s in range(0, len(cc_block.paramList), 2):
+                self._write_to_file(STRUCT_TYPE['REAL'].pack(cc_block.paramList[s + 1]))
+                self._write_string(cc_block.paramList[s])
+
+    def _write_ce_block(self, ce_block):
+        """Writes a CE block at the current file position."""
+        self._write_string(ce_block.BLOCKID)
+        self._write_to_file(STRUCT_TYPE['UINT16'].pack(ce_block.BLOCKSIZE))
+        self._write_to_file(STRUCT_TYPE['UINT16'].pack(ce_block.EXTENSIONID))
+        self._write_to_file(STRUCT_TYPE['UINT32'].pack(ce_block.canID))
+        self._write_to_file(STRUCT_TYPE['UINT32'].pack(ce_block.canIndex))
+        self._write_string(ce_block.messageName)
+        self._write_string(ce_block.senderName)
+
+    def _write_tx_block(self, tx_block):
+        """Writes a TX block at the current file position and keeps its address."""
+        tx_block.address = self.file.tell()
+        self._write_string(tx_block.BLOCKID)
+        self._write_to_file(STRUCT_TYPE['UINT16'].pack(tx_block.blocksize))
+        self._write_string(tx_block.text)
 
     def _write_pointers(self):
         """Called after the _writeHeaders() function call. This will tie blocks together by populating space in each
         block with necessary pointer value."""
         # CGBlock Pointers
-        ccblock_size_list = []
-
         # These constants were calculated from spec sheet
         size_of_cnblock = 228
-        size_offset_of_information_header = 256
+        size_offset_of_information_header = self.HEADER_SIZE + DGBlock.BLOCKSIZE * len(self.dgBlockList)
         size_of_cgblock = 26
         cn_block_offset_minus_pointer_location = 224
         size_of_ceblock = 128
 
+        cc_address = size_offset_of_information_header + self.TXBlock.blocksize + \
+            size_of_cgblock * len(self.cgBlockList) + size_of_cnblock * len(self.cnBlockList)
         ccblock_size = 0
-        for list_index, cc_block in enumerate(self.cc_blockList):
+        for cc_block in self.cc_blockList:
+            cc_block.address = cc_address + ccblock_size
             ccblock_size += cc_block.blockSize
-            ccblock_size_list.append(ccblock_size)
         cn_offset = 0  # Instantiate variable before start
         pointer = 0
 
         # cgPointerPointer
         for i in range(len(self.cgBlockList)):
             location = self.cgPointers['cg' + str(i + 1)]['cgPointerPointer']
-            if len(self.cgBlockList) == 1:
+            if len(self.cgBlockList) == 1 or self.sortedOutput:
                 pointer = 0
             elif len(self.cgBlockList) > 1:
                 if i + 1 is not len(self.cgBlockList):
@@ -529,14 +1132,9 @@ class MDF(object):
 
         # CNBlock Pointers
         # ccPointer
-        for l in range(len(self.cc_blockList)):
-            if l > 0:
-                ccoffset = ccblock_size_list[l-1]
-            else:
-                ccoffset = 0
+        for l in range(len(self.cnBlockList)):
             location = self.cnPointers['cn' + str(l + 1)]['ccPointerPointer']
-            pointer = size_offset_of_information_header + self.TXBlock.blocksize + \
-                size_of_cgblock * len(self.cgBlockList) + size_of_cnblock*len(self.cnBlockList) + ccoffset
+            pointer = self.cnBlockList[l].ccBlock.address
             self.file.seek(location)
             self.file.write(STRUCT_TYPE['LINK'].pack(pointer))
 
@@ -553,27 +1151,113 @@ class MDF(object):
                 self.file.write(STRUCT_TYPE['LINK'].pack(pointer))
                 location += size_of_cnblock
 
-        s = 0
         if len(self.ceBlockList) > 0:
+            # CE blocks follow the CC blocks, one per CAN message shared by its signals
+            for s, ce_block in enumerate(self.ceBlockList):
+                ce_block.address = cc_address + ccblock_size + size_of_ceblock * s
             for t in range(len(self.cnBlockList)):
                 location = self.cnPointers['cn' + str(t + 1)]['cePointerPointer']
-                if self.cnBlockList[t].channelTitle == "CAN":
-                    pointer = size_offset_of_information_header + self.TXBlock.blocksize + \
-                              size_of_cgblock*len(self.cgBlockList) + size_of_cnblock*len(self.cnBlockList) + \
-                              ccblock_size + size_of_ceblock*s
-                    s += 1
-                elif self.cnTypeList[t] == 1:
-                    pointer = 0
+                ce_block = self.cnBlockList[t].ceBlock
+                pointer = ce_block.address if ce_block is not None else 0
                 self.file.seek(location)
                 self.file.write(STRUCT_TYPE['LINK'].pack(pointer))
+
+        # Group name, long name and comment TX pointers
+        for i, cg_block in enumerate(self.cgBlockList):
+            if cg_block.commentBlock is not None:
+                self.file.seek(self.cgPointers['cg' + str(i + 1)]['txPointerPointer'])
+                self.file.write(STRUCT_TYPE['LINK'].pack(cg_block.commentBlock.address))
+        for t in range(len(self.cnBlockList)):
+            cn_block = self.cnBlockList[t]
+            if cn_block.longNameBlock is not None:
+                self.file.seek(self.cnPointers['cn' + str(t + 1)]['asamPointerPointer'])
+                self.file.write(STRUCT_TYPE['LINK'].pack(cn_block.longNameBlock.address))
+            if cn_block.longDescriptionBlock is not None:
+                self.file.seek(self.cnPointers['cn' + str(t + 1)]['txPointerPointer'])
+                self.file.write(STRUCT_TYPE['LINK'].pack(cn_block.longDescriptionBlock.address))
         self.file.seek(0, 2)
 
+    def _rollover(self):
+        """Closes the current file and continues with the same header in the next file."""
+        if self.metrics is not None:
+            start = clock()
+        with self._span('rollover'):
+            self.close_file()
+            self.fileIndex = int(self.filename[len(self.filename)-5]) + 1
+            self.filename = self.filename[0:len(self.filename)-5] + str(self.fileIndex) + ".mdf"
+            self.file = self.open_file(self.filename)
+            for cg_block in self.cgBlockList:
+                cg_block.numberOfRecords = 0
+            with self._span('_write_header'):
+                self._write_header()
+            with self._span('_write_pointers'):
+                self._write_pointers()
+        if self.metrics is not None:
+            self.metrics.rollover.add(clock() - start)
+
+    def _append_record(self, cg_block, packet):
+        """Hands a packed record to the file, or to the group buffers in sorted mode."""
+        if self.sortedOutput:
+            self.spillBuffer.append(cg_block.recordID, packet)
+        else:
+            self._write_data(packet)
+
+    def _span(self, name):
+        """Returns the profiler span of phase name, or a no-op context manager without profiler."""
+        if self.profiler is None:
+            return NULL_SPAN
+        return self.profiler.span(name)
+
+    def _queue_depth(self):
+        """Number of data chunks waiting to be written by a background worker."""
+        return 0
+
+    def _report_metrics(self):
+        """Hands a final snapshot to the metrics callback when a file is closed."""
+        if self.metrics is not None and self.metrics.callback is not None:
+            self.metrics.callback(self.metrics.snapshot())
+
+    def _record_size(self, cg_block):
+        """Size in bytes of one data record of cg_block without the record ID, derived from its channel layout."""
+        if cg_block.isCAN:
+            return 8 + cg_block.payloadSize  # 8 byte timestamp + CAN payload
+        return sum(cn_block.numberOfBits for cn_block in cg_block.cnBlockList) // 8
+
+    def _file_size(self):
+        """Size the current file will have once buffered records are written. Used for the rollover check."""
+        if self.sortedOutput:
+            return self.datapointer + self.spillBuffer.totalBytes
+        return self.file.tell()
+
+    def _write_sorted_data(self):
+        """Called by close_file in sorted mode. Copies each group buffer to the end of the file, so every DG block
+        gets one contiguous data section, and links the DG block to it."""
+        for list_index, cg_block in enumerate(self.cgBlockList):
+            if self.spillBuffer.size(cg_block.recordID) == 0:
+                continue
+            self.file.seek(0, 2)
+            datapointer = self.file.tell()
+            self.spillBuffer.write_to(cg_block.recordID, self.file)
+            self.file.seek(self.dgPointers['dg' + str(list_index + 1)]['dataPointerPointer'])
+            self._write_to_file(STRUCT_TYPE['LINK'].pack(datapointer))
+        self.spillBuffer.close()
+
+    def _write_data(self, value):
+        """Writes data records to the file. The latency of the buffered write call is recorded when metrics are
+        enabled."""
+        if self.metrics is None:
+            self.file.write(value)
+        else:
+            start = clock()
+            self.file.write(value)
+            self.metrics.fileWrite.add(clock() - start)
+
     def _write_to_file(self, value):
         """Writes a value to a file by formatting it into the correct binary type using struct package."""
         self.file.write(value)
 
     def _write_string(self, s):
         """Specific method for writing python type string to file by formatting it to correct binary format."""
-        if type(s) is str:
-            for i in range(len(s)):
-                self._write_to_file(STRUCT_TYPE['CHAR'].pack(s[i]))
+        if isinstance(s, TEXT_TYPE):
+            s = s.encode('latin-1')
+        self._write_to_file(s)
@@ -0,0 +1,459 @@
+"""MDF 4.1 writer backend. Import MDF4 instead of MDF to write .mf4 files with the same ChannelGroup/CANmsg API.
+MDF 4 links are 64 bit, so files are never split at 1 GB, and the data can be stored in chunked DT blocks or in
+deflate compressed DZ blocks."""
+import struct
+import threading
+import logging
+from .mdf import MDF
+from .mdf4blocks import *
+from .compression import DEFLATE, TRANSPOSE_DEFLATE
+from .metrics import clock
+
+try:
+    from ._version import __version__
+except ImportError:
+    __version__ = "unknown_local_version"
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+logger = logging.getLogger(__name__)
+
+UINT64 = struct.Struct('<Q')
+LINK = struct.Struct('<q')
+
+# MDF 3 signal data type -> MDF 4 cn_data_type (all little endian)
+DATA_TYPE = {0: 0,   # unsigned integer
+             1: 2,   # signed integer
+             2: 4,   # IEEE 754 float
+             3: 4,   # IEEE 754 double
+             7: 6}   # string (ISO-8859-1)
+
+HD_COMMENT = (u'<HDcomment><TX>{0}</TX><common_properties><e name="author">{1}</e><e name="project">{2}</e>'
+              '<e name="subject">{3}</e></common_properties></HDcomment>')
+FH_COMMENT = ('<FHcomment><TX>created</TX><tool_id>mdfwriter</tool_id><tool_vendor>mdfwriter</tool_vendor>'
+              '<tool_version>{0}</tool_version></FHcomment>')
+
+
+def _escape(text):
+    """Escapes &, < and > for XML, as xml.sax.saxutils.escape, which pulls in urllib on import."""
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+def _strip(field):
+    """Returns the text of a NULL padded MDF 3 field."""
+    return field.rstrip(b'\0').decode('latin-1')
+
+
+class MDF4(MDF):
+    """MDF 4.1 version of :class: MDF. Channel groups are added, written and closed exactly like with MDF.
+    Records are collected in chunks of chunk_size bytes and each chunk is written as one DT block, or as a DZ block
+    if compression is set. Blocks are tied together with DL (and HL) blocks when the file is closed.
+    With sorted_output, every ChannelGroup gets its own DG block and its data is written contiguously at close, like
+    in MDF. Sorted groups have a fixed record size, so TRANSPOSE_DEFLATE transposes them before deflating. Unsorted
+    records of different groups are interleaved and are always compressed with plain DEFLATE.
+    With background_compression, full chunks are handed to a worker thread that transposes, deflates and writes them
+    while logging continues. Sorted groups are then not buffered until close: every group collects its own chunks of
+    whole records, and its DZ blocks are written as they fill up and listed in the group's DL block at close. The
+    writes of the worker are not timed in the fileWrite metrics.
+    :param str filename: Name of file to be created
+    :param str author: Creator of file
+    :param str project: Name of Project of test
+    :param str dut: Device under test
+    :param str file_description: Text stored in the file comment
+    :param bool sorted_output: Write one DG block per ChannelGroup (sorted file) instead of one unsorted DG block
+    :param int spill_budget: See MDF
+    :param str spill_dir: See MDF
+    :param int compression: None for DT blocks, compression.DEFLATE or compression.TRANSPOSE_DEFLATE for DZ blocks
+    :param int chunk_size: Uncompressed bytes per data block
+    :param int compression_level: zlib compression level of DZ blocks
+    :param bool background_compression: Compress and write data blocks in a worker thread
+    :param int queue_size: Background compression only. Chunks waiting for the worker before write blocks
+    :param int buffer_size: See MDF
+    """
+    FILE_SIZE_LIMIT = None  # 64 bit links, no rollover needed
+    CHECKPOINTS = False  # data blocks are only linked at close
+    TEMPLATES = False  # MDFTemplate serializes MDF 3 headers
+    CHUNK_SIZE = 4194304  # bytes
+
+    def __init__(self, file_name, author, project, dut, file_description=None, sorted_output=False,
+                 spill_budget=None, spill_dir=None, compression=None, chunk_size=CHUNK_SIZE, compression_level=6,
+                 background_compression=False, queue_size=8, buffer_size=-1):
+        if compression not in (None, DEFLATE, TRANSPOSE_DEFLATE):
+            raise ValueError("compression must be None, compression.DEFLATE or compression.TRANSPOSE_DEFLATE, not %r"
+                             % (compression,))
+        MDF.__init__(self, file_name, author, project, dut, file_description, sorted_output, spill_budget, spill_dir,
+                     buffer_size)
+        self.IDBlock = IDBlock()
+        self.compression = compression
+        self.chunkSize = chunk_size
+        self.compressionLevel = compression_level
+        self.chunkBuffer = []
+        self.chunkBytes = 0
+        self.dataBlocks = []  # (address, offset in uncompressed data) of the written unsorted data blocks
+        self.dataOffset = 0
+        self.cg4BlockList = []
+        self.dg4BlockList = []
+        self.hd4Block = None
+        self.conversions = {}
+        self.txBlocks = {}
+        self.startTimePointer = 0
+        self.backgroundCompression = background_compression
+        self.compressionQueue = queue.Queue(queue_size)
+        self.compressionThread = None
+        self.compressionError = None
+        self.fileLock = threading.Lock()
+        self.groupChunks = {}  # record ID -> packed records of the group's current chunk
+        self.groupChunkBytes = {}
+        self.groupOffsets = {}
+        self.groupDataBlocks = {}  # record ID -> (address, offset in uncompressed data) of the group's data blocks
+
+    def start_file(self):
+        """Method to write header and respective pointers to tie everything together."""
+        MDF.start_file(self)
+        if self.backgroundCompression:
+            self.compressionThread = threading.Thread(target=self._compression_worker, name="mdf4-compression")
+            self.compressionThread.daemon = True
+            self.compressionThread.start()
+
+    def _patch_start_time(self):
+        """Rewrites hd_start_time_ns of the written HD block."""
+        with self.fileLock:
+            self.file.seek(self.startTimePointer)
+            self._write_to_file(UINT64.pack(self.HDBlock.startTimeNs))
+            self.file.seek(0, 2)
+
+    def _finish_file(self):
+        """Called by close_file. Writes the remaining data blocks, links them, patches the cycle counts and marks the
+        file as finalized. Without it the record counts are missing and the file stays marked as unfinalized. The file
+        is closed even if the compression worker failed."""
+        try:
+            if self.sortedOutput and self.backgroundCompression:
+                for cg_block in self.cgBlockList:
+                    if self.groupChunkBytes.get(cg_block.recordID):
+                        self._flush_group_chunk(cg_block)
+                self._stop_compression_worker()
+                for cg_block, dg_block in zip(self.cgBlockList, self.dg4BlockList):
+                    self._link_data_blocks(dg_block, self.groupDataBlocks.get(cg_block.recordID, []), self.compression)
+            elif self.sortedOutput:
+                self._write_sorted_data()
+            else:
+                if self.chunkBytes:
+                    self._flush_chunk()
+                self._stop_compression_worker()
+                self._link_data_blocks(self.dg4BlockList[0], self.dataBlocks, self._unsorted_zip_type())
+            for cg_block, cg4_block in zip(self.cgBlockList, self.cg4BlockList):
+                self.file.seek(cg4_block.address + CGBlock.CYCLE_COUNT_OFFSET)
+                self._write_to_file(UINT64.pack(cg_block.numberOfRecords))
+            self.IDBlock.unfinishedFlags = 0
+            self.file.seek(0)
+            self._write_to_file(self.IDBlock.pack())
+        finally:
+            self._stop_compression_worker(raise_error=False)
+            self.file.close()
+
+    def _write_header(self):
+        """Lays out the complete MDF 4 header and writes it in one piece. Every block gets its address before anything
+        is packed, so all links are written in place. Only the data links and cycle counts are patched at close."""
+        blocks = []
+        self.cg4BlockList = []
+        self.dg4BlockList = []
+        hd_block = HDBlock(self.HDBlock.startTimeNs)
+        hd_block.MDPointer = MDBlock(HD_COMMENT.format(_escape(_strip(self.TXBlock.text)),
+                                                       _escape(_strip(self.HDBlock.author)),
+                                                       _escape(_strip(self.HDBlock.project)),
+                                                       _escape(_strip(self.HDBlock.dut))))
+        fh_block = FHBlock(hd_block.startTimeNs)
+        fh_block.MDPointer = MDBlock(FH_COMMENT.format(_escape(__version__)))
+        hd_block.firstFHPointer = fh_block
+        blocks.extend([hd_block, hd_block.MDPointer, fh_block, fh_block.MDPointer])
+
+        self.hd4Block = hd_block
+        self.conversions = {}  # MDF 3 CC block -> its MDF 4 CC block, shared like the MDF 3 blocks
+        self.txBlocks = {}  # text -> TX block, every text is written once
+        for cg_block in self.cgBlockList:
+            blocks.extend(self._group_blocks(cg_block)[0])
+
+        address = IDBlock.BLOCKSIZE
+        for block in blocks:
+            block.address = address
+            address = align(address + block.size())
+        self.startTimePointer = hd_block.address + HDBlock.START_TIME_OFFSET
+        self.IDBlock.unfinishedFlags = IDBlock.UNFIN_CYCLE_COUNTERS
+        header = [self.IDBlock.pack()]
+        for block in blocks:
+            data = block.pack()
+            header.append(data + b'\0' * (align(len(data)) - len(data)))
+        self.file.seek(0)
+        self._write_to_file(b''.join(header))
+        self.datapointer = self.file.tell()
+
+    def _write_pointers(self):
+        """All MDF 4 links are resolved while _write_header lays out the blocks, nothing to patch."""
+        pass
+
+    def _group_blocks(self, cg_block):
+        """Builds the MDF 4 blocks of a channel group: a new DG block in sorted mode (or for the first group), the CG
+        block and the blocks of its channels, and links them behind the last DG or CG block. Returns the new blocks
+        and the block whose first link now points to them (HD, previous DG or previous CG block)."""
+        blocks = []
+        if not self.dg4BlockList or self.sortedOutput:
+            dg_block = DGBlock(0 if self.sortedOutput else 1)
+            if self.dg4BlockList:
+                linking_block = self.dg4BlockList[-1]
+                linking_block.nextDGPointer = dg_block
+            else:
+                linking_block = self.hd4Block
+                linking_block.firstDGPointer = dg_block
+            self.dg4BlockList.append(dg_block)
+            blocks.append(dg_block)
+        else:
+            dg_block = self.dg4BlockList[-1]
+        cg4_block = CGBlock(0 if self.sortedOutput else cg_block.recordID, self._record_size(cg_block))
+        cg4_block.acqNamePointer = self._text_block(cg_block.name, blocks)
+        if blocks and blocks[0] is dg_block:
+            dg_block.firstCGPointer = cg4_block
+        else:
+            linking_block = self.cg4BlockList[-1]
+            linking_block.nextCGPointer = cg4_block
+        self.cg4BlockList.append(cg4_block)
+        blocks.append(cg4_block)
+        previous_cn = None
+        for cn_block in cg_block.cnBlockList:
+            cn4_block, channel_blocks = self._channel_blocks(cn_block, self.conversions)
+            if previous_cn is None:
+                cg4_block.firstCNPointer = cn4_block
+            else:
+                previous_cn.nextCNPointer = cn4_block
+            previous_cn = cn4_block
+            blocks.extend(channel_blocks)
+        return blocks, linking_block
+
+    def _write_late_group(self, cg_block):
+        """MDF 4 blocks can be anywhere in the file, so the blocks of a group added after start_file are appended
+        behind the data written so far and the previous link is patched. Called with the write lock held."""
+        blocks, linking_block = self._group_blocks(cg_block)
+        with self.fileLock:
+            self.file.seek(0, 2)
+            address = start = align(self.file.tell())
+            data = [b'\0' * (start - self.file.tell())]
+            for block in blocks:
+                block.address = address
+                address = align(address + block.size())
+            for block in blocks:
+                packed = block.pack()
+                data.append(packed + b'\0' * (align(len(packed)) - len(packed)))
+            self._write_to_file(b''.join(data))
+            # The first link of HD, DG and CG blocks is the one to the next block
+            self.file.seek(linking_block.address + BLOCK_HEADER.size)
+            self._write_to_file(LINK.pack(linking_block.links()[0]))
+            self.file.seek(0, 2)
+
+    def _channel_blocks(self, cn_block, conversions):
+        """Translates an MDF 3 CN/CC block pair built by add_channel_group into MDF 4 blocks.
+        Returns the CN block and the list of all new blocks. CC blocks already in conversions are linked, not copied."""
+        cc_block = cn_block.ccBlock
+        master = cn_block.channelType == 1
+        cn4_block = CNBlock(2 if master else 0, DATA_TYPE[cn_block.signalType], cn_block.firstBitNo,
+                            cn_block.numberOfBits)
+        blocks = [cn4_block]
+        cn4_block.namePointer = self._text_block(cn_block.longName or _strip(cn_block.signalName), blocks)
+        if cn_block.valueRangeBool:
+            cn4_block.flags |= CNBlock.VALUE_RANGE_VALID
+            cn4_block.valRangeMin = cn_block.minValue
+            cn4_block.valRangeMax = cn_block.maxValue
+        description = cn_block.longDescription or _strip(cn_block.signalDescription)
+        if description:
+            cn4_block.MDPointer = self._text_block(description, blocks)
+        unit = _strip(cc_block.physUnit)
+        if unit:
+            cn4_block.unitPointer = self._text_block(unit, blocks)
+        if cc_block in conversions:
+            cc4_block = conversions[cc_block]
+            if cc4_block is not None:
+                cn4_block.conversionPointer = cc4_block
+            return cn4_block, blocks
+        if cc_block.conversionID == 11:
+            texts = [self._text_block(_strip(text), blocks) for text in cc_block.paramList[0::2]]
+            cc4_block = CCBlock(CCBlock.VALUE_TO_TEXT, cc_block.paramList[1::2], texts + [0])
+        elif cc_block.conversionID == 0 and list(cc_block.paramList) != [0, 1]:
+            cc4_block = CCBlock(CCBlock.LINEAR, cc_block.paramList)
+        else:
+            cc4_block = None
+        if cc4_block is not None:
+            if cc_block.valueRangeBool:
+                cc4_block.flags |= CCBlock.PHYSICAL_RANGE_VALID
+                cc4_block.phyRangeMin = cc_block.minValue
+                cc4_block.phyRangeMax = cc_block.maxValue
+            cn4_block.conversionPointer = cc4_block
+            blocks.append(cc4_block)
+        conversions[cc_block] = cc4_block
+        return cn4_block, blocks
+
+    def _text_block(self, text, blocks):
+        """Returns the TX block of text for the header laid out in _write_header. A new block is appended to blocks,
+        equal texts (names, units, value table entries) link to the same block."""
+        tx_block = self.txBlocks.get(text)
+        if tx_block is None:
+            tx_block = self.txBlocks[text] = TXBlock(text)
+            blocks.append(tx_block)
+        return tx_block
+
+    def _append_record(self, cg_block, packet):
+        """Collects records into the current chunk and writes the chunk once it is full. Sorted records go to the
+        spill buffers, or to their group's own chunk with background compression."""
+        if self.sortedOutput:
+            if self.backgroundCompression:
+                key = cg_block.recordID
+                self.groupChunks.setdefault(key, []).append(packet)
+                self.groupChunkBytes[key] = self.groupChunkBytes.get(key, 0) + len(packet)
+                if self.groupChunkBytes[key] >= self.chunkSize:
+                    self._flush_group_chunk(cg_block)
+            else:
+                self.spillBuffer.append(cg_block.recordID, packet)
+            return
+        self.chunkBuffer.append(packet)
+        self.chunkBytes += len(packet)
+        if self.chunkBytes >= self.chunkSize:
+            self._flush_chunk()
+
+    def _flush_chunk(self):
+        """Writes the current unsorted chunk as one data block."""
+        data = b''.join(self.chunkBuffer)
+        self.chunkBuffer = []
+        self.chunkBytes = 0
+        self._submit_chunk(self.dataBlocks, data, self.dataOffset, self._unsorted_zip_type())
+        self.dataOffset += len(data)
+
+    def _flush_group_chunk(self, cg_block):
+        """Writes the current chunk of a sorted group (background compression) as one data block of its DG."""
+        key = cg_block.recordID
+        data = b''.join(self.groupChunks.pop(key))
+        self.groupChunkBytes[key] = 0
+        offset = self.groupOffsets.get(key, 0)
+        self.groupOffsets[key] = offset + len(data)
+        self._submit_chunk(self.groupDataBlocks.setdefault(key, []), data, offset, self.compression,
+                           self._record_size(cg_block))
+
+    def _submit_chunk(self, data_blocks, data, offset, zip_type, columns=0):
+        """Writes a chunk as data block and appends (address, offset) to data_blocks, either right away or, with
+        background compression, in the worker thread. Chunks are written in the order they are submitted."""
+        if not self.backgroundCompression:
+            data_blocks.append((self._write_data_block(data, zip_type, columns), offset))
+            return
+        if self.compressionError is not None:
+            raise self.compressionError
+        if self.metrics is None:
+            self.compressionQueue.put((data_blocks, data, offset, zip_type, columns))
+        else:
+            start = clock()
+            self.compressionQueue.put((data_blocks, data, offset, zip_type, columns))
+            self.metrics.queueWait.add(clock() - start)
+
+    def _compression_worker(self):
+        """Background thread: compresses the submitted chunks and appends them to the file. zlib releases the GIL
+        while deflating, so logging continues in parallel."""
+        while True:
+            job = self.compressionQueue.get()
+            if job is None:
+                break
+            data_blocks, data, offset, zip_type, columns = job
+            if self.compressionError is not None:
+                continue
+            try:
+                block = self._data_block(data, zip_type, columns)
+                with self.fileLock:
+                    data_blocks.append((self._append_block(block, timed=False), offset))
+            except Exception as error:
+                self.compressionError = error
+
+    def _queue_depth(self):
+        return self.compressionQueue.qsize()
+
+    def _stop_compression_worker(self, raise_error=True):
+        """Waits until the worker thread has written all submitted chunks, and raises the error of a failed chunk if
+        raise_error is set."""
+        if self.compressionThread is None:
+            return
+        self.compressionQueue.put(None)
+        self.compressionThread.join()
+        self.compressionThread = None
+        if raise_error and self.compressionError is not None:
+            raise self.compressionError
+
+    def _unsorted_zip_type(self):
+        """Unsorted records have different sizes, so transposition does not apply to them."""
+        return None if self.compression is None else DEFLATE
+
+    def _data_block(self, data, zip_type, columns=0):
+        """Returns data as a DT block, or as a DZ block if zip_type is set. Data that does not get smaller when
+        compressed is stored as a DT block."""
+        if zip_type is not None:
+            block = DZBlock(data, zip_type, columns, self.compressionLevel)
+            if block.dataLength < len(data):
+                return block
+        return DTBlock(data)
+
+    def _write_data_block(self, data, zip_type, columns=0):
+        """Appends data as a DT or DZ block and returns the block address."""
+        return self._append_block(self._data_block(data, zip_type, columns))
+
+    def _append_block(self, block, timed=True):
+        """Writes block 8 byte aligned at the end of the file and returns its address.
+        :param bool timed: Record the write in the fileWrite metrics. The compression worker does not, the metrics are
+            only updated by the threads that hold the write lock.
+        """
+        self.file.seek(0, 2)
+        block.address = align(self.file.tell())
+        data = b'\0' * (block.address - self.file.tell()) + block.pack()
+        if timed:
+            self._write_data(data)
+        else:
+            self._write_to_file(data)
+        return block.address
+
+    def _link_data_blocks(self, dg_block, data_blocks, zip_type):
+        """Links a DG block to its data blocks. A single uncompressed block is linked directly, otherwise a DL block
+        (behind an HL block for compressed data) lists the blocks with their offsets in the uncompressed data."""
+        if not data_blocks:
+            return
+        if len(data_blocks) == 1 and zip_type is None:
+            pointer = data_blocks[0][0]
+        else:
+            dl_block = DLBlock([block[0] for block in data_blocks], [block[1] for block in data_blocks])
+            pointer = self._append_block(dl_block)
+            if zip_type is not None:
+                hl_block = HLBlock(zip_type)
+                hl_block.firstDLPointer = pointer
+                pointer = self._append_block(hl_block)
+        self.file.seek(dg_block.address + DGBlock.DATA_POINTER_OFFSET)
+        self._write_to_file(LINK.pack(pointer))
+        self.file.seek(0, 2)
+
+    def _write_sorted_data(self):
+        """Called by close_file in sorted mode. Writes the buffered records of every ChannelGroup as the data blocks
+        of its own DG block."""
+        for cg_block, dg_block in zip(self.cgBlockList, self.dg4BlockList):
+            size = self.spillBuffer.size(cg_block.recordID)
+            if size == 0:
+                continue
+            record_size = self._record_size(cg_block)
+            data_blocks = []
+            if self.compression is None:
+                # One DT block per group, copied straight from the spill buffer
+                self.file.seek(0, 2)
+                address = align(self.file.tell())
+                self._write_to_file(b'\0' * (address - self.file.tell()) +
+                                    BLOCK_HEADER.pack(DTBlock.BLOCKID, BLOCK_HEADER.size + size, 0))
+                self.spillBuffer.write_to(cg_block.recordID, self.file)
+                data_blocks.append((address, 0))
+            else:
+                offset = 0
+                chunk_size = max(1, self.chunkSize // record_size) * record_size
+                for chunk in self.spillBuffer.read_chunks(cg_block.recordID, chunk_size):
+                    data_blocks.append((self._write_data_block(chunk, self.compression, record_size), offset))
+                    offset += len(chunk)
+            self._link_data_blocks(dg_block, data_blocks, self.compression)
+        self.spillBuffer.close()
@@ -0,0 +1,294 @@
+"""This file contains the block structures for MDF 4.1 files. Unlike the MDF 3 blocks in mdfblocks.py, every MDF 4 block
+starts with the same 24 byte header and all links are 64 bit. A link attribute holds either a file offset or another
+block; the block is resolved to its address when the linking block is packed, so a header can be laid out completely
+before it is written.
+Altering contents of file can result in writing a corrupt file."""
+import struct
+from .compression import compress
+
+BLOCK_HEADER = struct.Struct('<4s4xQQ')
+ID_BLOCK = struct.Struct('<8s8s8s4xH30xHH')
+
+
+def align(offset):
+    """Rounds offset up to the next multiple of 8. All MDF 4 blocks start 8 byte aligned."""
+    return (offset + 7) & ~7
+
+
+class IDBlock:
+    FILEID = b"MDF     "
+    UNFINISHED_FILEID = b"UnFinMF "
+    FORMATID = b"4.10    "
+    PROGRAMID = b"SAMDALEO"
+    VERSIONNO = 410
+    BLOCKSIZE = 64
+    UNFIN_CYCLE_COUNTERS = 1  # id_unfin_flags bit 0: cycle counters of CG blocks not updated
+
+    def __init__(self):
+        self.unfinishedFlags = 0
+
+    def pack(self):
+        file_id = self.UNFINISHED_FILEID if self.unfinishedFlags else self.FILEID
+        return ID_BLOCK.pack(file_id, self.FORMATID, self.PROGRAMID, self.VERSIONNO, self.unfinishedFlags, 0)
+
+
+class Block(object):
+    BLOCKID = b"##__"
+    LINKS = ()
+    FIELDS = ()
+    DATA = struct.Struct('<')
+
+    def __init__(self):
+        self.address = 0
+        for name in self.LINKS:
+            setattr(self, name, 0)
+
+    def links(self):
+        """Link values in file order. Linked blocks are replaced by their address."""
+        return [self._address_of(getattr(self, name)) for name in self.LINKS]
+
+    def data(self):
+        """Packed data section of the block."""
+        return self.DATA.pack(*[getattr(self, name) for name in self.FIELDS])
+
+    def link_count(self):
+        return len(self.LINKS)
+
+    def data_size(self):
+        return self.DATA.size
+
+    def size(self):
+        """Block length in bytes, known before any address is assigned."""
+        return BLOCK_HEADER.size + 8 * self.link_count() + self.data_size()
+
+    def pack(self):
+        links = self.links()
+        return (BLOCK_HEADER.pack(self.BLOCKID, self.size(), len(links)) + struct.pack('<%dq' % len(links), *links)
+                + self.data())
+
+    @staticmethod
+    def _address_of(link):
+        if isinstance(link, Block):
+            return link.address
+        return link
+
+
+class HDBlock(Block):
+    BLOCKID = b"##HD"
+    LINKS = ('firstDGPointer', 'firstFHPointer', 'firstCHPointer', 'firstATPointer', 'firstEVPointer', 'MDPointer')
+    FIELDS = ('startTimeNs', 'tzOffsetMin', 'dstOffsetMin', 'timeFlags', 'timeClass', 'flags', 'startAngle',
+              'startDistance')
+    DATA = struct.Struct('<QhhBBBxdd')
+    START_TIME_OFFSET = 72  # bytes from block start to hd_start_time_ns
+
+    def __init__(self, start_time_ns):
+        Block.__init__(self)
+        self.startTimeNs = start_time_ns
+        self.tzOffsetMin = 0
+        self.dstOffsetMin = 0
+        self.timeFlags = 0  # 0 = start time is UTC
+        self.timeClass = 0
+        self.flags = 0
+        self.startAngle = 0
+        self.startDistance = 0
+
+
+class FHBlock(Block):
+    BLOCKID = b"##FH"
+    LINKS = ('nextFHPointer', 'MDPointer')
+    FIELDS = ('timeNs', 'tzOffsetMin', 'dstOffsetMin', 'timeFlags')
+    DATA = struct.Struct('<QhhB3x')
+
+    def __init__(self, time_ns):
+        Block.__init__(self)
+        self.timeNs = time_ns
+        self.tzOffsetMin = 0
+        self.dstOffsetMin = 0
+        self.timeFlags = 0
+
+
+class TXBlock(Block):
+    BLOCKID = b"##TX"
+
+    def __init__(self, text):
+        Block.__init__(self)
+        if not isinstance(text, bytes):
+            text = text.encode('utf-8')
+        self.text = text
+
+    def data(self):
+        data = self.text + b'\0'
+        return data + b'\0' * (align(len(data)) - len(data))
+
+    def data_size(self):
+        return align(len(self.text) + 1)
+
+
+class MDBlock(TXBlock):
+    BLOCKID = b"##MD"
+
+
+class DGBlock(Block):
+    BLOCKID = b"##DG"
+    LINKS = ('nextDGPointer', 'firstCGPointer', 'dataPointer', 'MDPointer')
+    FIELDS = ('recordIDSize',)
+    DATA = struct.Struct('<B7x')
+    DATA_POINTER_OFFSET = 40  # bytes from block start to dg_data
+
+    def __init__(self, record_id_size=1):
+        Block.__init__(self)
+        self.recordIDSize = record_id_size  # 1 = UINT8 record ID before each data record, 0 = sorted
+
+
+class CGBlock(Block):
+    BLOCKID = b"##CG"
+    LINKS = ('nextCGPointer', 'firstCNPointer', 'acqNamePointer', 'acqSourcePointer', 'firstSRPointer', 'MDPointer')
+    FIELDS = ('recordID', 'cycleCount', 'flags', 'pathSeparator', 'dataBytes', 'invalBytes')
+    DATA = struct.Struct('<QQHH4xII')
+    CYCLE_COUNT_OFFSET = 80  # bytes from block start to cg_cycle_count
+
+    def __init__(self, record_id, data_bytes):
+        Block.__init__(self)
+        self.recordID = record_id
+        self.cycleCount = 0
+        self.flags = 0
+        self.pathSeparator = 0
+        self.dataBytes = data_bytes
+        self.invalBytes = 0
+
+
+class CNBlock(Block):
+    BLOCKID = b"##CN"
+    LINKS = ('nextCNPointer', 'compositionPointer', 'namePointer', 'sourcePointer', 'conversionPointer',
+             'dataPointer', 'unitPointer', 'MDPointer')
+    FIELDS = ('channelType', 'syncType', 'dataType', 'bitOffset', 'byteOffset', 'bitCount', 'flags', 'invalBitPos',
+              'precision', 'attachmentCount', 'valRangeMin', 'valRangeMax', 'limitMin', 'limitMax', 'limitExtMin',
+              'limitExtMax')
+    DATA = struct.Struct('<BBBBIIIIBxHdddddd')
+    VALUE_RANGE_VALID = 8  # cn_flags bit 3
+
+    def __init__(self, channel_type, data_type, bit_position, bit_count):
+        Block.__init__(self)
+        self.channelType = channel_type  # 0 = fixed length data channel, 2 = master channel
+        self.syncType = 1 if channel_type == 2 else 0  # 1 = time
+        self.dataType = data_type
+        self.bitOffset = bit_position % 8
+        self.byteOffset = bit_position // 8
+        self.bitCount = bit_count
+        self.flags = 0
+        self.invalBitPos = 0
+        self.precision = 0
+        self.attachmentCount = 0
+        self.valRangeMin = 0
+        self.valRangeMax = 0
+        self.limitMin = 0
+        self.limitMax = 0
+        self.limitExtMin = 0
+        self.limitExtMax = 0
+
+
+class CCBlock(Block):
+    BLOCKID = b"##CC"
+    LINKS = ('namePointer', 'unitPointer', 'MDPointer', 'inversePointer')
+    FIELDS = ('conversionType', 'precision', 'flags', 'refCount', 'valCount', 'phyRangeMin', 'phyRangeMax')
+    DATA = struct.Struct('<BBHHHdd')
+    LINEAR = 1
+    VALUE_TO_TEXT = 7
+    PHYSICAL_RANGE_VALID = 2  # cc_flags bit 1
+
+    def __init__(self, conversion_type, values, refs=None):
+        Block.__init__(self)
+        self.conversionType = conversion_type
+        self.precision = 0
+        self.flags = 0
+        self.values = list(values)
+        self.refs = list(refs) if refs is not None else []
+        self.refCount = len(self.refs)
+        self.valCount = len(self.values)
+        self.phyRangeMin = 0
+        self.phyRangeMax = 0
+
+    def links(self):
+        return Block.links(self) + [self._address_of(ref) for ref in self.refs]
+
+    def link_count(self):
+        return len(self.LINKS) + len(self.refs)
+
+    def data(self):
+        return Block.data(self) + struct.pack('<%dd' % len(self.values), *self.values)
+
+    def data_size(self):
+        return self.DATA.size + 8 * len(self.values)
+
+
+class DTBlock(Block):
+    BLOCKID = b"##DT"
+
+    def __init__(self, data):
+        Block.__init__(self)
+        self.records = data
+
+    def data(self):
+        return self.records
+
+    def data_size(self):
+        return len(self.records)
+
+
+class DZBlock(Block):
+    BLOCKID = b"##DZ"
+    FIELDS = ('orgBlockType', 'zipType', 'zipParameter', 'orgDataLength', 'dataLength')
+    DATA = struct.Struct('<2sBxIQQ')
+
+    def __init__(self, data, zip_type, columns=0, level=6):
+        Block.__init__(self)
+        self.orgBlockType = b"DT"
+        self.zipType = zip_type
+        self.zipParameter = columns
+        self.orgDataLength = len(data)
+        self.compressed = compress(data, zip_type, columns, level)
+        self.dataLength = len(self.compressed)
+
+    def data(self):
+        return Block.data(self) + self.compressed
+
+    def data_size(self):
+        return self.DATA.size + self.dataLength
+
+
+class DLBlock(Block):
+    BLOCKID = b"##DL"
+    LINKS = ('nextDLPointer',)
+    FIELDS = ('flags', 'count')
+    DATA = struct.Struct('<B3xI')
+
+    def __init__(self, data_blocks, offsets):
+        Block.__init__(self)
+        self.dataBlocks = list(data_blocks)
+        self.offsets = list(offsets)
+        self.flags = 0  # 0 = every data block has its own offset
+        self.count = len(self.dataBlocks)
+
+    def links(self):
+        return Block.links(self) + [self._address_of(block) for block in self.dataBlocks]
+
+    def link_count(self):
+        return len(self.LINKS) + len(self.dataBlocks)
+
+    def data(self):
+        return Block.data(self) + struct.pack('<%dQ' % len(self.offsets), *self.offsets)
+
+    def data_size(self):
+        return self.DATA.size + 8 * len(self.offsets)
+
+
+class HLBlock(Block):
+    BLOCKID = b"##HL"
+    LINKS = ('firstDLPointer',)
+    FIELDS = ('flags', 'zipType')
+    DATA = struct.Struct('<HB5x')
+
+    def __init__(self, zip_type):
+        Block.__init__(self)
+        self.flags = 0
+        self.zipType = zip_type
@@ -1,18 +1,19 @@
 """This file contains the block structures for the MDF file to be written correctly. Altering contents of file
 can result in writing a corrupt file.
 Author: Samuel Daleo, III"""
+import calendar
 import time
-from utils import formatstring
+from .utils import encode_field, time_ns, monotonic_ns
 
 
 class IDBlock:
-    FILEID = "MDF     "
-    FORMATID = "3.31    "
-    PROGRAMID = "SAMDALEO"
+    FILEID = b"MDF     "
+    FORMATID = b"3.31    "
+    PROGRAMID = b"SAMDALEO"
     BYTEORDER = 0
     FLOATFORMAT = 0
     VERSIONNO = 331
-    RESERVED = formatstring("", 34)
+    RESERVED = encode_field("", 34)
     BLOCKSIZE = 64
     
     def __init__(self):
@@ -20,45 +21,64 @@ class IDBlock:
 
 
 class HDBlock:
-    BLOCKID = "HD"
-    BLOCKSIZE = 164
-    ORG = "TESLA                           "
+    BLOCKID = b"HD"
+    BLOCKSIZE = 208  # MDF 3.2+ layout with the nanosecond start time
+    ORG = b"TESLA                           "
+    TIME_QUALITY = 0  # local PC reference time
+    TIMER_ID = encode_field("Local PC Reference Time", 32)
     
-    def __init__(self, author, project, dut):
-        self.firstDGPointer = 228
-        self.firstTXPointer = 228
+    def __init__(self, author, project, dut, start_time_ns=None):
+        self.firstDGPointer = 272
+        self.firstTXPointer = 272
         self.firstPRPointer = 0
         self.numberOfDGs = 1
-        self.date = time.strftime('%d' + ":" + "%m" + ":" + "%Y")
-        self.time = time.strftime('%X')
-        self.author = formatstring(author, 32)
-        self.project = formatstring(project, 32)
-        self.dut = formatstring(dut, 32)
+        self.author = encode_field(author, 32)
+        self.project = encode_field(project, 32)
+        self.dut = encode_field(dut, 32)
+        self.set_start_time(time_ns() if start_time_ns is None else start_time_ns)
+
+    def set_start_time(self, start_time_ns):
+        """Sets the date and time strings, UTC offset and nanosecond timestamp of the recording start.
+        :param int start_time_ns: Nanoseconds since 01.01.1970 UTC
+        """
+        seconds = start_time_ns // 1000000000
+        local = time.localtime(seconds)
+        self.startTimeNs = start_time_ns
+        self.date = time.strftime('%d:%m:%Y', local)
+        self.time = time.strftime('%H:%M:%S', local)
+        self.utcOffsetSeconds = calendar.timegm(local) - seconds
+        self.utcOffset = self.utcOffsetSeconds // 3600  # whole hours of the INT16 field
+
+    def local_time_ns(self):
+        """Start time as stored in the HD block: nanoseconds since 01.01.1970 local time. Uses the exact UTC offset, so
+        it matches the date and time strings in zones that are not a whole number of hours from UTC."""
+        return self.startTimeNs + self.utcOffsetSeconds * 1000000000
 
 
 class TXBlock:
-    BLOCKID = "TX"
+    BLOCKID = b"TX"
     
     def __init__(self, text):
-        self.text = text
+        self.text = text  # NULL terminated bytes
         self.blocksize = len(text) + 4
+        self.address = 0  # set when the block is written
 
 
 class DGBlock:
-    BLOCKID = "DG"
+    BLOCKID = b"DG"
     BLOCKSIZE = 28
     
-    def __init__(self):
+    def __init__(self, number_of_record_ids=1):
         self.nextDGPointer = 0
         self.nextCGPointer = 256
         self.reserved = 0
         self.dataPointer = 0
         self.numberofCGs = 0
-        self.numberofRecordIDs = 1  # Record ID before each data record
+        self.numberofRecordIDs = number_of_record_ids  # 1 = Record ID before each data record, 0 = sorted
 
 
 class CGBlock:
-    BLOCKID = "CG"
+    BLOCKID = b"CG"
     BLOCKSIZE = 26
     
     def __init__(self, dg_block, record_id):
@@ -72,6 +92,10 @@ class CGBlock:
         self.numberOfRecords = 0
         self.name = ""
         self.isCAN = False
+        self.payloadSize = 0  # CAN payload bytes of CAN groups
+        self.messageID = 0  # CAN arbitration ID of CAN groups
+        self.policy = None  # RecordingPolicy of the group, see MDF.set_recording_policy
+        self.commentBlock = None  # TXBlock with the name of the group
         self.isString = False
         dg_block.numberofCGs += 1
 
@@ -80,37 +104,37 @@ class CGBlock:
 
 
 class CNBlock:
-    BLOCKID = "CN"
+    BLOCKID = b"CN"
     BLOCKSIZE = 228
     
     def __init__(self, cg, channel_type, signal_name=None, signal_description=None):
         self.nextCNPointer = 0
         self.CCPointer = 0
+        self.ccBlock = None  # CCBlock of the channel, possibly shared with other channels
+        self.ceBlock = None  # CEBlock of CAN signals
         self.CEPointer = 0
         self.reserved = 0
         self.TXPointer = 0
         self.channelTitle = channel_type.upper()
-        self.signal_name = chr(0)*32
-        self.signal_description = chr(0)*128
+        if signal_name is None:
+            signal_name = ""
+        if signal_description is None:
+            signal_description = ""
+        self.signalName = encode_field("", 32)
+        self.signalDescription = encode_field("", 128)
         self.numberOfBits = 0
         self.firstBitNo = 64
         if channel_type == "TIME":
-            self.channel_type = 1
+            self.channelType = 1
             self.numberOfBits = 64
             self.firstBitNo = 0
-            self.signal_name = formatstring("TimeChannel", 32)
-            self.signal_description = formatstring(signal_description, 128)
+            self.signalName = encode_field("TimeChannel", 32)
+            self.signalDescription = encode_field(signal_description, 128)
             self.signalType = 3
         elif channel_type == "DATA":
-            self.channel_type = 0
-            if signal_name is not None:
-                self.signal_name = formatstring(signal_name, 32)
-            else:
-                self.signal_name = formatstring("", 32)
-            if signal_description is not None:
-                self.signal_description = formatstring(signal_description, 128)
-            else:
-                self.signal_description = formatstring("", 128)
+            self.channelType = 0
+            self.signalName = encode_field(signal_name, 32)
+            self.signalDescription = encode_field(signal_description, 128)
             self.signalType = 2
             self.numberOfBits = 32
             start_bit = 0
@@ -118,18 +142,21 @@ class CNBlock:
                 start_bit = start_bit + cg.cnBlockList[i].numberOfBits
                 self.firstBitNo = start_bit
         elif channel_type == "CAN":
-            self.channel_type = 0
-            self.signal_name = formatstring(signal_name, 32)
-            self.signal_description = formatstring(signal_description, 128)
+            self.channelType = 0
+            self.signalName = encode_field(signal_name, 32)
+            self.signalDescription = encode_field(signal_description, 128)
             self.signalType = 0
             self.numberOfBits = 0
             self.firstBitNo = 64
         elif channel_type == "STRING":
-            self.channel_type = 0
-            self.signal_name = self.signal_name = formatstring(signal_name, 32)
-            self.signal_description = formatstring(signal_description, 128)
+            self.channelType = 0
+            self.signalName = encode_field(signal_name, 32)
+            self.signalDescription = encode_field(signal_description, 128)
             self.signalType = 7
-            self.firstBitNo = 64
+            start_bit = 0
+            for i in range(len(cg.cnBlockList)):
+                start_bit = start_bit + cg.cnBlockList[i].numberOfBits
+                self.firstBitNo = start_bit
         self.valueRangeBool = 0    # 0 = false, 1 = true
         self.minValue = 0
         self.maxValue = 0
@@ -137,35 +164,52 @@ class CNBlock:
         self.ASAMPointer = 0
         self.TXPointer2 = 0
         self.byteOffset = 0
+        # Names and descriptions too long for their fixed fields are kept whole in shared TX blocks, which MDF links
+        # as long signal name (ASAMPointer) and comment (TXPointer)
+        self.longName = signal_name if len(signal_name) > 31 else None
+        self.longDescription = signal_description if len(signal_description) > 127 else None
+        self.longNameBlock = None
+        self.longDescriptionBlock = None
 
 
 class CCBlock:
-    BLOCKID = "CC"
+    BLOCKID = b"CC"
     
     def __init__(self, cn, unit):
         self.valueRangeBool = 0    # 0 = false, 1 = true
         self.minValue = 0
         self.maxValue = 0
-        self.conversionID = 0    # 0 = parametric, linear, 11 = VTAB
+        self.conversionID = 0    # 0 = parametric, linear, 11 = VTAB, 65535 = 1:1
         self.blockSize = 46
-        self.physUnit = formatstring(unit, 20)
+        self.physUnit = encode_field(unit, 20)
         if cn.channelTitle == "TIME" or cn.channelTitle == "DATA":
             self.paramList = [0, 1]
             self.pairs = 2
             self.blockSize = 62
+        elif cn.channelTitle == "STRING":
+            self.conversionID = 65535  # 1:1, no conversion
+            self.paramList = []
+            self.pairs = 0
         else:
             self.paramList = []
             self.pairs = 0
             self.blockSize = 46
+        self.address = 0  # set when the block is laid out in a file
+
+    def key(self):
+        """Content of the block. CC blocks with equal keys are written once and shared by all their channels."""
+        return (self.conversionID, self.physUnit, self.valueRangeBool, self.minValue, self.maxValue,
+                tuple(self.paramList))
 
 
 class CEBlock:
-    BLOCKID = "CE"
+    BLOCKID = b"CE"
     BLOCKSIZE = 128
     EXTENSIONID = 19
     
     def __init__(self, can_id, can_index, message_name, sender_name):
         self.canID = can_id
         self.canIndex = can_index
-        self.messageName = formatstring(message_name, 36)
-        self.senderName = formatstring(sender_name, 78)
+        self.messageName = encode_field(message_name, 36)
+        self.senderName = encode_field(sender_name, 78)
+        self.address = 0  # set when the block is laid out in a file
@@ -0,0 +1,122 @@
+"""Runtime metrics of the MDF writers. An MDFMetrics object is attached with MDF.enable_metrics(); without one the
+write path only checks for None, so disabled metrics cost next to nothing."""
+import time
+
+# Monotonic high resolution clock where available
+clock = getattr(time, 'perf_counter', time.time)
+
+
+class Histogram(object):
+    """Latency histogram with power of two buckets in microseconds. Bucket n counts durations below 2**n us, the last
+    bucket also holds everything longer.
+    """
+    BUCKETS = 27  # last bucket starts at ~33 s
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * self.BUCKETS
+
+    def add(self, seconds):
+        """Adds one duration.
+        :param float seconds: Duration in seconds
+        """
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        index = int(seconds * 1000000).bit_length()
+        if index >= self.BUCKETS:
+            index = self.BUCKETS - 1
+        self.buckets[index] += 1
+
+    def percentile(self, fraction):
+        """Upper bound in seconds of the bucket that contains the given fraction (0-1) of all durations."""
+        if self.count == 0:
+            return 0.0
+        wanted = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= wanted:
+                return min(float(2 ** index) / 1000000, self.max)
+        return self.max
+
+    def snapshot(self):
+        """Returns the histogram as dictionary. Durations in seconds, buckets keyed by their upper bound in us."""
+        return {'count': self.count,
+                'total': self.total,
+                'mean': self.total / self.count if self.count else 0.0,
+                'max': self.max,
+                'p50': self.percentile(0.5),
+                'p99': self.percentile(0.99),
+                'buckets': dict((2 ** index, count) for index, count in enumerate(self.buckets) if count)}
+
+
+class MDFMetrics(object):
+    """Counters and latency histograms of one MDF object: records and bytes per ChannelGroup, time spent waiting for
+    and holding the write lock, latency of the file.write() calls of record data, rollover durations, queue depth and
+    wait of the background modes, dropped records and records removed by recording policies. The files are buffered,
+    so fileWrite mostly times copies into the file buffer, with the write syscall only in the calls that flush it.
+    Dropped records are counted by the writers that drop them: TriggeredMDF for records that leave its ring without a
+    trigger, CANBridge for unknown, error and remote frames, and LoadGenerator for frames over its max_lag.
+    :param callable callback: Called with a snapshot dictionary every interval seconds from the write path, and once
+        when the file is closed
+    :param float interval: Seconds between two callback calls
+    """
+    def __init__(self, callback=None, interval=10.0):
+        self.callback = callback
+        self.interval = interval
+        self.startTime = clock()
+        self.nextReport = self.startTime + interval
+        self.groupRecords = {}
+        self.groupBytes = {}
+        self.lockWait = Histogram()
+        self.lockHold = Histogram()
+        self.fileWrite = Histogram()
+        self.rollover = Histogram()
+        self.queueWait = Histogram()
+        self.droppedRecords = 0
+        self.filteredRecords = 0
+        self.queueDepth = None  # set by the MDF object, returns the number of queued chunks
+
+    def add_record(self, group_name, size):
+        """Counts one record of size bytes for group_name."""
+        self.groupRecords[group_name] = self.groupRecords.get(group_name, 0) + 1
+        self.groupBytes[group_name] = self.groupBytes.get(group_name, 0) + size
+
+    def add_dropped(self, count=1):
+        """Counts records that were not written."""
+        self.droppedRecords += count
+
+    def add_filtered(self, count):
+        """Counts records that a recording policy did not write."""
+        self.filteredRecords += count
+
+    def report(self, now=None):
+        """Calls the callback if the reporting interval has passed."""
+        if self.callback is None:
+            return
+        if now is None:
+            now = clock()
+        if now >= self.nextReport:
+            self.nextReport = now + self.interval
+            self.callback(self.snapshot())
+
+    def snapshot(self):
+        """Returns all metrics as a dictionary of plain values."""
+        groups = dict((name, {'records': self.groupRecords[name], 'bytes': self.groupBytes[name]})
+                      for name in self.groupRecords)
+        return {'elapsed': clock() - self.startTime,
+                'records': sum(self.groupRecords.values()),
+                'bytes': sum(self.groupBytes.values()),
+                'groups': groups,
+                'lockWait': self.lockWait.snapshot(),
+                'lockHold': self.lockHold.snapshot(),
+                'fileWrite': self.fileWrite.snapshot(),
+                'rollover': self.rollover.snapshot(),
+                'queueWait': self.queueWait.snapshot(),
+                'queueDepth': self.queueDepth() if self.queueDepth is not None else 0,
+                'droppedRecords': self.droppedRecords,
+                'filteredRecords': self.filteredRecords}
@@ -0,0 +1,135 @@
+"""Recording policies that thin out the records of a ChannelGroup before they are packed, for slow signals that are
+sampled much faster than they change. Attach one with MDF.set_recording_policy. A policy sees every batch of
+write() and write_many() of its group in write order, under the write lock, and returns the records to write.
+Policies keep their state between batches, so a batch of one record gives the same result as one large batch."""
+import bisect
+import itertools
+import operator
+
+BUFFER_TYPES = (bytearray, memoryview)
+
+
+class RecordingPolicy(object):
+    """Base class of recording policies, keeps every record."""
+    def keep(self, records):
+        """Returns the records to write.
+        :param list records: (timestamp_offset, value) records of one write() or write_many() call
+        """
+        return records
+
+    def reset(self):
+        """Forgets the records seen so far."""
+        pass
+
+
+class EveryNth(RecordingPolicy):
+    """Keeps every nth record of the group, starting with the first one. Batches are decimated by slicing.
+    :param int n: Keep one record out of n
+    """
+    def __init__(self, n):
+        if n < 1:
+            raise ValueError("n must be at least 1")
+        self.n = n
+        self.skip = 0  # records to drop before the next kept one
+
+    def keep(self, records):
+        kept = records[self.skip::self.n]
+        self.skip = (self.skip - len(records)) % self.n
+        return kept
+
+    def reset(self):
+        self.skip = 0
+
+
+class MinInterval(RecordingPolicy):
+    """Time based downsampling: keeps a record only if at least interval seconds passed since the last kept record.
+    Batches in timestamp order are searched with bisect, so the cost grows with the kept records, not the batch size.
+    :param float interval: Minimum time between two written records in seconds
+    """
+    def __init__(self, interval):
+        self.interval = interval
+        self.nextTime = None
+
+    def keep(self, records):
+        kept = []
+        append = kept.append
+        interval = self.interval
+        next_time = self.nextTime
+        timestamps = list(map(operator.itemgetter(0), records))
+        if all(map(operator.le, timestamps, itertools.islice(timestamps, 1, None))):
+            index = 0 if next_time is None else bisect.bisect_left(timestamps, next_time)
+            while index < len(timestamps):
+                append(records[index])
+                next_time = timestamps[index] + interval
+                index = bisect.bisect_left(timestamps, next_time, index + 1)
+            self.nextTime = next_time
+            return kept
+        for record in records:
+            if next_time is None or record[0] >= next_time:
+                append(record)
+                next_time = record[0] + interval
+        self.nextTime = next_time
+        return kept
+
+    def reset(self):
+        self.nextTime = None
+
+
+class Deadband(RecordingPolicy):
+    """Change-only recording: keeps a record if a channel value moved by more than the deadband from the last written
+    record. Values without a difference (strings, CAN payloads) count as changed when they are not equal.
+    :param deadband: Allowed change, a number for all channels or a list with one number per channel. 0 writes every
+        change.
+    :param float max_interval: Also writes an unchanged record once this many seconds passed since the last written
+        record, so slow signals still show up regularly. None writes changes only.
+    """
+    def __init__(self, deadband=0, max_interval=None):
+        self.deadband = deadband
+        self.maxInterval = max_interval
+        self.last = None
+        self.lastTime = None
+
+    def keep(self, records):
+        kept = []
+        append = kept.append
+        changed = self._changed
+        max_interval = self.maxInterval
+        last, last_time = self.last, self.lastTime
+        for record in records:
+            timestamp, value = record
+            if last is None or changed(value, last) or \
+                    (max_interval is not None and timestamp - last_time >= max_interval):
+                append(record)
+                last = _snapshot(value)
+                last_time = timestamp
+        self.last, self.lastTime = last, last_time
+        return kept
+
+    def reset(self):
+        self.last = None
+        self.lastTime = None
+
+    def _changed(self, value, last):
+        if not isinstance(value, (list, tuple)):
+            return value != last
+        if isinstance(self.deadband, (list, tuple)):
+            deadbands = self.deadband
+        else:
+            deadbands = itertools.repeat(self.deadband)
+        for new, old, deadband in zip(value, last, deadbands):
+            try:
+                if abs(new - old) > deadband:
+                    return True
+            except TypeError:
+                if new != old:
+                    return True
+        return False
+
+
+def _snapshot(value):
+    """Copy of a record value that keeps its contents when the caller refills the same list or buffer."""
+    if isinstance(value, BUFFER_TYPES):
+        return bytes(value)
+    if isinstance(value, (list, tuple)):
+        return tuple(bytes(item) if isinstance(item, BUFFER_TYPES) else item for item in value)
+    return value
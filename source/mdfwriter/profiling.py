@@ -0,0 +1,192 @@
+"""Profiling hooks of the MDF writers. A profiler is attached with MDF.enable_profiling() and receives a timing span
+for every phase of the writer: add_channel_group, import_dej (and its JSON parsing, import_dej.parse),
+_write_header, _write_pointers, write, write_many, rollover and close_file. Without a profiler the spans cost next to
+nothing."""
+import logging
+import threading
+from .metrics import Histogram, clock
+
+logger = logging.getLogger(__name__)
+
+
+class _NullSpan(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Profiler(object):
+    """Base class of profiler hooks. span() returns a context manager that encloses one phase of the writer, dump() is
+    called every time a file is closed. The base class does nothing."""
+    def span(self, name):
+        """Returns a context manager timing the phase name."""
+        return NULL_SPAN
+
+    def dump(self):
+        """Called after every closed file."""
+        pass
+
+
+class _TimedSpan(object):
+    __slots__ = ('timer', 'name', 'start')
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.start = clock()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.timer.add(self.name, clock() - self.start)
+        return False
+
+
+class PhaseTimer(Profiler):
+    """Built-in collector. Times every span and dumps a per-phase breakdown (count, total, mean and p99 time) when a
+    file is closed. The p99 time is the upper bound of a power of two histogram bucket, so it is up to 2x the actual
+    value.
+    :param callable output: Receives the breakdown text, defaults to logging it at INFO level
+    """
+    def __init__(self, output=None):
+        self.output = output
+        self.phases = {}
+
+    def span(self, name):
+        return _TimedSpan(self, name)
+
+    def add(self, name, seconds):
+        """Adds one duration of phase name."""
+        histogram = self.phases.get(name)
+        if histogram is None:
+            histogram = self.phases[name] = Histogram()
+        histogram.add(seconds)
+
+    def breakdown(self):
+        """Returns {phase: {'count', 'total', 'mean', 'p99'}} with times in seconds."""
+        result = {}
+        for name, histogram in self.phases.items():
+            snapshot = histogram.snapshot()
+            result[name] = dict((key, snapshot[key]) for key in ('count', 'total', 'mean', 'p99'))
+        return result
+
+    def report(self):
+        """Returns the breakdown as a text table, slowest phase first."""
+        lines = ['%-24s %10s %12s %12s %12s' % ('phase', 'count', 'total [s]', 'mean [ms]', 'p99 [ms]')]
+        breakdown = self.breakdown()
+        for name in sorted(breakdown, key=lambda phase: breakdown[phase]['total'], reverse=True):
+            phase = breakdown[name]
+            lines.append('%-24s %10d %12.6f %12.6f %12.6f' % (name, phase['count'], phase['total'],
+                                                              phase['mean'] * 1000, phase['p99'] * 1000))
+        lines.append('p99: upper bound of a power of 2 histogram bucket, up to 2x the actual value')
+        return '\n'.join(lines)
+
+    def dump(self):
+        if self.output is None:
+            logger.info("MDF phase breakdown:\n%s", self.report())
+        else:
+            self.output(self.report())
+
+
+class _ProfiledSpan(object):
+    __slots__ = ('hook',)
+
+    def __init__(self, hook):
+        self.hook = hook
+
+    def __enter__(self):
+        hook = self.hook
+        local = hook.local
+        local.depth = getattr(local, 'depth', 0) + 1
+        if local.depth == 1:
+            with hook.lock:
+                if hook.owner is None:
+                    hook.owner = threading.current_thread()
+                    hook.profile.enable()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        hook = self.hook
+        local = hook.local
+        local.depth -= 1
+        if local.depth == 0:
+            with hook.lock:
+                if hook.owner is threading.current_thread():
+                    hook.profile.disable()
+                    hook.owner = None
+        return False
+
+
+class CProfileHook(Profiler):
+    """Runs cProfile inside the selected phases only, e.g. CProfileHook(['import_dej']) to see where a slow startup
+    spends its time. Nested spans are profiled once. The nesting depth is kept per thread and the profiler is enabled
+    by one thread at a time: spans of other threads that start while a thread is profiled are not profiled.
+    :param list phases: Span names to profile, None profiles every span
+    :param str stats_file: File the pstats data is dumped to when a file is closed, optional
+    """
+    def __init__(self, phases=None, stats_file=None):
+        self.phases = set(phases) if phases is not None else None
+        self.statsFile = stats_file
+        import cProfile  # only loaded when profiling, keeps import mdfwriter fast
+        self.profile = cProfile.Profile()
+        self.local = threading.local()  # depth: spans of the thread currently open
+        self.lock = threading.Lock()
+        self.owner = None  # thread that enabled the profiler
+
+    def span(self, name):
+        if self.phases is not None and name not in self.phases:
+            return NULL_SPAN
+        return _ProfiledSpan(self)
+
+    def stats(self, sort='cumulative'):
+        """Returns the collected profile as pstats.Stats object."""
+        import pstats
+        return pstats.Stats(self.profile).sort_stats(sort)
+
+    def dump(self):
+        if self.statsFile is not None:
+            self.profile.dump_stats(self.statsFile)
+
+
+IMPORT_TIMER = ("import sys, time; clock = getattr(time, 'perf_counter', time.time); start = clock(); import {0}; "
+                "sys.stdout.write('%r %d' % (clock() - start, len(sys.modules)))")
+
+
+def import_time(module='mdfwriter', runs=10, python=None):
+    """Measures the import of module in fresh interpreters, the startup cost of short-lived tools and converters.
+    Returns (median seconds, modules loaded after the import) over runs interpreter starts.
+    :param str module: Module to import, e.g. 'mdfwriter' or 'mdfwriter.mdf4'
+    :param int runs: Number of interpreters started
+    :param str python: Interpreter to run, defaults to the current one
+    """
+    import subprocess
+    import sys
+    times = []
+    for _ in range(runs):
+        output = subprocess.check_output([python or sys.executable, '-c', IMPORT_TIMER.format(module)])
+        seconds, modules = output.split()
+        times.append(float(seconds))
+    times.sort()
+    return times[len(times) // 2], int(modules)
+
+
+def main(argv=None):
+    """Command line entry point: prints the import time of the given modules."""
+    import argparse
+    parser = argparse.ArgumentParser(description="Measures the import time of modules in fresh interpreters.")
+    parser.add_argument('modules', nargs='*', default=['mdfwriter', 'mdfwriter.mdf', 'mdfwriter.mdf4'])
+    parser.add_argument('--runs', type=int, default=10, help="interpreter starts per module")
+    arguments = parser.parse_args(argv)
+    for module in arguments.modules:
+        seconds, modules = import_time(module, arguments.runs)
+        print("%s: %.1f ms, %d modules loaded" % (module, seconds * 1000, modules))
+
+
+if __name__ == '__main__':
+    main()
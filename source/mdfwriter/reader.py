@@ -0,0 +1,431 @@
+"""Reader for the MDF 3 files written by this package, and a merge of several of them into one file. merge_files
+unifies the channel groups of all inputs, rebases every timestamp to the earliest HD start time and streams the records
+through a k-way heap merge, so only one record per data group is held in memory. MDFReader.read_signal decodes a CAN
+signal from all frames of a CAN group, vectorized with NumPy if it is installed."""
+import heapq
+import io
+import logging
+import os
+import struct
+import time
+from .mdf import ChannelGroup, CANmsg, Channel, StringChannel, CANSignal, STRUCT_TYPE
+
+logger = logging.getLogger(__name__)
+
+READ_BUFFER_SIZE = 1048576  # bytes
+
+ID_BLOCK = struct.Struct('<8s8s8sHHH')
+HD_BLOCK = struct.Struct('<2sHiiiH10s8s32s32s32s32s')
+HD_TIMESTAMP = struct.Struct('<Qh')  # MDF 3.2+ HD blocks: local start time in ns and UTC offset in hours
+TX_HEADER = struct.Struct('<2sH')
+DG_BLOCK = struct.Struct('<2sHiiiiHH')
+CG_BLOCK = struct.Struct('<2sHiiiHHHI')
+CN_BLOCK = struct.Struct('<2sHiiiiiH32s128sHHHHdddiiH')
+CC_BLOCK = struct.Struct('<2sHHdd20sHH')
+CE_BLOCK = struct.Struct('<2sHHII36s78s')
+VTAB_PAIR = struct.Struct('<d32s')
+TIMESTAMP = struct.Struct('<d')
+
+
+def _utc_offset(local_seconds, utc_offset):
+    """UTC offset in seconds of an HD start time. The HD block stores whole hours only, so the offset of the local time
+    zone is used if it rounds down to the stored hours, which restores the minutes of zones like UTC+05:30."""
+    try:
+        utc_seconds = time.mktime(time.gmtime(local_seconds)[:8] + (-1,))
+    except (OverflowError, ValueError):
+        return utc_offset * 3600
+    offset = local_seconds - int(utc_seconds)
+    if offset // 3600 == utc_offset:
+        return offset
+    return utc_offset * 3600
+
+
+def _text(raw):
+    """Returns a NULL terminated MDF string as str."""
+    text = raw.split(b'\0', 1)[0]
+    if not isinstance(text, str):
+        text = text.decode('latin-1')
+    return text
+
+
+class ReaderGroup(object):
+    """One channel group of a file opened with MDFReader.
+    :ivar int recordID: Record ID of the group in its data group
+    :ivar int recordSize: Bytes per record without record ID
+    :ivar int numberOfRecords: Records of the group in the file
+    :ivar int canID: CAN ID of a CAN message group, None otherwise
+    :ivar ChannelGroup channelGroup: ChannelGroup/CANmsg that recreates the group in a new MDF
+    :ivar int address: File offset of the CG block
+    :ivar bool named: The file stores the group name. Files of older versions of this writer do not, their groups are
+        named after the record ID or CAN ID.
+    """
+    def __init__(self, record_id, record_size, number_of_records, can_id, channel_group, address=None, named=True):
+        self.address = address
+        self.named = named
+        self.recordID = record_id
+        self.recordSize = record_size
+        self.numberOfRecords = number_of_records
+        self.canID = can_id
+        self.channelGroup = channel_group
+
+    @property
+    def name(self):
+        return self.channelGroup.name
+
+    def key(self):
+        """Groups of different files with the same key are merged: CAN groups by CAN ID, other groups by name and
+        channel names. Groups without stored name are merged by their channel names only, since the names made up from
+        the record ID depend on the order the groups were added in."""
+        if self.canID is not None:
+            return 'CAN', self.canID
+        channels = tuple(channel.name for channel in self.channelGroup.channel_list)
+        return 'DATA', self.name if self.named else None, channels
+
+
+class MDFReader(object):
+    """Reads the header of an MDF 3 file written by MDF and streams its records.
+    :param str file_name: MDF file to read
+    :param int buffer_size: Read buffer size in bytes
+    """
+    def __init__(self, file_name, buffer_size=READ_BUFFER_SIZE):
+        self.fileName = file_name
+        self.bufferSize = buffer_size
+        self.file = io.open(file_name, 'rb', buffering=buffer_size)
+        file_id, format_id, _, _, _, version = ID_BLOCK.unpack(self.file.read(ID_BLOCK.size))
+        if file_id != b'MDF     ' or not 300 <= version < 400:
+            raise ValueError("%s is not an MDF 3 file" % file_name)
+        self.version = version
+        hd = self._block(HD_BLOCK, 64)
+        self.date = _text(hd[6])
+        self.time = _text(hd[7])
+        self.author = _text(hd[8])
+        self.project = _text(hd[10])
+        self.dut = _text(hd[11])
+        if hd[1] >= 208:
+            local_time_ns, utc_offset = HD_TIMESTAMP.unpack(self.file.read(HD_TIMESTAMP.size))
+            self.startTimeNs = local_time_ns - _utc_offset(local_time_ns // 1000000000, utc_offset) * 1000000000
+        else:
+            seconds = int(time.mktime(time.strptime(self.date + " " + self.time, '%d:%m:%Y %H:%M:%S')))
+            self.startTimeNs = seconds * 1000000000
+        self.startTime = self.startTimeNs / 1e9  # seconds since 01.01.1970 UTC
+        self.description = self._tx(hd[3])
+        self.groups = []
+        self.dataGroups = []  # (data pointer, number of record IDs, [ReaderGroup])
+        dg_pointer = hd[2]
+        while dg_pointer:
+            dg = self._block(DG_BLOCK, dg_pointer)
+            groups = []
+            cg_pointer = dg[3]
+            while cg_pointer:
+                groups.append(self._read_group(cg_pointer))
+                cg_pointer = self._block(CG_BLOCK, cg_pointer)[2]
+            self.groups.extend(groups)
+            self.dataGroups.append((dg[5], dg[7], groups))
+            dg_pointer = dg[2]
+
+    def close(self):
+        self.file.close()
+
+    def records(self, data_group):
+        """Yields (timestamp, record ID, record without record ID) for every record of a data group, in file order.
+        Opens its own file handle, so the data groups of one file can be read side by side.
+        :param int data_group: Index into dataGroups
+        """
+        data_pointer, record_ids, groups = self.dataGroups[data_group]
+        remaining = sum(group.numberOfRecords for group in groups)
+        if not data_pointer or not remaining:
+            return
+        sizes = dict((group.recordID, group.recordSize) for group in groups)
+        with io.open(self.fileName, 'rb', buffering=self.bufferSize) as f:
+            f.seek(data_pointer)
+            while remaining:
+                if record_ids:
+                    record_id = STRUCT_TYPE['UINT8'].unpack(f.read(1) or b'\0')[0]
+                else:
+                    record_id = groups[0].recordID
+                record = f.read(sizes.get(record_id, 0))
+                if record_id not in sizes or len(record) < sizes[record_id]:
+                    logger.warning("%s: data ends in an incomplete record", self.fileName)
+                    return
+                yield TIMESTAMP.unpack_from(record)[0], record_id, record
+                remaining -= 1
+
+    def _block(self, block_struct, address):
+        self.file.seek(address)
+        return block_struct.unpack(self.file.read(block_struct.size))
+
+    def _tx(self, address):
+        if not address:
+            return ""
+        _, size = self._block(TX_HEADER, address)
+        return _text(self.file.read(size - TX_HEADER.size))
+
+    def _read_group(self, address):
+        """Reads a CG block and its channels and rebuilds the ChannelGroup/CANmsg it was written from."""
+        cg = self._block(CG_BLOCK, address)
+        record_id, data_size, number_of_records = cg[5], cg[7], cg[8]
+        name = self._tx(cg[4])
+        channels = []
+        can_id = None
+        cn_pointer = cg[3]
+        while cn_pointer:
+            cn = self._block(CN_BLOCK, cn_pointer)
+            if cn[4] and can_id is None:
+                can_id = self._block(CE_BLOCK, cn[4])[3]
+            if cn[7] != 1:  # the time channel is added by add_channel_group
+                channels.append((cn, self._block(CC_BLOCK, cn[3]) if cn[3] else None, cn[3]))
+            cn_pointer = cn[2]
+        if can_id is not None:
+            channel_group = CANmsg(name or 'CAN_0x%X' % can_id)
+            channel_group.messageID = can_id
+            record_size = data_size or 16
+            channel_group.length = record_size - 8
+            for cn, cc, cc_pointer in channels:
+                signal = CANSignal(self._tx(cn[17]) or _text(cn[8]), self._tx(cn[6]) or _text(cn[9]))
+                signal.startBit = cn[10] - 64
+                signal.bitCount = cn[11]
+                signal.validRange = bool(cn[13])
+                signal.min = cn[14]
+                signal.max = cn[15]
+                if cc is not None:
+                    signal.units = _text(cc[5])
+                    self._read_conversion(signal, cc, cc_pointer)
+                channel_group.add_signal(signal)
+        else:
+            channel_group = ChannelGroup(name or 'Channel Group %d' % record_id)
+            for cn, cc, cc_pointer in channels:
+                name, description = self._tx(cn[17]) or _text(cn[8]), self._tx(cn[6]) or _text(cn[9])
+                if cn[12] == 7:
+                    channel_group.add_channel(StringChannel(name, cn[11] // 8, description))
+                else:
+                    channel_group.add_channel(Channel(name, _text(cc[5]) if cc is not None else "", description))
+            record_size = data_size or 8 + sum(cn[11] for cn, _, _ in channels) // 8
+        return ReaderGroup(record_id, record_size, number_of_records, can_id, channel_group, address, bool(name))
+
+    def _read_conversion(self, signal, cc, address):
+        """Fills offset and scale, or the value descriptions, of a CAN signal from its CC block."""
+        conversion_id, pairs = cc[6], cc[7]
+        params = address + CC_BLOCK.size
+        self.file.seek(params)
+        if conversion_id == 0 and pairs == 2:
+            signal.offset, signal.scale = struct.unpack('<dd', self.file.read(16))
+        elif conversion_id == 11:
+            for _ in range(pairs):
+                value, text = VTAB_PAIR.unpack(self.file.read(VTAB_PAIR.size))
+                signal.is_enum = True
+                signal.value_dict[value] = _text(text)
+
+    def find_group(self, key):
+        """Returns the ReaderGroup of a CAN ID (int) or group name (str)."""
+        for group in self.groups:
+            if group.canID == key if isinstance(key, int) else group.name == key:
+                return group
+        raise KeyError(key)
+
+    def read_signal(self, group, signal, raw=False):
+        """Decodes one CAN signal from all frames of a CAN group. Returns (timestamps, values), NumPy arrays if NumPy
+        is installed, else lists. The whole payload column is decoded at once with shifts and masks on a memory mapped
+        view of the data group; without NumPy every frame is decoded in Python.
+        :param group: ReaderGroup, CAN ID or group name
+        :param signal: CANSignal, e.g. from DEJ.get_message_list(), or the name of a signal of the group. The file does
+            not store endianness and signedness, signals read back from it are little endian and unsigned.
+        :param bool raw: Return the raw integers instead of physical values (scale and offset applied) or value
+            descriptions of enum signals. Values without description are None.
+        """
+        if not isinstance(group, ReaderGroup):
+            group = self.find_group(group)
+        if group.canID is None:
+            raise ValueError("%s is not a CAN group" % group.name)
+        if not isinstance(signal, CANSignal):
+            signal = dict((candidate.name, candidate) for candidate in group.channelGroup.signalList)[signal]
+        payload_size = group.recordSize - TIMESTAMP.size
+        layout = signal_layout(signal, payload_size)
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+        if numpy is None:
+            timestamps, values = [], []
+            for data_group in self._data_groups_of(group):
+                for timestamp, record_id, record in self.records(data_group):
+                    if record_id == group.recordID:
+                        timestamps.append(timestamp)
+                        values.append(_decode(bytearray(record[TIMESTAMP.size:]), layout, signal))
+            if raw:
+                return timestamps, values
+            if signal.value_dict:
+                descriptions = _descriptions(signal)
+                return timestamps, [descriptions.get(value) for value in values]
+            scale, offset = _scaling(signal)
+            return timestamps, [value * scale + offset for value in values]
+        records = self._record_array(numpy, group)
+        timestamps = numpy.ascontiguousarray(records[:, :TIMESTAMP.size]).view('<f8').ravel()
+        values = numpy.zeros(len(records), dtype=numpy.uint64)
+        for index, mask, shift in layout:
+            column = records[:, TIMESTAMP.size + index] & numpy.uint8(mask)
+            column = column.astype(numpy.uint64)
+            values |= column << numpy.uint64(shift) if shift >= 0 else column >> numpy.uint64(-shift)
+        if signal.signedness and 0 < signal.bitCount < 64:
+            spare = numpy.uint64(64 - signal.bitCount)
+            values = (values << spare).view(numpy.int64) >> numpy.int64(spare)
+        elif signal.signedness:
+            values = values.view(numpy.int64)
+        if raw:
+            return timestamps, values
+        if signal.value_dict:
+            descriptions = _descriptions(signal)
+            keys = numpy.array(sorted(descriptions), dtype=numpy.float64)
+            texts = numpy.array([descriptions[key] for key in sorted(descriptions)] + [None], dtype=object)
+            positions = numpy.searchsorted(keys, values.astype(numpy.float64))
+            found = numpy.zeros(len(values), dtype=bool)
+            inside = positions < len(keys)
+            found[inside] = keys[positions[inside]] == values[inside]
+            return timestamps, texts[numpy.where(found, positions, len(keys))]
+        scale, offset = _scaling(signal)
+        return timestamps, values * scale + offset
+
+    def _data_groups_of(self, group):
+        return [index for index, (_, _, groups) in enumerate(self.dataGroups) if group in groups]
+
+    def _record_array(self, numpy, group):
+        """Records of a group without record ID as (records, record size) uint8 array. Data groups that only hold
+        records of one size are memory mapped and selected by record ID column, others are read record by record."""
+        parts = []
+        for data_group in self._data_groups_of(group):
+            data_pointer, record_ids, groups = self.dataGroups[data_group]
+            if not data_pointer or not group.numberOfRecords:
+                continue
+            id_size = 1 if record_ids else 0
+            if all(other.recordSize == group.recordSize for other in groups):
+                count = sum(other.numberOfRecords for other in groups)
+                size = min(count * (id_size + group.recordSize), os.path.getsize(self.fileName) - data_pointer)
+                count = size // (id_size + group.recordSize)
+                if not count:
+                    continue
+                data = numpy.memmap(self.fileName, dtype=numpy.uint8, mode='r', offset=data_pointer,
+                                    shape=(count * (id_size + group.recordSize),))
+                rows = data.reshape(count, id_size + group.recordSize)
+                if id_size:
+                    rows = rows[rows[:, 0] == group.recordID, 1:]
+                parts.append(rows)
+            else:
+                records = b''.join(record for _, record_id, record in self.records(data_group)
+                                   if record_id == group.recordID)
+                parts.append(numpy.frombuffer(records, dtype=numpy.uint8).reshape(-1, group.recordSize))
+        if not parts:
+            return numpy.zeros((0, group.recordSize), dtype=numpy.uint8)
+        return parts[0] if len(parts) == 1 else numpy.concatenate(parts)
+
+
+def signal_layout(signal, payload_size):
+    """Returns [(payload byte index, mask, shift)] that assemble the raw value of a CAN signal: the masked bytes
+    shifted left by shift (right for negative shifts) and or-ed together. Little endian signals start at their least
+    significant bit, big endian signals at their most significant bit in Motorola (DBC) bit numbering.
+    :param CANSignal signal: Signal with startBit, bitCount and endianness
+    :param int payload_size: Payload bytes of the message
+    """
+    if not 0 < signal.bitCount <= 64:
+        raise ValueError("%s: bit count must be 1 to 64" % signal.name)
+    if signal.endianness:
+        first = signal.startBit // 8 * 8 + 7 - signal.startBit % 8  # bit position counted from the payload MSB
+        last = first + signal.bitCount - 1
+    else:
+        first, last = signal.startBit, signal.startBit + signal.bitCount - 1
+    if last >= payload_size * 8:
+        raise ValueError("%s does not fit a %d byte payload" % (signal.name, payload_size))
+    layout = []
+    for index in range(first // 8, last // 8 + 1):
+        mask = 0
+        for bit in range(8):
+            position = index * 8 + (7 - bit if signal.endianness else bit)
+            if first <= position <= last:
+                mask |= 1 << bit
+        if signal.endianness:
+            shift = last - (index * 8 + 7)  # weight of bit 0 of the byte
+        else:
+            shift = index * 8 - first
+        layout.append((index, mask, shift))
+    return layout
+
+
+def _decode(payload, layout, signal):
+    value = 0
+    for index, mask, shift in layout:
+        part = payload[index] & mask
+        value |= part << shift if shift >= 0 else part >> -shift
+    if signal.signedness and value >> (signal.bitCount - 1):
+        value -= 1 << signal.bitCount
+    return value
+
+
+def _descriptions(signal):
+    return dict((float(key), text) for key, text in signal.value_dict.items())
+
+
+def _scaling(signal):
+    """Scale and offset of a signal. A scale of 0 is the CANSignal default of signals without scaling."""
+    return float(signal.scale or 1), float(signal.offset)
+
+
+def merge_files(file_names, mdf, buffer_size=READ_BUFFER_SIZE):
+    """Merges MDF 3 files written by this package (e.g. rollover segments, or the files of separate loggers) into one
+    file in timestamp order. Channel groups are unified by CAN ID, or by name and channels. Timestamps are rebased to
+    the earliest HD start time of the inputs, which becomes the start time of the merged file. Records are streamed
+    through a k-way heap merge that holds one record per input data group. Returns the number of merged records.
+    :param list file_names: MDF files to merge, each in timestamp order
+    :param MDF mdf: New MDF or MDF4 object without channel groups. It gets the unified groups, is written and closed.
+        Create it with a large buffer_size, e.g. READ_BUFFER_SIZE, for fewer write calls.
+    :param int buffer_size: Read buffer size per input data group in bytes
+    """
+    readers = [MDFReader(file_name, buffer_size) for file_name in file_names]
+    try:
+        start = min(reader.startTimeNs for reader in readers)
+        targets = {}  # group key -> CG block of mdf
+        mapping = {}  # (reader index, record ID) -> CG block of mdf
+        for reader_index, reader in enumerate(readers):
+            for group in reader.groups:
+                key = group.key()
+                if key not in targets:
+                    channel_group = group.channelGroup
+                    if channel_group.name in mdf.channelGroupDictionary:
+                        channel_group.name = '%s (%d)' % (channel_group.name, len(targets) + 1)
+                    mdf.add_channel_group(channel_group)
+                    targets[key] = mdf.cgBlockList[-1]
+                cg_block = targets[key]
+                if mdf._record_size(cg_block) != group.recordSize:
+                    raise ValueError("%s: record size of %s does not match the other files"
+                                     % (reader.fileName, group.name))
+                mapping[reader_index, group.recordID] = cg_block
+        mdf.set_start_time_ns(start)
+        heap = []
+        sources = []
+        for reader_index, reader in enumerate(readers):
+            for data_group in range(len(reader.dataGroups)):
+                records = reader.records(data_group)
+                sources.append((reader_index, (reader.startTimeNs - start) / 1e9, records))
+                for timestamp, record_id, record in records:
+                    heap.append((timestamp + sources[-1][1], len(sources) - 1, record_id, record))
+                    break
+        heapq.heapify(heap)
+        mdf.start_file()
+        merged = 0
+        with mdf.lock:
+            while heap:
+                timestamp, source, record_id, record = heap[0]
+                reader_index, offset, records = sources[source]
+                cg_block = mapping[reader_index, record_id]
+                packet = STRUCT_TYPE['DOUBLE'].pack(timestamp) + record[8:]
+                if not mdf.sortedOutput:
+                    packet = STRUCT_TYPE['UINT8'].pack(cg_block.recordID) + packet
+                mdf._store_record(cg_block, packet, len(record))
+                merged += 1
+                for timestamp, record_id, record in records:
+                    heapq.heapreplace(heap, (timestamp + offset, source, record_id, record))
+                    break
+                else:
+                    heapq.heappop(heap)
+        mdf.close_file()
+    finally:
+        for reader in readers:
+            reader.close()
+    return merged
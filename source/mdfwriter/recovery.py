@@ -0,0 +1,101 @@
+"""Recovery of MDF 3 files that were never closed, e.g. after a power loss. close_file writes the record counts into the
+CG blocks, so such a file claims no records (or the counts of its last checkpoint, see MDF.enable_checkpoints) although
+its data is complete up to the last write. recover_counts rescans the records and patches the counts."""
+import argparse
+import io
+import logging
+import os
+import struct
+from .reader import MDFReader, READ_BUFFER_SIZE
+
+logger = logging.getLogger(__name__)
+
+CG_COUNTS_OFFSET = 20  # bytes from CG block start to data_size, followed by the record count
+CG_COUNTS = struct.Struct('<HI')
+
+
+def scan_records(file_name, data_pointer, record_sizes, buffer_size=READ_BUFFER_SIZE):
+    """Counts the complete records of an unsorted data section. The scan stops at the end of the file, at an
+    incomplete record or at a record ID without a channel group, e.g. one of a group added after start_file that was
+    not in the file yet. The file is read in chunks of buffer_size bytes and the record IDs are walked in memory.
+    Returns ({record ID: count}, offset behind the last complete record).
+    :param str file_name: MDF file
+    :param int data_pointer: File offset of the data section
+    :param dict record_sizes: Record ID -> bytes per record without the record ID
+    :param int buffer_size: Read buffer size in bytes
+    """
+    steps = [0] * 256  # record ID -> bytes per record with the record ID, 0 for unknown IDs
+    for record_id, size in record_sizes.items():
+        steps[record_id] = size + 1
+    found = [0] * 256
+    end = os.path.getsize(file_name)
+    position = data_pointer  # file offset of data[0]
+    data = bytearray()
+    offset = 0
+    with io.open(file_name, 'rb', buffering=0) as f:
+        f.seek(position)
+        while True:
+            chunk = f.read(buffer_size)
+            if not chunk:
+                break
+            position += offset
+            data = data[offset:] + chunk
+            offset = 0
+            length = len(data)
+            while offset < length:
+                step = steps[data[offset]]
+                if not step or offset + step > length:
+                    break
+                found[data[offset]] += 1
+                offset += step
+            if offset < length and not steps[data[offset]]:
+                break  # unknown record ID
+    position += offset
+    counts = dict((record_id, found[record_id]) for record_id in record_sizes)
+    if position < end:
+        logger.warning("%s: %d bytes behind the last complete record at %d are ignored", file_name,
+                       end - position, position)
+    return counts, position
+
+
+def recover_counts(file_name, buffer_size=READ_BUFFER_SIZE):
+    """Rebuilds the record count and record size of every channel group of an unsorted MDF 3 file written by MDF from
+    its data, and patches them into the CG blocks. Sorted data groups are left as they are, their records are only
+    written by close_file. Returns the recovered record count of every group, in the order of MDFReader.groups.
+    :param str file_name: MDF file to repair in place
+    :param int buffer_size: Read buffer size in bytes
+    """
+    reader = MDFReader(file_name, buffer_size)
+    reader.close()
+    counts = {}
+    for data_pointer, record_ids, groups in reader.dataGroups:
+        if not record_ids:
+            logger.warning("%s: sorted data group at %d is not scanned", file_name, data_pointer)
+            continue
+        if not data_pointer:
+            continue
+        group_counts, _ = scan_records(file_name, data_pointer,
+                                       dict((group.recordID, group.recordSize) for group in groups), buffer_size)
+        for group in groups:
+            counts[group.address] = group_counts[group.recordID]
+    with io.open(file_name, 'r+b') as f:
+        for group in reader.groups:
+            if group.address in counts:
+                group.numberOfRecords = counts[group.address]
+                f.seek(group.address + CG_COUNTS_OFFSET)
+                f.write(CG_COUNTS.pack(group.recordSize, group.numberOfRecords))
+    return [group.numberOfRecords for group in reader.groups]
+
+
+def main(argv=None):
+    """Command line entry point: repairs the record counts of the given files."""
+    parser = argparse.ArgumentParser(description="Rebuilds the record counts of MDF 3 files that were not closed.")
+    parser.add_argument('files', nargs='+', help="MDF files to repair in place")
+    arguments = parser.parse_args(argv)
+    for file_name in arguments.files:
+        counts = recover_counts(file_name)
+        print("%s: %d records in %d channel groups" % (file_name, sum(counts), len(counts)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+"""Sharded logging for multi-process writers. A single MDF object packs records under one lock in one process, so a
+sharded run splits the channel groups (or CAN buses) across worker processes instead. Every worker writes a data-only
+ShardWriter file built from the same ShardLayout, and merge_shards combines the shards into one MDF or MDF4 file in
+timestamp order.
+
+    layout = ShardLayout(channel_groups)
+    # in worker n, owning some of the groups:
+    shard = ShardWriter('run.shard%d' % n, layout, n)
+    shard.start_file()
+    shard.write(group_name, time.time() - shared_start, value)
+    shard.close_file()
+    # once all workers are done:
+    merge_shards(['run.shard0', 'run.shard1'], MDF('run.mdf', author, project, dut), layout)
+"""
+import heapq
+import io
+import logging
+import os
+import struct
+import zlib
+from .mdf import MDF
+
+logger = logging.getLogger(__name__)
+
+SHARD_MAGIC = b'MDFSHARD'
+SHARD_VERSION = 1
+# magic, version, shard index, layout fingerprint, number of channel groups
+SHARD_HEADER = struct.Struct('<8sHHII')
+RECORD_COUNT = struct.Struct('<Q')
+RECORD_HEAD = struct.Struct('<Bd')  # record ID and timestamp of an unsorted record
+READ_BUFFER_SIZE = 1048576  # bytes
+
+
+def layout_fingerprint(mdf):
+    """Checksum of the channel group layout of mdf (group names, channel counts and record sizes). Shards can only be
+    merged into a file with the same fingerprint."""
+    text = '|'.join('%s:%d:%d' % (cg_block.name, cg_block.numberOfChannels, mdf._record_size(cg_block))
+                    for cg_block in mdf.cgBlockList)
+    return zlib.crc32(text.encode('utf-8')) & 0xffffffff
+
+
+class ShardLayout(object):
+    """Channel group layout shared by all shards of a run and by the merged file. It only holds the ChannelGroup and
+    CANmsg definitions, so it can be pickled to worker processes.
+    :param list channel_groups: ChannelGroup/CANmsg objects, in the order they are added to every file
+    """
+    def __init__(self, channel_groups):
+        self.channelGroups = list(channel_groups)
+
+    def apply(self, mdf):
+        """Adds the channel groups to mdf. Must be called before mdf.start_file()."""
+        for channel_group in self.channelGroups:
+            mdf.add_channel_group(channel_group)
+        return mdf
+
+
+class ShardWriter(MDF):
+    """Data-only shard of a sharded run. Records are written with write() and write_many() like with MDF, but the file
+    only holds a short shard header, the record count of every channel group and the records in unsorted MDF format.
+    Record IDs come from the shared layout, so every shard can write any group. Timestamps must be offsets from a start
+    time shared by all workers, and each shard should be written in timestamp order.
+    :param str file_name: Name of the shard file
+    :param ShardLayout layout: Layout shared by all shards
+    :param int shard_index: Number of this shard, stored in the shard header
+    """
+    FILE_SIZE_LIMIT = None  # shards are merged, not read by third-party tools
+    LATE_GROUPS = False  # the layout is shared by all shards
+    TEMPLATES = False  # shards have their own header
+
+    def __init__(self, file_name, layout, shard_index=0):
+        MDF.__init__(self, file_name, '', '', '')
+        self.shardIndex = shard_index
+        self.countsPointer = 0
+        layout.apply(self)
+
+    def _write_header(self):
+        """Writes the shard header followed by zeroed record counts, which are patched at close."""
+        self.file.seek(0)
+        self._write_to_file(SHARD_HEADER.pack(SHARD_MAGIC, SHARD_VERSION, self.shardIndex, layout_fingerprint(self),
+                                              len(self.cgBlockList)))
+        self.countsPointer = self.file.tell()
+        self._write_to_file(self._pack_counts())
+        self.datapointer = self.file.tell()
+
+    def _write_pointers(self):
+        """Shards have no blocks to link."""
+        pass
+
+    def _finish_file(self):
+        """Patches the record counts of every channel group and closes the shard."""
+        self.file.seek(self.countsPointer)
+        self._write_to_file(self._pack_counts())
+        self.file.close()
+
+    def _checkpoint_patches(self):
+        """All record counts of a shard are written with one pwrite."""
+        return [(self.countsPointer, self._pack_counts())]
+
+    def _pack_counts(self):
+        return b''.join(RECORD_COUNT.pack(cg_block.numberOfRecords) for cg_block in self.cgBlockList)
+
+
+def read_shard_header(shard_file):
+    """Reads the header of an open shard file. Returns (shard index, layout fingerprint, [record count per group])."""
+    data = shard_file.read(SHARD_HEADER.size)
+    if len(data) < SHARD_HEADER.size:
+        raise ValueError("Not an MDF shard: %s" % shard_file.name)
+    magic, version, shard_index, fingerprint, group_count = SHARD_HEADER.unpack(data)
+    if magic != SHARD_MAGIC or version != SHARD_VERSION:
+        raise ValueError("Not an MDF shard: %s" % shard_file.name)
+    counts = [RECORD_COUNT.unpack(shard_file.read(RECORD_COUNT.size))[0] for _ in range(group_count)]
+    return shard_index, fingerprint, counts
+
+
+def read_shard_records(shard_file, record_sizes):
+    """Yields (timestamp, record ID, record) for every record of an open shard file positioned behind its header.
+    A record cut off by a crashed writer ends the shard.
+    :param file shard_file: Binary shard file
+    :param dict record_sizes: Record ID -> record size without the record ID
+    """
+    while True:
+        head = shard_file.read(RECORD_HEAD.size)
+        if len(head) < RECORD_HEAD.size:
+            if head:
+                logger.warning("Incomplete record at the end of %s ignored", shard_file.name)
+            return
+        record_id, timestamp = RECORD_HEAD.unpack(head)
+        if record_id not in record_sizes:
+            raise ValueError("Unknown record ID %d in %s" % (record_id, shard_file.name))
+        rest = shard_file.read(record_sizes[record_id] + 1 - RECORD_HEAD.size)
+        if len(rest) < record_sizes[record_id] + 1 - RECORD_HEAD.size:
+            logger.warning("Incomplete record at the end of %s ignored", shard_file.name)
+            return
+        yield timestamp, record_id, head + rest
+
+
+def merge_shards(shard_names, mdf, layout=None, buffer_size=READ_BUFFER_SIZE):
+    """Merges shards into one file in timestamp order with a k-way heap merge. Only one record per shard is held in
+    memory. The record counts of the merged CG blocks are the sums of the shard records. Returns the number of merged
+    records.
+    :param list shard_names: Shard files written by ShardWriter
+    :param MDF mdf: New MDF or MDF4 object. Its header is written and it is closed by merge_shards. If the merge
+        fails, its file is closed and removed.
+    :param ShardLayout layout: Applied to mdf if given, otherwise mdf must already have the same channel groups
+    :param int buffer_size: Read buffer size per shard in bytes
+    """
+    shard_files = []
+    try:
+        if layout is not None:
+            layout.apply(mdf)
+        fingerprint = layout_fingerprint(mdf)
+        record_sizes = dict((cg_block.recordID, mdf._record_size(cg_block)) for cg_block in mdf.cgBlockList)
+        readers = []
+        expected = 0
+        for shard_name in shard_names:
+            shard_file = io.open(shard_name, 'rb', buffering=buffer_size)
+            shard_files.append(shard_file)
+            _, shard_fingerprint, counts = read_shard_header(shard_file)
+            if shard_fingerprint != fingerprint:
+                raise ValueError("Shard %s was written with a different channel group layout" % shard_name)
+            expected += sum(counts)
+            readers.append(read_shard_records(shard_file, record_sizes))
+        heap = []
+        for index, reader in enumerate(readers):
+            for timestamp, record_id, record in reader:
+                heap.append((timestamp, index, record_id, record))
+                break
+        heapq.heapify(heap)
+        mdf.start_file()
+        merged = 0
+        with mdf.lock:
+            while heap:
+                timestamp, index, record_id, record = heap[0]
+                cg_block = mdf.cgBlockList[record_id - 1]
+                mdf._store_record(cg_block, record[1:] if mdf.sortedOutput else record, len(record) - 1)
+                merged += 1
+                for timestamp, record_id, record in readers[index]:
+                    heapq.heapreplace(heap, (timestamp, index, record_id, record))
+                    break
+                else:
+                    heapq.heappop(heap)
+        mdf.close_file()
+    except Exception:
+        mdf.file.close()  # the half-written target is removed
+        try:
+            os.remove(mdf.file.name)  # after a rollover, the open file is not mdf.filename
+        except OSError:
+            pass
+        raise
+    finally:
+        for shard_file in shard_files:
+            shard_file.close()
+    if merged != expected:
+        logger.warning("Merged %d records, the shard headers count %d", merged, expected)
+    return merged
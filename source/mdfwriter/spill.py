@@ -0,0 +1,183 @@
+"""Bounded-memory record buffers for the sorted output mode. Records of each channel group are collected in memory
+until the shared memory budget is used up. The largest group buffers are then spilled to temporary files, so peak memory
+does not depend on the length of the run. When the MDF is closed, every group is copied into the file as one contiguous
+block, using copy_file_range/sendfile where the platform has them."""
+import os
+import shutil
+
+COPY_BUFFER_SIZE = 1048576  # bytes, chunk size of the shutil fallback copy
+
+
+def copy_file(source, destination, count):
+    """Copies the first count bytes of source to the current position of destination and leaves destination positioned
+    behind the copied data. The copy is done in the kernel with os.copy_file_range or os.sendfile when available,
+    otherwise with large buffered reads and writes.
+    :param file source: Binary file object opened for reading
+    :param file destination: Binary file object opened for writing
+    :param int count: Number of bytes to copy
+    """
+    destination.flush()
+    position = destination.tell()
+    copied = 0
+    if hasattr(os, 'copy_file_range'):
+        try:
+            while copied < count:
+                n = os.copy_file_range(source.fileno(), destination.fileno(), count - copied, copied,
+                                       position + copied)
+                if n == 0:
+                    break
+                copied += n
+        except OSError:
+            pass  # Not supported between these file systems, fall through to sendfile
+    if copied < count and hasattr(os, 'sendfile'):
+        try:
+            os.lseek(destination.fileno(), position + copied, os.SEEK_SET)
+            while copied < count:
+                n = os.sendfile(destination.fileno(), source.fileno(), copied, count - copied)
+                if n == 0:
+                    break
+                copied += n
+        except OSError:
+            pass
+    destination.seek(position + copied)
+    if copied < count:
+        source.seek(copied)
+        while copied < count:
+            data = source.read(min(COPY_BUFFER_SIZE, count - copied))
+            if not data:
+                break
+            destination.write(data)
+            copied += len(data)
+    return copied
+
+
+class SpillBuffer(object):
+    """Keeps the records of several channel groups, keyed by record ID, with a shared memory budget.
+    :param int memory_budget: Bytes kept in memory across all groups before spilling. None never spills, 0 spills
+        every record immediately.
+    :param str spill_dir: Directory for the temporary spill files, defaults to the system temp directory
+    """
+    def __init__(self, memory_budget=None, spill_dir=None):
+        self.memoryBudget = memory_budget
+        self.spillDir = spill_dir
+        self.memoryBytes = 0
+        self.totalBytes = 0
+        self.spillCount = 0
+        self._chunks = {}
+        self._chunkBytes = {}
+        self._spillFiles = {}
+        self._spilledBytes = {}
+        self._records = {}
+
+    def append(self, key, record):
+        """Adds one packed record to the buffer of group key.
+        :param int key: Record ID of the channel group
+        :param bytes record: Packed data record
+        """
+        chunks = self._chunks.get(key)
+        if chunks is None:
+            chunks = self._chunks[key] = []
+            self._chunkBytes[key] = 0
+            self._records[key] = 0
+        chunks.append(record)
+        size = len(record)
+        self._chunkBytes[key] += size
+        self._records[key] += 1
+        self.memoryBytes += size
+        self.totalBytes += size
+        if self.memoryBudget is not None and self.memoryBytes > self.memoryBudget:
+            self._spill()
+
+    def records(self, key):
+        """Number of records appended to group key."""
+        return self._records.get(key, 0)
+
+    def size(self, key):
+        """Number of bytes appended to group key, in memory and spilled."""
+        return self._chunkBytes.get(key, 0) + self._spilledBytes.get(key, 0)
+
+    def write_to(self, key, destination):
+        """Writes all records of group key, in the order they were appended, to the current position of destination
+        and releases them. Returns the number of bytes written.
+        :param int key: Record ID of the channel group
+        :param file destination: Binary file object opened for writing
+        """
+        written = 0
+        spill_file = self._spillFiles.pop(key, None)
+        if spill_file is not None:
+            spill_file.flush()
+            written += copy_file(spill_file, destination, self._spilledBytes.pop(key))
+            spill_file.close()
+        chunks = self._chunks.pop(key, None)
+        if chunks:
+            destination.write(b''.join(chunks))
+            written += self._chunkBytes[key]
+            self.memoryBytes -= self._chunkBytes[key]
+        self._chunkBytes.pop(key, None)
+        self._records.pop(key, None)
+        self.totalBytes -= written
+        return written
+
+    def read_chunks(self, key, chunk_size):
+        """Yields the records of group key, in the order they were appended, as chunks of chunk_size bytes (the last
+        chunk may be shorter) and releases them. Spilled data is read one chunk at a time.
+        :param int key: Record ID of the channel group
+        :param int chunk_size: Bytes per chunk, a multiple of the record size keeps records whole
+        """
+        self.totalBytes -= self.size(key)
+        pending = b''
+        spill_file = self._spillFiles.pop(key, None)
+        if spill_file is not None:
+            spill_file.flush()
+            spill_file.seek(0)
+            remaining = self._spilledBytes.pop(key)
+            while remaining > 0:
+                data = spill_file.read(min(chunk_size - len(pending), remaining))
+                if not data:
+                    break
+                remaining -= len(data)
+                pending += data
+                if len(pending) == chunk_size:
+                    yield pending
+                    pending = b''
+            spill_file.close()
+        chunks = self._chunks.pop(key, None)
+        self.memoryBytes -= self._chunkBytes.pop(key, 0)
+        self._records.pop(key, None)
+        data = pending + b''.join(chunks or [])
+        for start in range(0, len(data), chunk_size):
+            yield data[start:start + chunk_size]
+
+    def close(self):
+        """Drops all buffered records and removes the spill files. The buffer can be reused afterwards."""
+        for spill_file in self._spillFiles.values():
+            spill_file.close()
+        self._chunks = {}
+        self._chunkBytes = {}
+        self._spillFiles = {}
+        self._spilledBytes = {}
+        self._records = {}
+        self.memoryBytes = 0
+        self.totalBytes = 0
+
+    def _spill(self):
+        """Moves the largest in-memory group buffers to their spill files until memory use is at most half of the
+        budget, so a full buffer does not spill again on the next append."""
+        target = self.memoryBudget // 2
+        for key in sorted(self._chunkBytes, key=self._chunkBytes.get, reverse=True):
+            if self.memoryBytes <= target:
+                break
+            size = self._chunkBytes[key]
+            if size == 0:
+                continue
+            spill_file = self._spillFiles.get(key)
+            if spill_file is None:
+                import tempfile  # only loaded once a budget is exceeded, keeps import mdfwriter fast
+                spill_file = self._spillFiles[key] = tempfile.TemporaryFile(dir=self.spillDir)
+                self._spilledBytes[key] = 0
+            spill_file.write(b''.join(self._chunks[key]))
+            self._chunks[key] = []
+            self._chunkBytes[key] = 0
+            self._spilledBytes[key] += size
+            self.memoryBytes -= size
+            self.spillCount += 1
@@ -0,0 +1,114 @@
+"""Reusable layouts for many short MDF files with the same channel groups. An MDFTemplate builds the blocks of its
+channel groups, compiles their record structs and serializes the header once. MDF.from_template then creates a file by
+copying the header, patching the per-file fields (HD date and time, author, project, DUT and the file comment) and
+linking the prebuilt blocks, instead of running add_channel_group and start_file again.
+
+    template = MDFTemplate(DEJ('vehicle.json').get_message_list(), description_size=64)
+    for run in runs:
+        mdf = MDF.from_template(template, 'run%d.mdf' % run, author, project, dut, 'Run %d' % run)
+        mdf.write(...)
+        mdf.close_file()
+"""
+import copy
+import io
+from .mdf import MDF, STRUCT_TYPE
+from .mdfblocks import TXBlock
+from .utils import encode_field
+
+# MDF attributes set up by add_channel_group and the header writers that a template hands to every file
+TEMPLATE_STATE = ('ccBlockDictionary', 'cc_blockList', 'ceBlockList', 'cnBlockList', 'cnTypeList', 'txBlockDictionary',
+                  'txBlockList', 'dgLinkPointer', 'dgCountPointer', 'timepointer', 'timestampPointer', 'reservePointer',
+                  'reserveEnd', 'datapointer', 'cecount')
+HD_AUTHOR_OFFSET = 8  # bytes behind the HD time field, followed by organization, project and DUT of 32 bytes each
+
+
+class _HeaderWriter(MDF):
+    """MDF that writes its header into memory."""
+    def open_file(self, file_name):
+        self.file = io.BytesIO()
+        return self.file
+
+
+class MDFTemplate(object):
+    """Frozen channel group layout with the serialized MDF 3 header, see MDF.from_template. The CN, CC, CE and TX
+    blocks are shared by all files of the template, the CG and DG blocks that count records are copied for every file.
+    :param list channel_groups: ChannelGroup/CANmsg objects, in the order they are added to every file
+    :param str file_description: Default text of the file comment TX block
+    :param int description_size: Bytes reserved for the file comment including its NULL terminator, so files can get
+        their own comment of up to description_size - 1 characters. Defaults to the size of file_description.
+    :param bool sorted_output: See MDF
+    :param int header_reserve: See MDF
+    """
+    def __init__(self, channel_groups, file_description='', description_size=None, sorted_output=False,
+                 header_reserve=0):
+        if description_size is None:
+            description_size = len(file_description) + 1
+        if len(file_description) >= description_size:
+            raise ValueError("file description does not fit into %d bytes" % description_size)
+        writer = _HeaderWriter('', '', '', '', file_description, sorted_output=sorted_output,
+                               header_reserve=header_reserve)
+        writer.TXBlock = TXBlock(encode_field(file_description, description_size))
+        writer.HDBlock.firstDGPointer = writer.HEADER_SIZE + writer.TXBlock.blocksize
+        for channel_group in channel_groups:
+            writer.add_channel_group(channel_group)
+        writer.start_file()
+        self.header = writer.file.getvalue()
+        self.fileDescription = file_description
+        self.descriptionSize = description_size
+        self.sortedOutput = sorted_output
+        self.headerReserve = header_reserve
+        self.firstDGPointer = writer.HDBlock.firstDGPointer
+        self.numberOfDGs = writer.HDBlock.numberOfDGs
+        self.dgBlockList = writer.dgBlockList
+        self.cgBlockList = writer.cgBlockList
+        self.dgPointers = writer.dgPointers
+        self.cgPointers = writer.cgPointers
+        self.cnPointers = writer.cnPointers
+        self.state = dict((name, getattr(writer, name)) for name in TEMPLATE_STATE)
+        writer.file.close()
+
+    def apply(self, mdf, file_description=None):
+        """Gives a new MDF object the layout of the template and writes the header with the author, project, DUT and
+        start time of mdf and the file comment. Called by MDF.from_template.
+        :param MDF mdf: MDF without channel groups, created with the sortedOutput and headerReserve of the template
+        :param str file_description: Text of the file comment, defaults to the description of the template
+        """
+        if file_description is None:
+            file_description = self.fileDescription
+        if len(file_description) >= self.descriptionSize:
+            raise ValueError("file description does not fit into the %d bytes of the template" % self.descriptionSize)
+        if mdf.cgBlockList or mdf.datapointer:
+            raise ValueError("templates are applied to new MDF objects")
+        for name, value in self.state.items():
+            setattr(mdf, name, copy.copy(value))
+        dg_blocks = dict((id(dg_block), copy.copy(dg_block)) for dg_block in self.dgBlockList)
+        mdf.dgBlockList = [dg_blocks[id(dg_block)] for dg_block in self.dgBlockList]
+        mdf.DGBlock = None if self.sortedOutput else mdf.dgBlockList[0]
+        mdf.cgBlockList = []
+        for cg_block in self.cgBlockList:
+            cg_block = copy.copy(cg_block)
+            cg_block.policy = None  # recording policies hold per-file state, set them on every file
+            mdf.cgBlockList.append(cg_block)
+        mdf.channelGroupDictionary = dict((cg_block.name, cg_block) for cg_block in mdf.cgBlockList)
+        mdf.dgPointers = dict(self.dgPointers)
+        mdf.cgPointers = dict(self.cgPointers)
+        mdf.cnPointers = dict(self.cnPointers)
+        mdf.TXBlock = TXBlock(encode_field(file_description, self.descriptionSize))
+        hd = mdf.HDBlock
+        hd.firstDGPointer = self.firstDGPointer
+        hd.numberOfDGs = self.numberOfDGs
+
+        header = bytearray(self.header)
+        time_pointer = mdf.timepointer
+        header[time_pointer - len(hd.date):time_pointer] = encode_field(hd.date, len(hd.date), False)
+        header[time_pointer:time_pointer + len(hd.time)] = encode_field(hd.time, len(hd.time), False)
+        author = time_pointer + HD_AUTHOR_OFFSET
+        header[author:author + 32] = hd.author
+        header[author + 64:author + 96] = hd.project
+        header[author + 96:author + 128] = hd.dut
+        STRUCT_TYPE['LONG'].pack_into(header, mdf.timestampPointer, hd.local_time_ns())
+        STRUCT_TYPE['INT16'].pack_into(header, mdf.timestampPointer + 8, hd.utcOffset)
+        text = mdf.HEADER_SIZE + 4  # behind the TX block ID and size
+        header[text:text + self.descriptionSize] = mdf.TXBlock.text
+        mdf.file.seek(0)
+        mdf._write_to_file(bytes(header))
@@ -0,0 +1,154 @@
+"""Event triggered capture. A TriggeredMDF keeps the packed records of the last pre_trigger seconds of all channel
+groups in memory instead of writing them. When a trigger fires, the pre-trigger window is written to the file, followed
+by every record up to post_trigger seconds after the trigger. Records outside of any capture window never reach the
+disk, so only the time around the events is logged.
+
+    mdf = TriggeredMDF('faults.mdf', author, project, dut, pre_trigger=10, post_trigger=5)
+    mdf.add_channel_group(message)
+    mdf.start_file()
+    mdf.add_trigger('DTC_0x7E8')                                   # any frame of a CAN ID
+    mdf.add_trigger('Battery', lambda value: value[0] > 60.0)      # a signal threshold
+    mdf.write(...)
+    mdf.trigger(reason='button')                                   # from the application
+"""
+import collections
+import logging
+import struct
+from .mdf import MDF
+
+logger = logging.getLogger(__name__)
+
+TIMESTAMP = struct.Struct('<d')
+
+
+def _any_record(value):
+    return True
+
+
+class TriggeredMDF(MDF):
+    """MDF that only writes the records around trigger events. The capture windows of all events are appended to the
+    open file in timestamp order, overlapping windows are merged. Records are packed as usual, the ring holds the
+    packed records, so a capture costs one file write per buffered record.
+    :param float pre_trigger: Seconds of records before a trigger that are kept in memory and written on a trigger
+    :param float post_trigger: Seconds of records after a trigger that are written
+    :param int ring_size: Bytes of packed records held in the ring. Once full, the oldest records are dropped even if
+        they are inside the pre-trigger window. None bounds the ring by pre_trigger only.
+    See MDF for the other parameters.
+    """
+    def __init__(self, file_name, author, project, dut, pre_trigger, post_trigger, file_description=None,
+                 ring_size=None, **kwargs):
+        MDF.__init__(self, file_name, author, project, dut, file_description, **kwargs)
+        self.preTrigger = pre_trigger
+        self.postTrigger = post_trigger
+        self.ringSize = ring_size
+        self.ring = collections.deque()  # (timestamp, cg_block, packet, packetsize)
+        self.ringBytes = 0
+        self.captureEnd = None  # timestamp up to which records are written, None while idle
+        self.lastTimestamp = None
+        self.triggers = {}  # channel group name -> predicate of the record value
+        self.triggerEvents = []  # (timestamp, reason) of every trigger that started a capture
+        self.discardedRecords = 0  # records that left the ring without a trigger or were in it at close
+        self.timestampOffset = 0 if self.sortedOutput else 1  # behind the record ID
+        self.rollingOver = False
+
+    def add_trigger(self, channelgroup_name, predicate=None):
+        """Fires a trigger when a record of a ChannelGroup is written and predicate(value) is true. A CAN ID is
+        triggered by the group of its CANmsg, a signal threshold by a predicate on the value list.
+        :param str channelgroup_name: Name of the ChannelGroup
+        :param predicate: Function of the record value, None triggers on every record of the group
+        """
+        self.triggers[channelgroup_name] = predicate or _any_record
+
+    def remove_trigger(self, channelgroup_name):
+        """Removes the trigger of a ChannelGroup."""
+        self.triggers.pop(channelgroup_name, None)
+
+    def trigger(self, timestamp_offset=None, reason=None):
+        """Writes the pre-trigger window and starts or extends the post-trigger window.
+        :param float timestamp_offset: Time of the event, defaults to the newest record written
+        :param reason: Stored with the event in triggerEvents
+        """
+        with self.lock:
+            self._trigger(timestamp_offset, reason)
+
+    def close_file(self):
+        """Counts the records still in the ring as discarded and closes the file, see MDF.close_file. The ring is kept
+        when a rollover closes the file."""
+        if not self.rollingOver:
+            while self.ring:
+                self.ring.popleft()
+                self._discard()
+            self.ringBytes = 0
+        MDF.close_file(self)
+
+    def _rollover(self):
+        self.rollingOver = True
+        try:
+            MDF._rollover(self)
+        finally:
+            self.rollingOver = False
+
+    def _trigger(self, timestamp_offset, reason):
+        if timestamp_offset is None:
+            timestamp_offset = self.lastTimestamp or 0
+        if self.captureEnd is None or timestamp_offset > self.captureEnd:
+            logger.info("Trigger at %s: %s", timestamp_offset, reason)
+            self.triggerEvents.append((timestamp_offset, reason))
+        window_start = timestamp_offset - self.preTrigger
+        ring = self.ring
+        while ring:
+            timestamp, cg_block, packet, packetsize = ring.popleft()
+            if timestamp >= window_start:
+                MDF._store_record(self, cg_block, packet, packetsize)
+            else:
+                self._discard()
+        self.ringBytes = 0
+        capture_end = timestamp_offset + self.postTrigger
+        if self.captureEnd is None or capture_end > self.captureEnd:
+            self.captureEnd = capture_end
+
+    def _write_records(self, channelgroup_name, records, start_tick=None):
+        """Splits the records of a group with a trigger at every triggering record, which fires the trigger before it
+        is stored, so the triggering record is written."""
+        predicate = self.triggers.get(channelgroup_name)
+        if predicate is None:
+            MDF._write_records(self, channelgroup_name, records, start_tick)
+            return
+        if start_tick is None:
+            records = list(records)
+        else:
+            records = [((tick - start_tick) / 1e9, value) for tick, value in records]
+        start = 0
+        for index, (timestamp_offset, value) in enumerate(records):
+            if predicate(value):
+                if index > start:
+                    MDF._write_records(self, channelgroup_name, records[start:index])
+                    start = index
+                self.trigger(timestamp_offset, channelgroup_name)
+        MDF._write_records(self, channelgroup_name, records[start:])
+
+    def _store_record(self, cg, packet, packetsize):
+        """Writes records inside a capture window, keeps all other records in the ring."""
+        timestamp = TIMESTAMP.unpack_from(packet, self.timestampOffset)[0]
+        self.lastTimestamp = timestamp
+        if self.captureEnd is not None:
+            if timestamp <= self.captureEnd:
+                MDF._store_record(self, cg, packet, packetsize)
+                return
+            self.captureEnd = None
+        ring = self.ring
+        ring.append((timestamp, cg, packet, packetsize))
+        self.ringBytes += len(packet)
+        window_start = timestamp - self.preTrigger
+        ring_size = self.ringSize
+        while ring[0][0] < window_start or (ring_size is not None and self.ringBytes > ring_size):
+            self.ringBytes -= len(ring.popleft()[2])
+            self._discard()
+            if not ring:
+                break
+
+    def _discard(self):
+        """Counts a record that left the ring without a trigger."""
+        self.discardedRecords += 1
+        if self.metrics is not None:
+            self.metrics.add_dropped()
@@ -1,10 +1,69 @@
+import time
+
+
+def _time_ns():
+    return int(time.time() * 1000000000)
+
+
+_monotonic = getattr(time, 'monotonic', time.time)
+
+
+def _monotonic_ns():
+    return int(_monotonic() * 1000000000)
+
+
+# Wall clock and monotonic clock in integer nanoseconds, with float based fallbacks on older Pythons
+time_ns = getattr(time, 'time_ns', _time_ns)
+monotonic_ns = getattr(time, 'monotonic_ns', _monotonic_ns)
+
+
+TEXT_TYPE = type(u'')  # unicode on Python 2, str on Python 3
+FIELD_CACHE_SIZE = 4096  # fields kept by encode_field before the cache starts over
+_fieldCache = {}
+
+
 def formatstring(s, limit):
     """This method truncates strings to specified length and makes
     sure they are delimited with correct MDF spec delimiter (NULL)."""
-    if len(s) > 0 & len(s) <= limit-1:
-        s += chr(0)*(limit-len(s))
-    elif len(s) == 0:
-        s = chr(0)*limit
-    elif len(s) >= limit:
-        s = s[0:limit-1] + chr(0)
-    return s
+    return s[:limit - 1].ljust(limit, chr(0))
+
+
+def encode_field(s, limit, terminated=True):
+    """Returns s as fixed size field of limit bytes, NULL padded. Text is encoded as latin-1. Fields of str, bytes and
+    text values are cached, names and units repeat a lot, so most calls return an existing bytes object.
+    :param s: str, bytes, bytearray or memoryview value
+    :param int limit: Size of the field in bytes
+    :param bool terminated: Truncate to limit - 1 bytes, so the field always ends with the MDF delimiter (NULL)
+    """
+    hashable = isinstance(s, (bytes, TEXT_TYPE))
+    if hashable:
+        field = _fieldCache.get((s, limit, terminated))
+        if field is not None:
+            return field
+    if isinstance(s, TEXT_TYPE):
+        data = s.encode('latin-1')
+    elif hashable:
+        data = s
+    else:
+        data = memoryview(s).tobytes()
+    field = data[:limit - 1 if terminated else limit].ljust(limit, b'\0')
+    if hashable:
+        if len(_fieldCache) >= FIELD_CACHE_SIZE:
+            _fieldCache.clear()
+        _fieldCache[(s, limit, terminated)] = field
+    return field
+
+
+def pack_field(buffer, offset, s, limit, terminated=True):
+    """Writes s as fixed size field into buffer at offset, see encode_field.
+    :param bytearray buffer: Target buffer, e.g. a record or block under construction
+    :param int offset: Position of the field in buffer
+    """
+    if isinstance(s, (bytes, TEXT_TYPE)):
+        buffer[offset:offset + limit] = encode_field(s, limit, terminated)
+        return
+    # bytearray and memoryview values change between calls, they are sliced straight into the buffer
+    size = min(len(s), limit - 1 if terminated else limit)
+    buffer[offset:offset + size] = s[:size]
+    if size < limit:
+        buffer[offset + size:offset + limit] = b'\0' * (limit - size)
@@ -0,0 +1,43 @@
+"""Readers of the MDF 4 files written by the tests, shared by the test modules."""
+import struct
+from mdfwriter.compression import decompress
+
+
+def read_block(data, address):
+    """Returns (block id, links, data section) of the MDF 4 block at address."""
+    block_id, length, link_count = struct.unpack_from('<4s4xQQ', data, address)
+    links = struct.unpack_from('<%dq' % link_count, data, address + 24)
+    return block_id, links, data[address + 24 + 8 * link_count:address + length]
+
+
+def read_records(data, address):
+    """Returns the uncompressed data behind a dg_data link."""
+    block_id, links, section = read_block(data, address)
+    if block_id == b'##DT':
+        return section
+    if block_id == b'##DZ':
+        zip_type, columns, _, length = struct.unpack_from('<2xBxIQQ', section)
+        return decompress(section[24:24 + length], zip_type, columns)
+    if block_id == b'##HL':
+        return read_records(data, links[0])
+    if block_id == b'##DL':
+        return b''.join(read_records(data, link) for link in links[1:] if link)
+    raise ValueError(block_id)
+
+
+def read_data_groups(data):
+    """Returns a list of (record ID size, [cycle counts], records) for every DG in the file."""
+    groups = []
+    _, hd_links, _ = read_block(data, 64)
+    dg = hd_links[0]
+    while dg:
+        _, dg_links, dg_data = read_block(data, dg)
+        counts = []
+        cg = dg_links[1]
+        while cg:
+            _, cg_links, cg_data = read_block(data, cg)
+            counts.append(struct.unpack_from('<8xQ', cg_data)[0])
+            cg = cg_links[0]
+        groups.append((struct.unpack_from('<B', dg_data)[0], counts, read_records(data, dg_links[2])))
+        dg = dg_links[0]
+    return groups
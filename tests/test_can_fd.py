@@ -0,0 +1,96 @@
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+from mdfwriter.mdf import MDF, CANmsg, CANSignal
+from mdfwriter.mdf4 import MDF4
+from mdfwriter.reader import MDFReader, merge_files
+from tests.mdf4_utils import read_data_groups
+
+PAYLOAD = bytes(bytearray(range(64)))
+
+
+class Test_CANFD(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.file_name = os.path.join(self.directory, 'test.mdf')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _message(self, name, message_id, length):
+        message = CANmsg(name)
+        message.messageID = message_id
+        message.length = length
+        signal = CANSignal('Last', 'Last byte of the frame')
+        signal.startBit = (max(length, 8) - 1) * 8
+        signal.bitCount = 8
+        message.add_signal(signal)
+        return message
+
+    def _write_file(self, mdf_class=MDF, **kwargs):
+        mdf = mdf_class(self.file_name, 'sadaleo', 'UnitTest', 'UnitTest', **kwargs)
+        mdf.set_start_time_ns(1580547600000000000)
+        mdf.add_channel_group(self._message('Classic', 0x100, 0))
+        mdf.add_channel_group(self._message('FD', 0x200, 64))
+        mdf.start_file()
+        mdf.write('Classic', 0, 0x0807060504030201)
+        mdf.write('FD', 1, PAYLOAD)
+        mdf.write_many('FD', [(2, bytearray(PAYLOAD[:12])), (3, memoryview(PAYLOAD)[32:])])
+        mdf.close_file()
+        with open(self.file_name, 'rb') as f:
+            return mdf, f.read()
+
+    def _fd_records(self):
+        return [struct.pack('<d64s', *values) for values in [(1, PAYLOAD), (2, PAYLOAD[:12]), (3, PAYLOAD[32:])]]
+
+    def test_record_sizes(self):
+        mdf, data = self._write_file()
+        self.assertEqual([cg_block.data_size for cg_block in mdf.cgBlockList], [16, 72])
+        expected = b'\x01' + struct.pack('<dQ', 0, 0x0807060504030201)
+        expected += b''.join(b'\x02' + record for record in self._fd_records())
+        self.assertEqual(data[mdf.datapointer:], expected)
+        self.assertEqual(mdf.cnBlockList[3].firstBitNo, 64 + 63 * 8)
+
+    def test_sorted_and_mdf4(self):
+        mdf, data = self._write_file(sorted_output=True)
+        self.assertTrue(data.endswith(b''.join(self._fd_records())))
+        mdf, data = self._write_file(MDF4, sorted_output=True)
+        self.assertEqual(read_data_groups(data)[1], (0, [3], b''.join(self._fd_records())))
+
+    def test_payload_too_long(self):
+        mdf = MDF(self.file_name, 'sadaleo', 'UnitTest', 'UnitTest', sorted_output=True)
+        mdf.add_channel_group(self._message('FD', 0x200, 12))
+        mdf.add_channel_group(self._message('Short', 0x300, 4))
+        mdf.start_file()
+        self.assertRaises(ValueError, mdf.write, 'FD', 0, PAYLOAD)
+        self.assertRaises(ValueError, mdf.write, 'Short', 0, 0x0504030201)
+        mdf.write('FD', 1, PAYLOAD[:12])
+        mdf.write('Short', 1, 0x04030201)
+        mdf.close_file()
+        self.assertEqual([cg_block.numberOfRecords for cg_block in mdf.cgBlockList], [1, 1])
+
+    def test_invalid_length(self):
+        mdf = MDF(self.file_name, 'sadaleo', 'UnitTest', 'UnitTest')
+        for length in (9, 13, 65):
+            self.assertRaises(ValueError, mdf.add_channel_group, self._message('FD', 0x200, length))
+        mdf.add_channel_group(self._message('FD', 0x200, 48))
+        self.assertEqual([cg_block.payloadSize for cg_block in mdf.cgBlockList], [48])
+        mdf.start_file()
+        mdf.close_file()
+
+    def test_read_and_merge(self):
+        self._write_file()
+        reader = MDFReader(self.file_name)
+        self.assertEqual([group.recordSize for group in reader.groups], [16, 72])
+        self.assertEqual(reader.groups[1].channelGroup.length, 64)
+        self.assertEqual([record[8:] for _, record_id, record in reader.records(0) if record_id == 2],
+                         [record[8:] for record in self._fd_records()])
+        reader.close()
+        merged = os.path.join(self.directory, 'merged.mdf')
+        self.assertEqual(merge_files([self.file_name], MDF(merged, 'sadaleo', 'UnitTest', 'UnitTest')), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from mdfwriter.mdf import MDF, CANmsg
+from mdfwriter.canbridge import CANBridge, open_bus
+from mdfwriter.reader import MDFReader
+
+try:
+    import can
+except ImportError:
+    can = None
+
+
+class Frame(object):
+    """The attributes of can.Message used by the bridge."""
+    def __init__(self, timestamp, arbitration_id, data, is_error_frame=False, is_remote_frame=False):
+        self.timestamp = timestamp
+        self.arbitration_id = arbitration_id
+        self.data = bytearray(data)
+        self.is_error_frame = is_error_frame
+        self.is_remote_frame = is_remote_frame
+
+
+class FakeBus(object):
+    """Bus with the recv() of can.BusABC that returns queued frames."""
+    def __init__(self, frames):
+        self.frames = list(frames)
+        self.timeouts = []
+
+    def recv(self, timeout=None):
+        self.timeouts.append(timeout)
+        if self.frames:
+            return self.frames.pop(0)
+        return None
+
+
+class Test_CANBridge(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.file_name = os.path.join(self.directory, 'test.mdf')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _start(self):
+        mdf = MDF(self.file_name, 'sadaleo', 'UnitTest', 'UnitTest')
+        for message_id, length in ((0x100, 8), (0x200, 64)):
+            message = CANmsg('CAN_0x%X' % message_id)
+            message.messageID = message_id
+            message.length = length
+            mdf.add_channel_group(message)
+        mdf.start_file()
+        return mdf
+
+    def _frames(self, start):
+        return [Frame(start + 0.5, 0x100, b'\1\2'),
+                Frame(start + 1.0, 0x200, bytes(bytearray(range(64)))),
+                Frame(start + 1.5, 0x300, b'\0'),
+                Frame(start + 2.0, 0x100, b'', is_remote_frame=True),
+                Frame(start + 2.5, 0x100, b'\3' * 8),
+                Frame(start + 3.0, 0, b'', is_error_frame=True)]
+
+    def test_batches_and_counts(self):
+        mdf = self._start()
+        bus = FakeBus(self._frames(mdf.HDBlock.startTimeNs / 1e9))
+        bridge = CANBridge(mdf, bus, batch_size=4)
+        self.assertEqual(bridge.poll(), 4)
+        self.assertEqual(bridge.poll(), 2)
+        self.assertEqual(bridge.poll(), 0)
+        self.assertEqual(bus.timeouts, [0.1, 0, 0, 0, 0.1, 0, 0, 0.1])
+        mdf.close_file()
+        self.assertEqual(bridge.counts(), {'busFrames': 6, 'writtenFrames': 3, 'unknownFrames': 1,
+                                           'skippedFrames': 2})
+        reader = MDFReader(self.file_name)
+        records = sorted((timestamp, record_id, data) for timestamp, record_id, data in reader.records(0))
+        reader.close()
+        self.assertEqual([(timestamp, record_id) for timestamp, record_id, _ in records], [(0.5, 1), (1.0, 2), (2.5, 1)])
+        self.assertEqual(records[0][2][8:], b'\1\2' + b'\0' * 6)
+        self.assertEqual(bytearray(records[1][2])[-64:], bytearray(range(64)))
+
+    def test_dropped_metrics(self):
+        mdf = self._start()
+        mdf.enable_metrics()
+        bridge = CANBridge(mdf, FakeBus(self._frames(0)), start_time=0)
+        while bridge.poll():
+            pass
+        mdf.close_file()
+        self.assertEqual(mdf.metrics.droppedRecords, 3)
+        self.assertEqual(sum(mdf.metrics.groupRecords.values()), 3)
+
+    @unittest.skipIf(can is None, "python-can is not installed")
+    def test_virtual_bus(self):
+        mdf = self._start()
+        channel = 'mdfwriter-test-%d' % os.getpid()
+        sender = can.Bus(channel=channel, interface='virtual')
+        bus = open_bus(channel, 'virtual')
+        try:
+            sender.send(can.Message(arbitration_id=0x100, data=[1, 2], is_extended_id=False))
+            sender.send(can.Message(arbitration_id=0x300, data=[0], is_extended_id=False))
+            sender.send(can.Message(arbitration_id=0x200, data=bytearray(range(64)), is_extended_id=False,
+                                    is_fd=True))
+            bridge = CANBridge(mdf, bus, timeout=1.0)
+            received = 0
+            for _ in range(10):
+                received += bridge.poll()
+                if received == 3:
+                    break
+        finally:
+            bus.shutdown()
+            sender.shutdown()
+        mdf.close_file()
+        self.assertEqual(bridge.counts(), {'busFrames': 3, 'writtenFrames': 2, 'unknownFrames': 1,
+                                           'skippedFrames': 0})
+        reader = MDFReader(self.file_name)
+        records = dict((record_id, data) for _, record_id, data in reader.records(0))
+        reader.close()
+        self.assertEqual(records[1][8:], b'\1\2' + b'\0' * 6)
+        self.assertEqual(bytearray(records[2][-64:]), bytearray(range(64)))
+
+    def test_background_thread(self):
+        mdf = self._start()
+        bridge = CANBridge(mdf, FakeBus(self._frames(0)), timeout=0.01, start_time=0)
+        bridge.start()
+        for _ in range(100):
+            if bridge.busFrames == 6:
+                break
+            time.sleep(0.01)
+        bridge.stop()
+        mdf.close_file()
+        self.assertEqual((bridge.busFrames, bridge.writtenFrames, bridge.error), (6, 3, None))
+        self.assertEqual([cg_block.numberOfRecords for cg_block in mdf.cgBlockList], [2, 1])
+
+
+if __name__ == '__main__':
+    unittest.main()
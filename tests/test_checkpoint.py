@@ -0,0 +1,128 @@
+import os
+import shutil
+import tempfile
+import unittest
+from mdfwriter.mdf import MDF, ChannelGroup, Channel, CANmsg
+from mdfwriter.mdf4 import MDF4
+from mdfwriter.reader import MDFReader
+from mdfwriter.recovery import recover_counts, scan_records
+from mdfwriter.shard import ShardLayout, ShardWriter, read_shard_header
+
+
+class Test_Checkpoint(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.file_name = os.path.join(self.directory, 'test.mdf')
+        self.copy_name = os.path.join(self.directory, 'crashed.mdf')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _groups(self):
+        channel_group = ChannelGroup('Channel Group 1', 'Description')
+        channel_group.add_channel(Channel("Name", "Units", "Description"))
+        message = CANmsg('Message')
+        message.messageID = 0x100
+        return [channel_group, message]
+
+    def _start(self, **kwargs):
+        mdf = MDF(self.file_name, 'sadaleo', 'UnitTest', 'UnitTest', **kwargs)
+        for channel_group in self._groups():
+            mdf.add_channel_group(channel_group)
+        mdf.start_file()
+        return mdf
+
+    def _crash_copy(self):
+        """Copies the file as it is on disk while the MDF is still open."""
+        shutil.copyfile(self.file_name, self.copy_name)
+
+    def _counts(self, file_name):
+        reader = MDFReader(file_name)
+        reader.close()
+        return [group.numberOfRecords for group in reader.groups]
+
+    def test_record_checkpoints(self):
+        mdf = self._start()
+        mdf.enable_checkpoints(records=5)
+        for i in range(12):
+            mdf.write('Channel Group 1', i, [i])
+            if i % 3 == 0:
+                mdf.write('Message', i, i)
+        self._crash_copy()
+        self.assertEqual(self._counts(self.copy_name), [11, 4])  # the checkpoint after record 15
+        mdf.close_file()
+        self.assertEqual(self._counts(self.file_name), [12, 4])
+        reader = MDFReader(self.file_name)
+        self.assertEqual([timestamp for timestamp, _, _ in reader.records(0)][-3:], [9, 10, 11])
+        reader.close()
+
+    def test_interval_checkpoints_and_disable(self):
+        mdf = self._start()
+        mdf.enable_checkpoints(interval=0)
+        mdf.write_many('Channel Group 1', [(i, [i]) for i in range(3)])
+        self._crash_copy()
+        self.assertEqual(self._counts(self.copy_name), [3, 0])
+        mdf.disable_checkpoints()
+        mdf.write('Channel Group 1', 3, [3])
+        mdf.checkpoint()
+        self._crash_copy()
+        self.assertEqual(self._counts(self.copy_name), [4, 0])
+        mdf.close_file()
+
+    def test_recover_counts(self):
+        mdf = self._start(header_reserve=1024)
+        mdf.add_channel_group(ChannelGroup('Late', 'Added at runtime', [Channel("Value", "-", "Description")]))
+        for i in range(10):
+            mdf.write('Channel Group 1', i, [i])
+            mdf.write('Late', i, [i])
+        mdf.write('Message', 10, 1)
+        mdf.file.flush()
+        self._crash_copy()
+        with open(self.copy_name, 'ab') as f:
+            f.write(b'\x01\0\0')  # a record cut off by the power loss
+        self.assertEqual(self._counts(self.copy_name), [0, 0, 0])
+        self.assertEqual(recover_counts(self.copy_name), [10, 1, 10])
+        reader = MDFReader(self.copy_name)
+        self.assertEqual([group.recordSize for group in reader.groups], [12, 16, 12])
+        self.assertEqual(len(list(reader.records(0))), 21)
+        reader.close()
+        mdf.close_file()
+
+    def test_scan_records_across_chunks(self):
+        data = b'head' + b''.join(b'\x01' + b'a' * 5 if i % 3 else b'\x02' + b'b' * 8 for i in range(50))
+        with open(self.copy_name, 'wb') as f:
+            f.write(data + b'\x01ab')
+        for buffer_size in (1, 7, 64, 4096):
+            self.assertEqual(scan_records(self.copy_name, 4, {1: 5, 2: 8}, buffer_size), ({1: 33, 2: 17}, len(data)))
+        with open(self.copy_name, 'wb') as f:
+            f.write(data + b'\x03' + b'c' * 20)
+        for buffer_size in (1, 7, 4096):
+            self.assertEqual(scan_records(self.copy_name, 4, {1: 5, 2: 8, 4: 1}, buffer_size),
+                             ({1: 33, 2: 17, 4: 0}, len(data)))
+
+    def test_shard_checkpoints(self):
+        writer = ShardWriter(self.file_name, ShardLayout(self._groups()))
+        writer.start_file()
+        writer.enable_checkpoints(records=2)
+        writer.write_many('Message', [(i, i) for i in range(3)])
+        self._crash_copy()
+        with open(self.copy_name, 'rb') as f:
+            self.assertEqual(read_shard_header(f)[2], [0, 3])
+        writer.write('Message', 3, 3)
+        writer.close_file()
+        with open(self.file_name, 'rb') as f:
+            self.assertEqual(read_shard_header(f)[2], [0, 4])
+
+    def test_unsupported_outputs(self):
+        mdf = self._start(sorted_output=True)
+        self.assertRaises(ValueError, mdf.enable_checkpoints, 10)
+        mdf.close_file()
+        mdf = MDF4(self.file_name, 'sadaleo', 'UnitTest', 'UnitTest')
+        self.assertRaises(ValueError, mdf.enable_checkpoints, 10)
+        mdf = self._start()
+        self.assertRaises(ValueError, mdf.enable_checkpoints)
+        mdf.close_file()
+
+
+if __name__ == '__main__':
+    unittest.main()
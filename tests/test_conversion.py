@@ -0,0 +1,69 @@
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+from mdfwriter.mdf import MDF, CANmsg, CANSignal
+from mdfwriter.mdf4 import MDF4
+from mdfwriter.reader import MDFReader
+
+
+class Test_Conversion(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.file_name = os.path.join(self.directory, 'test.mdf')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _message(self, index):
+        message = CANmsg('Message%d' % index)
+        message.messageID = 0x100 + index
+        switch = CANSignal('Switch', 'Switch state')
+        switch.bitCount = 1
+        switch.is_enum = True
+        switch.value_dict = {'0': 'OFF', '1': 'ON'} if index % 2 else {'1': 'ON', '0': 'OFF'}
+        speed = CANSignal('Speed', 'Vehicle speed')
+        speed.units = 'km/h'
+        speed.startBit = 8
+        speed.bitCount = 16
+        speed.scale = 0.5
+        message.add_signal(switch)
+        message.add_signal(speed)
+        return message
+
+    def _write_file(self, mdf_class=MDF):
+        mdf = mdf_class(self.file_name, 'sadaleo', 'UnitTest', 'UnitTest')
+        for index in range(3):
+            mdf.add_channel_group(self._message(index))
+        mdf.start_file()
+        mdf.close_file()
+        with open(self.file_name, 'rb') as f:
+            return mdf, f.read()
+
+    def test_identical_blocks_are_shared(self):
+        mdf, data = self._write_file()
+        self.assertEqual(len(mdf.cnBlockList), 9)
+        self.assertEqual([cc_block.conversionID for cc_block in mdf.cc_blockList], [0, 11, 0])
+        self.assertEqual(len(set(cn_block.ccBlock for cn_block in mdf.cnBlockList[1::3])), 1)
+        reader = MDFReader(self.file_name)
+        for group in reader.groups:
+            switch, speed = group.channelGroup.signalList
+            self.assertEqual(switch.value_dict, {0: 'OFF', 1: 'ON'})
+            self.assertEqual((speed.units, speed.offset, speed.scale), ('km/h', 0, 0.5))
+        reader.close()
+
+    def test_vtab_pairs_store_value_first(self):
+        mdf, data = self._write_file()
+        offset = data.index(b'CC', data.index(b'CC') + 2)  # the time channel CC block comes first
+        self.assertEqual(struct.unpack_from('<2sH', data, offset), (b'CC', 46 + 2 * 40))
+        self.assertEqual(struct.unpack_from('<d32s', data, offset + 46)[0], 0)
+        self.assertEqual(struct.unpack_from('<d32s', data, offset + 86)[1].rstrip(b'\0'), b'ON')
+
+    def test_mdf4_shares_conversions(self):
+        mdf, data = self._write_file(MDF4)
+        self.assertEqual(data.count(b'##CC'), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
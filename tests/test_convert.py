@@ -0,0 +1,143 @@
+import io
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import unittest
+from mdfwriter.convert import convert_file, main, parse_groups, split_unit
+from mdfwriter.reader import MDFReader
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+
+class Test_Convert(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _csv(self, name, text):
+        file_name = os.path.join(self.directory, name)
+        with io.open(file_name, 'w', newline='', encoding='utf-8') as f:
+            f.write(text)
+        return file_name
+
+    def _read(self, file_name):
+        """Returns [(group, [(timestamp, record)])] in the order the groups were added."""
+        reader = MDFReader(file_name)
+        try:
+            groups = dict((group.recordID, (group, [])) for group in reader.groups)
+            result = [groups[record_id] for record_id in sorted(groups)]
+            for data_group in range(len(reader.dataGroups)):
+                for timestamp, record_id, record in reader.records(data_group):
+                    groups[record_id][1].append((timestamp, record))
+        finally:
+            reader.close()
+        return result
+
+    def test_split_unit(self):
+        self.assertEqual(split_unit("Speed [km/h]"), ("Speed", "km/h"))
+        self.assertEqual(split_unit(" Torque (Nm) "), ("Torque", "Nm"))
+        self.assertEqual(split_unit("Gear"), ("Gear", ""))
+        self.assertEqual(split_unit("[s]"), ("[s]", ""))
+
+    def test_parse_groups(self):
+        self.assertEqual(parse_groups(["Engine=rpm, torque", "Body=door"]),
+                         [("Engine", ["rpm", "torque"]), ("Body", ["door"])])
+        self.assertRaises(ValueError, parse_groups, ["Engine"])
+
+    def test_csv(self):
+        input_name = self._csv('bench.csv', u"time [s],Speed [km/h],Gear,State\n"
+                                            u"0.0,10.5,1,idle\n0.1,11.0,2,drive\n0.2,,2,drive\nbad,1,1,x\n")
+        output_name = os.path.join(self.directory, 'bench.mdf')
+        self.assertEqual(convert_file(input_name, output_name, chunk_size=2), 3)
+        group, records = self._read(output_name)[0]
+        channels = group.channelGroup.channel_list
+        self.assertEqual([channel.name for channel in channels], ['Speed', 'Gear', 'State'])
+        self.assertEqual(channels[0].units, 'km/h')
+        self.assertEqual(channels[2].width, 5)
+        self.assertEqual([timestamp for timestamp, _ in records], [0.0, 0.1, 0.2])
+        values = [struct.unpack('<dff5s', record) for _, record in records]
+        self.assertAlmostEqual(values[1][1], 11.0)
+        self.assertNotEqual(values[2][1], values[2][1])  # empty cell is NaN
+        self.assertEqual([value[3] for value in values], [b'idle\0', b'drive', b'drive'])
+
+    def test_text_encoding(self):
+        input_name = self._csv('prices.csv', u"t,Currency,Price\n0,\u20ac,1.5\n1,\xa3,2\n")
+        output_name = os.path.join(self.directory, 'prices.mdf')
+        self.assertEqual(convert_file(input_name, output_name), 2)
+        _, records = self._read(output_name)[0]
+        self.assertEqual([struct.unpack('<d1sf', record)[1] for _, record in records], [b'?', b'\xa3'])
+
+    def test_text_after_first_chunk(self):
+        input_name = self._csv('late.csv', u"t,Gear\n0,1\n1,2\n2,R\n")
+        output_name = os.path.join(self.directory, 'late.mdf')
+        with self.assertRaises(ValueError) as context:
+            convert_file(input_name, output_name, chunk_size=2)
+        self.assertIn('data row 3: column "Gear"', str(context.exception))
+        self.assertFalse(os.path.exists(output_name))
+        self.assertEqual(convert_file(input_name, output_name, chunk_size=3), 3)
+
+    @unittest.skipUnless(hasattr(unittest.TestCase, 'assertLogs'), "assertLogs needs Python 3.4")
+    def test_long_text_after_first_chunk(self):
+        input_name = self._csv('states.csv', u"t,State\n0,on\n1,off\n2,longer_state\n3,longer_state\n")
+        output_name = os.path.join(self.directory, 'states.mdf')
+        with self.assertLogs('mdfwriter.convert', 'WARNING') as logs:
+            self.assertEqual(convert_file(input_name, output_name, chunk_size=2), 4)
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn('Column "State" holds text of up to 12 bytes from data row 3 on', logs.output[0])
+        _, records = self._read(output_name)[0]
+        self.assertEqual([struct.unpack('<d3s', record)[1] for _, record in records], [b'on\0', b'off', b'lon', b'lon'])
+        convert_file(input_name, output_name, chunk_size=2, string_width=12)
+        _, records = self._read(output_name)[0]
+        self.assertEqual(struct.unpack('<d12s', records[2][1])[1], b'longer_state')
+
+    def test_units_row_and_groups(self):
+        input_name = self._csv('run.csv', u"Time,rpm,torque,door\ns,1/min,Nm,\n0,800,10,0\n1,900,20,1\n")
+        output_name = os.path.join(self.directory, 'run.mdf')
+        convert_file(input_name, output_name, groups=[('Engine', ['rpm', 'torque'])])
+        groups = self._read(output_name)
+        self.assertEqual(len(groups), 2)
+        engine, records = groups[0]
+        self.assertEqual([channel.units for channel in engine.channelGroup.channel_list], ['1/min', 'Nm'])
+        self.assertEqual([struct.unpack('<dff', record) for _, record in records],
+                         [(0.0, 800.0, 10.0), (1.0, 900.0, 20.0)])
+        self.assertEqual([channel.name for channel in groups[1][0].channelGroup.channel_list], ['door'])
+        self.assertEqual(len(groups[1][1]), 2)
+        self.assertRaises(ValueError, convert_file, input_name, output_name, groups=[('Engine', ['speed'])])
+
+    def test_period(self):
+        input_name = self._csv('samples.csv', u"a;b\n1;2\n3;4\n5;6\n")
+        output_name = os.path.join(self.directory, 'samples.mdf')
+        convert_file(input_name, output_name, period=0.5, delimiter=';')
+        _, records = self._read(output_name)[0]
+        self.assertEqual([timestamp for timestamp, _ in records], [0.0, 0.5, 1.0])
+
+    def test_main(self):
+        inputs = [self._csv('run%d.csv' % index, u"t,x\n0,%d\n1,%d\n" % (index, index)) for index in range(3)]
+        output_dir = os.path.join(self.directory, 'out')
+        os.mkdir(output_dir)
+        inputs.append(self._csv('bad.csv', u"t,x\n0,1\n1,2\n2,R\n"))
+        stdout, sys.stdout = sys.stdout, StringIO()
+        stderr, sys.stderr = sys.stderr, StringIO()
+        try:
+            self.assertEqual(main(inputs + ['--output-dir', output_dir, '--processes', '2', '--chunk-size', '2']), 1)
+            output, errors = sys.stdout.getvalue(), sys.stderr.getvalue()
+        finally:
+            sys.stdout, sys.stderr = stdout, stderr
+        self.assertEqual(output.count('2 rows'), 3)
+        self.assertIn('bad.csv: failed, ValueError: data row 3', errors)
+        self.assertIn('1 of 4 conversions failed', errors)
+        self.assertFalse(os.path.exists(os.path.join(output_dir, 'bad.mdf')))
+        for index in range(3):
+            _, records = self._read(os.path.join(output_dir, 'run%d.mdf' % index))[0]
+            self.assertEqual([struct.unpack('<df', record)[1] for _, record in records], [index, index])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import os
+import shutil
+import tempfile
+import unittest
+from mdfwriter.mdf import MDF, ChannelGroup, Channel
+from mdfwriter.reader import MDFReader
+from mdfwriter.utils import formatstring, encode_field, pack_field
+
+
+class Test_Fields(unittest.TestCase):
+    def test_formatstring(self):
+        self.assertEqual(formatstring('', 4), '\0' * 4)
+        self.assertEqual(formatstring('ab', 4), 'ab\0\0')
+        self.assertEqual(formatstring('abc', 4), 'abc\0')
+        self.assertEqual(formatstring('abcdef', 4), 'abc\0')
+
+    def test_encode_field(self):
+        self.assertEqual(encode_field('km/h', 8), b'km/h\0\0\0\0')
+        self.assertEqual(encode_field(u'\xb0C', 4), b'\xb0C\0\0')
+        self.assertEqual(encode_field(b'abcdef', 4), b'abc\0')
+        self.assertEqual(encode_field(b'abcdef', 4, False), b'abcd')
+        self.assertEqual(encode_field(bytearray(b'ab'), 3), b'ab\0')
+        self.assertTrue(encode_field('Speed', 32) is encode_field('Speed', 32))
+
+    def test_pack_field(self):
+        buffer = bytearray(b'x' * 10)
+        pack_field(buffer, 1, 'ab', 3)
+        pack_field(buffer, 4, memoryview(b'cdefgh'), 4, False)
+        pack_field(buffer, 8, bytearray(b'i'), 2)
+        self.assertEqual(bytes(buffer), b'xab\0cdefi\0')
+
+
+class Test_TextUnits(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.file_name = os.path.join(self.directory, 'test.mdf')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_id_and_header_fields(self):
+        mdf = MDF(self.file_name, 'sadaleo', u'UnitTest', 'UnitTest', 'A file comment')
+        mdf.add_channel_group(ChannelGroup('Channel Group 1', 'Description', [Channel('A', 'V', 'Description')]))
+        mdf.start_file()
+        mdf.close_file()
+        with open(self.file_name, 'rb') as f:
+            data = f.read()
+        self.assertTrue(data.startswith(b'MDF     3.31    SAMDALEO'))
+        self.assertEqual(data[64:66], b'HD')
+        self.assertEqual(data[272:293], b'TX\x13\0A file comment\0DG')
+
+    def test_text_units_and_names(self):
+        mdf = MDF(self.file_name, 'sadaleo', 'UnitTest', 'UnitTest')
+        channel_group = ChannelGroup('Channel Group 1', 'Description')
+        channel_group.add_channel(Channel(u'Temperature', u'\xb0C', u'Description'))
+        channel_group.add_channel(Channel('Current', 'A', 'Description'))
+        mdf.add_channel_group(channel_group)
+        mdf.start_file()
+        mdf.write('Channel Group 1', 0, [20, 1])
+        mdf.close_file()
+        with open(self.file_name, 'rb') as f:
+            self.assertTrue(b'\xb0C\0' in f.read())
+        reader = MDFReader(self.file_name)
+        channels = reader.groups[0].channelGroup.channel_list
+        self.assertEqual([channel.name for channel in channels], ['Temperature', 'Current'])
+        self.assertEqual(channels[1].units, 'A')
+        self.assertEqual(reader.groups[0].recordSize, 16)
+        self.assertEqual(len(list(reader.records(0))), 1)
+        reader.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
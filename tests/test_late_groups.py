@@ -0,0 +1,119 @@
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+from mdfwriter.mdf import MDF, ChannelGroup, Channel, CANmsg, CANSignal
+from mdfwriter.mdf4 import MDF4
+from mdfwriter.reader import MDFReader
+from mdfwriter.shard import ShardLayout, ShardWriter
+from tests.mdf4_utils import read_data_groups
+
+
+class Test_LateGroups(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.file_name = os.path.join(self.directory, 'test1.mdf')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _channel_group(self):
+        channel_group = ChannelGroup('Channel Group 1', 'Description')
+        channel_group.add_channel(Channel("Name", "Units", "Description"))
+        return channel_group
+
+    def _message(self, message_id):
+        message = CANmsg('CAN_0x%X' % message_id)
+        message.messageID = message_id
+        signal = CANSignal('Switch_State_Of_The_Late_Message_%X' % message_id, 'Switch')
+        signal.bitCount = 1
+        signal.value_dict = {'0': 'OFF', '1': 'ON'}
+        message.add_signal(signal)
+        return message
+
+    def _log(self, mdf):
+        mdf.add_channel_group(self._channel_group())
+        mdf.start_file()
+        mdf.write('Channel Group 1', 0, [1])
+        mdf.add_channel_group(self._message(0x100))
+        mdf.write('CAN_0x100', 1, 1)
+        mdf.write('Channel Group 1', 2, [2])
+        mdf.add_channel_group(self._message(0x200))
+        mdf.write('CAN_0x200', 3, 0)
+        mdf.close_file()
+
+    def _read(self, file_name=None):
+        reader = MDFReader(file_name or self.file_name)
+        records = []
+        for data_group in range(len(reader.dataGroups)):
+            records.extend((timestamp, reader.groups[record_id - 1].name) for timestamp, record_id, _
+                           in reader.records(data_group))
+        reader.close()
+        return reader, sorted(records)
+
+    def _check(self, reader, records):
+        self.assertEqual([group.name for group in reader.groups], ['Channel Group 1', 'CAN_0x100', 'CAN_0x200'])
+        self.assertEqual([group.numberOfRecords for group in reader.groups], [2, 1, 1])
+        signal = reader.groups[2].channelGroup.signalList[0]
+        self.assertEqual((signal.name, signal.value_dict),
+                         ('Switch_State_Of_The_Late_Message_200', {0: 'OFF', 1: 'ON'}))
+        self.assertEqual(records, [(0, 'Channel Group 1'), (1, 'CAN_0x100'), (2, 'Channel Group 1'),
+                                   (3, 'CAN_0x200')])
+
+    def test_groups_in_reserve(self):
+        for sorted_output in (False, True):
+            mdf = MDF(self.file_name, 'sadaleo', 'UnitTest', 'UnitTest', sorted_output=sorted_output,
+                      header_reserve=4096)
+            self._log(mdf)
+            self.assertEqual(mdf.lateGroups, [])
+            self.assertTrue(mdf.reservePointer < mdf.datapointer)
+            reader, records = self._read()
+            self.assertEqual(reader.groups[1].recordSize, 16)
+            self._check(reader, records)
+
+    def test_groups_behind_data(self):
+        for sorted_output in (False, True):
+            mdf = MDF(self.file_name, 'sadaleo', 'UnitTest', 'UnitTest', sorted_output=sorted_output,
+                      header_reserve=1000)  # room for the first message only
+            self._log(mdf)
+            self._check(*self._read())
+            with open(self.file_name, 'rb') as f:
+                data = f.read()
+            self.assertEqual(data.count(b'OFF'), 1)  # the value table is shared by both messages
+
+    def test_rollover_keeps_late_groups(self):
+        mdf = MDF(self.file_name, 'sadaleo', 'UnitTest', 'UnitTest')
+        mdf.add_channel_group(self._channel_group())
+        mdf.start_file()
+        mdf.add_channel_group(self._message(0x100))
+        mdf.FILE_SIZE_LIMIT = mdf.datapointer
+        mdf.write('CAN_0x100', 0, 1)
+        mdf.write('CAN_0x100', 1, 0)
+        mdf.close_file()
+        second, = [name for name in os.listdir(self.directory) if name != 'test1.mdf']
+        reader, records = self._read(os.path.join(self.directory, second))
+        self.assertEqual([group.name for group in reader.groups], ['Channel Group 1', 'CAN_0x100'])
+        self.assertEqual(records, [(1, 'CAN_0x100')])
+
+    def test_mdf4(self):
+        for sorted_output in (False, True):
+            mdf = MDF4(self.file_name, 'sadaleo', 'UnitTest', 'UnitTest', sorted_output=sorted_output)
+            self._log(mdf)
+            with open(self.file_name, 'rb') as f:
+                groups = read_data_groups(f.read())
+            if sorted_output:
+                self.assertEqual([group[1] for group in groups], [[2], [1], [1]])
+                self.assertEqual(groups[2][2], struct.pack('<dQ', 3, 0))
+            else:
+                self.assertEqual([group[1] for group in groups], [[2, 1, 1]])
+
+    def test_shard_layout_is_fixed(self):
+        writer = ShardWriter(self.file_name, ShardLayout([self._channel_group()]))
+        writer.start_file()
+        self.assertRaises(ValueError, writer.add_channel_group, self._message(0x100))
+        writer.close_file()
+
+
+if __name__ == '__main__':
+    unittest.main()
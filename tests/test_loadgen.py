@@ -0,0 +1,90 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from mdfwriter.mdf import MDF, DEJ
+from mdfwriter.loadgen import LoadGenerator, bus_load, main
+from mdfwriter.reader import MDFReader
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+
+class Test_LoadGenerator(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.file_name = os.path.join(self.directory, 'test.mdf')
+        self.dej_name = os.path.join(self.directory, 'test.json')
+        signal = {'endianness': 'LITTLE', 'signedness': 'UNSIGNED', 'min': 0, 'max': 0, 'start_position': 0,
+                  'units': 'rpm', 'width': 16, 'scale': 1}
+        messages = dict(('Message%d' % i, {'senders': ['ECU'], 'message_id': i, 'length_bytes': 8 * (i + 1),
+                                           'signals': {'Signal': signal}}) for i in range(3))
+        with open(self.dej_name, 'w') as f:
+            json.dump({'messages': messages}, f)
+        self.messages = sorted(DEJ(self.dej_name).get_message_list(), key=lambda message: message.name)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _start(self):
+        mdf = MDF(self.file_name, 'sadaleo', 'UnitTest', 'UnitTest')
+        for message in self.messages:
+            mdf.add_channel_group(message)
+        mdf.start_file()
+        return mdf
+
+    def test_frames(self):
+        generator = LoadGenerator(None, self.messages, periods={'Message0': 0.1, 'Message1': 0.2, 'Message2': 0.5},
+                                  payload='counter')
+        frames = list(generator.frames(1.0))
+        self.assertEqual(len(frames), 10 + 5 + 2)
+        self.assertEqual(frames, sorted(frames))
+        payloads = [payload for _, name, payload in frames if name == 'Message1']
+        self.assertEqual([len(payload) for payload in payloads], [16] * 5)
+        self.assertEqual(bytearray(payloads[1])[:2], bytearray([1, 2]))
+
+    def test_rate_and_load(self):
+        generator = LoadGenerator(None, self.messages, periods={'Message0': 0.1}, rate=1000)
+        self.assertAlmostEqual(generator.frame_rate(), 1000)
+        self.assertAlmostEqual(generator.periods['Message0'] / generator.periods['Message1'], 10)
+        generator = LoadGenerator(None, self.messages, load=0.5, bitrate=250000)
+        self.assertAlmostEqual(bus_load(self.messages, generator.periods, 250000), 0.5)
+        self.assertRaises(ValueError, LoadGenerator, None, self.messages, payload='sine')
+
+    def test_run(self):
+        mdf = self._start()
+        generator = LoadGenerator(mdf, self.messages, rate=300, payload='zeros')
+        report = generator.run(0.2, batch_size=8)
+        mdf.close_file()
+        self.assertEqual(report['written'] + report['dropped'], report['frames'])
+        self.assertEqual(report['latency']['count'], report['written'])
+        self.assertAlmostEqual(report['targetRate'], 300)
+        reader = MDFReader(self.file_name)
+        self.assertEqual(sum(group.numberOfRecords for group in reader.groups), report['written'])
+        reader.close()
+
+    def test_run_without_pacing(self):
+        mdf = self._start()
+        report = LoadGenerator(mdf, self.messages, rate=3000, seed=1).run(1.0, batch_size=16, realtime=False)
+        mdf.close_file()
+        frames = list(LoadGenerator(None, self.messages, rate=3000, seed=1).frames(1.0))
+        self.assertEqual((report['frames'], report['written'], report['dropped']), (len(frames), len(frames), 0))
+
+    def test_command_line(self):
+        stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            main([self.dej_name, self.file_name, '--duration', '0.1', '--rate', '200', '--seed', '3'])
+            report = json.loads(sys.stdout.getvalue())
+        finally:
+            sys.stdout = stdout
+        self.assertEqual(report['written'] + report['dropped'], report['frames'])
+        self.assertTrue(os.path.getsize(self.file_name) > 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+from mdfwriter.mdf import ChannelGroup, Channel
+from mdfwriter.mdf4 import MDF4
+from mdfwriter.compression import DEFLATE, TRANSPOSE_DEFLATE, transpose, untranspose
+from tests.mdf4_utils import read_data_groups
+
+
+class Test_MDF4(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.file_name = os.path.join(self.directory, 'test.mf4')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _start_file(self, **kwargs):
+        mdf = MDF4(self.file_name, 'sadaleo', 'UnitTest', 'UnitTest', **kwargs)
+        channel_group_1 = ChannelGroup('Channel Group 1', 'Description')
+        channel_group_1.add_channel(Channel("Name", "Units", "Description"))
+        channel_group_1.add_channel(Channel("Name2", "Units2", "Description2"))
+        channel_group_2 = ChannelGroup('Channel Group 2', 'Description')
+        channel_group_2.add_channel(Channel("Name3", "Units3", "Description3"))
+        mdf.add_channel_group(channel_group_1)
+        mdf.add_channel_group(channel_group_2)
+        mdf.start_file()
+        return mdf
+
+    def _write_file(self, **kwargs):
+        mdf = self._start_file(**kwargs)
+        for i in range(100):
+            mdf.write('Channel Group 1', i, [i, i * 2])
+            mdf.write('Channel Group 2', i + 0.5, [i * 3])
+        mdf.close_file()
+        with open(self.file_name, 'rb') as f:
+            return f.read()
+
+    def _expected_unsorted(self):
+        return b''.join(struct.pack('<Bdff', 1, i, i, i * 2) + struct.pack('<Bdf', 2, i + 0.5, i * 3)
+                        for i in range(100))
+
+    def test_file_is_finalized_at_close(self):
+        mdf = self._start_file()
+        mdf.file.flush()
+        with open(self.file_name, 'rb') as f:
+            self.assertEqual(f.read(8), b'UnFinMF ')
+        mdf.close_file()
+        with open(self.file_name, 'rb') as f:
+            data = f.read()
+        self.assertEqual(data[:16], b'MDF     4.10    ')
+        self.assertEqual(struct.unpack_from('<H', data, 28)[0], 410)
+        self.assertEqual(struct.unpack_from('<HH', data, 60), (0, 0))
+
+    def test_unsorted_data_blocks(self):
+        for kwargs in ({}, {'chunk_size': 100}, {'compression': DEFLATE, 'chunk_size': 1000},
+                       {'compression': TRANSPOSE_DEFLATE}):
+            groups = read_data_groups(self._write_file(**kwargs))
+            self.assertEqual(len(groups), 1)
+            self.assertEqual(groups[0][:2], (1, [100, 100]))
+            self.assertEqual(groups[0][2], self._expected_unsorted())
+
+    def test_sorted_data_blocks(self):
+        for kwargs in ({}, {'compression': DEFLATE}, {'compression': TRANSPOSE_DEFLATE, 'chunk_size': 160},
+                       {'compression': TRANSPOSE_DEFLATE, 'spill_budget': 0}):
+            groups = read_data_groups(self._write_file(sorted_output=True, **kwargs))
+            self.assertEqual([group[:2] for group in groups], [(0, [100]), (0, [100])])
+            self.assertEqual(groups[0][2], b''.join(struct.pack('<dff', i, i, i * 2) for i in range(100)))
+            self.assertEqual(groups[1][2], b''.join(struct.pack('<df', i + 0.5, i * 3) for i in range(100)))
+
+    def test_background_compression(self):
+        for kwargs in ({'compression': DEFLATE, 'chunk_size': 500}, {'compression': TRANSPOSE_DEFLATE},
+                       {'compression': None, 'chunk_size': 100}):
+            groups = read_data_groups(self._write_file(background_compression=True, **kwargs))
+            self.assertEqual(groups, [(1, [100, 100], self._expected_unsorted())])
+
+    def test_background_compression_sorted_chunks(self):
+        data = self._write_file(sorted_output=True, compression=TRANSPOSE_DEFLATE, chunk_size=320,
+                                background_compression=True, queue_size=1)
+        self.assertEqual(data.count(b'##DZ'), 5 + 4)  # 100 records of 16 and 12 bytes in chunks of 320 bytes
+        groups = read_data_groups(data)
+        self.assertEqual(groups[0][2], b''.join(struct.pack('<dff', i, i, i * 2) for i in range(100)))
+        self.assertEqual(groups[1][2], b''.join(struct.pack('<df', i + 0.5, i * 3) for i in range(100)))
+
+    def test_background_worker_stops_at_close(self):
+        mdf = self._start_file(background_compression=True, compression=DEFLATE)
+        self.assertTrue(mdf.compressionThread.is_alive())
+        thread = mdf.compressionThread
+        mdf.close_file()
+        self.assertFalse(thread.is_alive())
+
+    def test_background_compression_error(self):
+        mdf = self._start_file(background_compression=True, compression=DEFLATE)
+        metrics = mdf.enable_metrics()
+
+        def fail(data, zip_type, columns=0):
+            raise RuntimeError("compression failed")
+        mdf._data_block = fail
+        mdf.write_many('Channel Group 1', [(i, [i, i]) for i in range(20)])
+        self.assertRaises(RuntimeError, mdf.close_file)
+        self.assertTrue(mdf.file.closed)
+        self.assertEqual(mdf.compressionThread, None)
+        self.assertEqual(metrics.fileWrite.count, 0)
+
+    def test_invalid_compression(self):
+        for compression in ('deflate', 2, -1):
+            self.assertRaises(ValueError, MDF4, self.file_name, 'sadaleo', 'UnitTest', 'UnitTest',
+                              compression=compression)
+        self.assertFalse(os.path.exists(self.file_name))
+
+    def test_compressed_file_is_smaller(self):
+        plain = self._write_file(sorted_output=True)
+        compressed = self._write_file(sorted_output=True, compression=TRANSPOSE_DEFLATE)
+        self.assertTrue(len(compressed) < len(plain))
+        self.assertTrue(b'##DZ' in compressed)
+
+
+class Test_Transpose(unittest.TestCase):
+    def test_transpose_round_trip(self):
+        data = b''.join(struct.pack('<df', i, i * 2) for i in range(10)) + b'tail'
+        transposed = transpose(data, 12)
+        self.assertEqual(transposed[:10], data[0:120:12])
+        self.assertEqual(transposed[-4:], b'tail')
+        self.assertEqual(untranspose(transposed, 12), data)
@@ -0,0 +1,79 @@
+import os
+import shutil
+import tempfile
+import unittest
+from mdfwriter.mdf import MDF, ChannelGroup, Channel
+from mdfwriter.mdf4 import MDF4
+from mdfwriter.metrics import MDFMetrics, Histogram
+
+
+class Test_Metrics(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _start_file(self, mdf_class=MDF, **kwargs):
+        mdf = mdf_class(os.path.join(self.directory, 'test.mdf'), 'sadaleo', 'UnitTest', 'UnitTest', **kwargs)
+        channel_group_1 = ChannelGroup('Channel Group 1', 'Description')
+        channel_group_1.add_channel(Channel("Name", "Units", "Description"))
+        channel_group_2 = ChannelGroup('Channel Group 2', 'Description')
+        channel_group_2.add_channel(Channel("Name2", "Units2", "Description2"))
+        channel_group_2.add_channel(Channel("Name3", "Units3", "Description3"))
+        mdf.add_channel_group(channel_group_1)
+        mdf.add_channel_group(channel_group_2)
+        mdf.start_file()
+        return mdf
+
+    def test_disabled_by_default(self):
+        mdf = self._start_file()
+        mdf.write('Channel Group 1', 0, [1])
+        self.assertEqual(mdf.metrics_snapshot(), None)
+        mdf.close_file()
+
+    def test_records_and_bytes_per_group(self):
+        mdf = self._start_file()
+        mdf.enable_metrics()
+        for i in range(10):
+            mdf.write('Channel Group 1', i, [i])
+        for i in range(5):
+            mdf.write('Channel Group 2', i, [i, i])
+        snapshot = mdf.metrics_snapshot()
+        mdf.close_file()
+        self.assertEqual(snapshot['records'], 15)
+        self.assertEqual(snapshot['bytes'], 10 * 13 + 5 * 17)
+        self.assertEqual(snapshot['groups']['Channel Group 1'], {'records': 10, 'bytes': 130})
+        self.assertEqual(snapshot['groups']['Channel Group 2'], {'records': 5, 'bytes': 85})
+        self.assertEqual(snapshot['lockWait']['count'], 15)
+        self.assertEqual(snapshot['lockHold']['count'], 15)
+        self.assertEqual(snapshot['fileWrite']['count'], 15)
+        self.assertEqual(snapshot['queueDepth'], 0)
+        self.assertEqual(snapshot['droppedRecords'], 0)
+
+    def test_callback_at_interval_and_close(self):
+        snapshots = []
+        mdf = self._start_file(MDF4, background_compression=True)
+        metrics = mdf.enable_metrics(MDFMetrics(callback=snapshots.append, interval=0))
+        mdf.write('Channel Group 1', 0, [1])
+        mdf.write('Channel Group 1', 1, [2])
+        mdf.close_file()
+        self.assertEqual(len(snapshots), 3)
+        self.assertEqual(snapshots[-1]['records'], 2)
+        self.assertEqual(snapshots[-1]['fileWrite']['count'], 0)  # the worker does not time its writes
+        self.assertTrue(metrics is mdf.metrics)
+
+
+class Test_Histogram(unittest.TestCase):
+    def test_percentiles(self):
+        histogram = Histogram()
+        for i in range(99):
+            histogram.add(0.000003)
+        histogram.add(0.5)
+        snapshot = histogram.snapshot()
+        self.assertEqual(snapshot['count'], 100)
+        self.assertEqual(snapshot['max'], 0.5)
+        self.assertEqual(snapshot['p50'], 0.000004)
+        self.assertEqual(snapshot['p99'], 0.000004)
+        self.assertEqual(histogram.percentile(1.0), 0.5)
+        self.assertEqual(snapshot['buckets'], {4: 99, 2 ** 19: 1})
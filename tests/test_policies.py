@@ -0,0 +1,97 @@
+import os
+import shutil
+import tempfile
+import unittest
+from mdfwriter.mdf import MDF, ChannelGroup, Channel, CANmsg
+from mdfwriter.policies import EveryNth, MinInterval, Deadband
+from mdfwriter.reader import MDFReader
+
+
+class Test_Policies(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.file_name = os.path.join(self.directory, 'test.mdf')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _start(self):
+        mdf = MDF(self.file_name, 'sadaleo', 'UnitTest', 'UnitTest')
+        channel_group = ChannelGroup('Channel Group 1', 'Description')
+        channel_group.add_channel(Channel("Name", "Units", "Description"))
+        channel_group.add_channel(Channel("Name2", "Units2", "Description2"))
+        message = CANmsg('Message')
+        message.messageID = 0x100
+        mdf.add_channel_group(channel_group)
+        mdf.add_channel_group(message)
+        mdf.start_file()
+        return mdf
+
+    def _timestamps(self, record_id):
+        reader = MDFReader(self.file_name)
+        timestamps = [timestamp for timestamp, rid, _ in reader.records(0) if rid == record_id]
+        reader.close()
+        return timestamps
+
+    def test_every_nth_across_batches(self):
+        policy = EveryNth(3)
+        records = [(i, [i]) for i in range(10)]
+        kept = policy.keep(records[:4]) + policy.keep(records[4:5]) + policy.keep(records[5:])
+        self.assertEqual([timestamp for timestamp, _ in kept], [0, 3, 6, 9])
+        self.assertRaises(ValueError, EveryNth, 0)
+
+    def test_min_interval(self):
+        policy = MinInterval(1.0)
+        kept = policy.keep([(t * 0.25, [0]) for t in range(9)])
+        self.assertEqual([timestamp for timestamp, _ in kept], [0, 1.0, 2.0])
+        policy.reset()
+        self.assertEqual(len(policy.keep([(0.5, [0])])), 1)
+        unordered = [(t, [0]) for t in (1.0, 2.4, 1.2, 2.6, 3.6)]
+        self.assertEqual([timestamp for timestamp, _ in policy.keep(unordered)], [2.4, 3.6])
+
+    def test_min_interval_matches_loop(self):
+        records = [(t * 0.1, [t]) for t in range(100)]
+        batched, single = MinInterval(0.35), MinInterval(0.35)
+        kept = batched.keep(records[:37]) + batched.keep(records[37:])
+        self.assertEqual(kept, [record for record in records if single.keep([record])])
+
+    def test_deadband(self):
+        policy = Deadband([0.5, 0], max_interval=10)
+        value = [0.0, 1]
+        records = []
+        for timestamp, (first, second) in enumerate([(0, 1), (0.4, 1), (0.6, 1), (0.6, 2), (0.6, 2)]):
+            value[0], value[1] = first, second  # the same list refilled by the caller
+            records.extend(policy.keep([(timestamp, value)]))
+        self.assertEqual([timestamp for timestamp, _ in records], [0, 2, 3])
+        self.assertEqual([timestamp for timestamp, _ in policy.keep([(13, [0.6, 2])])], [13])
+        self.assertEqual(Deadband().keep([(0, b'\1'), (1, b'\1'), (2, b'\2')]), [(0, b'\1'), (2, b'\2')])
+
+    def test_deadband_refilled_buffer(self):
+        policy = Deadband()
+        payload = bytearray(8)
+        row = [0, bytearray(2)]
+        counts = []
+        for i in range(5):
+            payload[0] = i
+            row[1][0] = i
+            counts.append((len(policy.keep([(i, payload)])), len(policy.keep([(i, row)]))))
+        self.assertEqual(counts, [(1, 1)] * 5)
+
+    def test_policies_in_write_path(self):
+        mdf = self._start()
+        metrics = mdf.enable_metrics()
+        mdf.set_recording_policy('Channel Group 1', EveryNth(2))
+        mdf.set_recording_policy('Message', Deadband())
+        for i in range(5):
+            mdf.write('Channel Group 1', i, [i, 0])
+        mdf.write_many('Message', iter([(i, i // 2) for i in range(6)]))
+        mdf.set_recording_policy('Channel Group 1', None)
+        mdf.write('Channel Group 1', 5, [5, 0])
+        mdf.close_file()
+        self.assertEqual(self._timestamps(1), [0, 2, 4, 5])
+        self.assertEqual(self._timestamps(2), [0, 2, 4])
+        self.assertEqual(metrics.snapshot()['filteredRecords'], 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,170 @@
+import json
+import os
+import pstats
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+from mdfwriter.mdf import MDF, ChannelGroup, Channel
+from mdfwriter.mdf4 import MDF4
+from mdfwriter.profiling import PhaseTimer, CProfileHook, Profiler, import_time
+
+
+class Test_Profiling(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.file_name = os.path.join(self.directory, 'test.mdf')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _channel_group(self):
+        channel_group = ChannelGroup('Channel Group 1', 'Description')
+        channel_group.add_channel(Channel("Name", "Units", "Description"))
+        return channel_group
+
+    def _write_dej(self):
+        path = os.path.join(self.directory, 'test.json')
+        signal = {'endianness': 'LITTLE', 'signedness': 'UNSIGNED', 'min': 0, 'max': 0, 'start_position': 0,
+                  'units': 'rpm', 'width': 16, 'scale': 1}
+        messages = dict(('Message%d' % i, {'senders': ['ECU'], 'message_id': i, 'length_bytes': 8,
+                                           'signals': {'Signal': signal}}) for i in range(3))
+        with open(path, 'w') as f:
+            json.dump({'messages': messages}, f)
+        return path
+
+    def test_phase_breakdown(self):
+        reports = []
+        mdf = MDF(self.file_name, 'sadaleo', 'UnitTest', 'UnitTest')
+        timer = mdf.enable_profiling(PhaseTimer(reports.append))
+        mdf.add_channel_group(self._channel_group())
+        mdf.import_dej(self._write_dej())
+        mdf.start_file()
+        for i in range(10):
+            mdf.write('Channel Group 1', i, [i])
+        mdf.write_many('Channel Group 1', [(i, [i]) for i in range(10, 15)])
+        mdf.close_file()
+        breakdown = timer.breakdown()
+        self.assertEqual(breakdown['add_channel_group']['count'], 4)
+        self.assertEqual(breakdown['import_dej']['count'], 1)
+        self.assertEqual(breakdown['import_dej.parse']['count'], 1)
+        self.assertEqual(breakdown['write']['count'], 10)
+        self.assertEqual(breakdown['write_many']['count'], 1)
+        for phase in ('_write_header', '_write_pointers', 'close_file'):
+            self.assertEqual(breakdown[phase]['count'], 1)
+        self.assertTrue(breakdown['import_dej']['total'] >= breakdown['import_dej.parse']['total'])
+        self.assertEqual(len(reports), 1)
+        self.assertTrue('write_many' in reports[0])
+
+    def test_write_many_matches_write(self):
+        outputs = []
+        for batched in (False, True):
+            mdf = MDF(self.file_name, 'sadaleo', 'UnitTest', 'UnitTest')
+            mdf.set_start_time_ns(1580547600000000000)
+            mdf.add_channel_group(self._channel_group())
+            mdf.start_file()
+            if batched:
+                mdf.write_many('Channel Group 1', ((i, [i * 2]) for i in range(20)))
+            else:
+                for i in range(20):
+                    mdf.write('Channel Group 1', i, [i * 2])
+            mdf.close_file()
+            with open(self.file_name, 'rb') as f:
+                outputs.append(f.read())
+        self.assertEqual(outputs[0], outputs[1])
+        self.assertTrue(outputs[1].endswith(struct.pack('<Bdf', 1, 19, 38)))
+
+    def test_rollover_phase(self):
+        mdf = MDF(self.file_name[:-4] + '1.mdf', 'sadaleo', 'UnitTest', 'UnitTest')
+        mdf.FILE_SIZE_LIMIT = 2000
+        timer = mdf.enable_profiling(PhaseTimer(lambda report: None))
+        mdf.add_channel_group(self._channel_group())
+        mdf.start_file()
+        mdf.write_many('Channel Group 1', [(i, [i]) for i in range(200)])
+        mdf.close_file()
+        breakdown = timer.breakdown()
+        self.assertTrue(breakdown['rollover']['count'] >= 1)
+        self.assertEqual(breakdown['close_file']['count'], breakdown['rollover']['count'] + 1)
+        self.assertEqual(breakdown['_write_header']['count'], breakdown['rollover']['count'] + 1)
+
+    def test_cprofile_hook(self):
+        stats_file = os.path.join(self.directory, 'import.prof')
+        mdf = MDF4(self.file_name, 'sadaleo', 'UnitTest', 'UnitTest')
+        hook = mdf.enable_profiling(CProfileHook(['import_dej'], stats_file))
+        mdf.import_dej(self._write_dej())
+        mdf.start_file()
+        mdf.write('Message0', 0, 1)
+        mdf.close_file()
+        functions = [function[2] for function in hook.stats().stats]
+        self.assertTrue('_add_channel_group' in functions)
+        self.assertFalse('_write_header' in functions)
+        self.assertEqual((hook.local.depth, hook.owner), (0, None))
+        self.assertTrue(pstats.Stats(stats_file).total_calls > 0)
+
+    def test_cprofile_hook_threads(self):
+        mdf = MDF(self.file_name, 'sadaleo', 'UnitTest', 'UnitTest')
+        hook = mdf.enable_profiling(CProfileHook(['write']))
+        mdf.add_channel_group(self._channel_group())
+        mdf.start_file()
+        errors = []
+
+        def writer(offset):
+            try:
+                for i in range(200):
+                    mdf.write('Channel Group 1', offset + i, [i])
+            except Exception as error:
+                errors.append(error)
+        threads = [threading.Thread(target=writer, args=(index * 1000,)) for index in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        mdf.close_file()
+        self.assertEqual(errors, [])
+        self.assertEqual(hook.owner, None)
+        self.assertEqual(mdf.cgBlockList[0].numberOfRecords, 800)
+        self.assertTrue(hook.stats().total_calls > 0)
+
+    def test_base_profiler_and_disable(self):
+        mdf = MDF(self.file_name, 'sadaleo', 'UnitTest', 'UnitTest')
+        mdf.enable_profiling(Profiler())
+        mdf.add_channel_group(self._channel_group())
+        mdf.start_file()
+        mdf.write('Channel Group 1', 0, [1])
+        mdf.disable_profiling()
+        self.assertEqual(mdf.profiler, None)
+        mdf.close_file()
+
+
+class Test_ImportTime(unittest.TestCase):
+    def test_import_time(self):
+        seconds, modules = import_time('mdfwriter', runs=1)
+        self.assertTrue(0 < seconds < 60)
+        self.assertTrue(modules > 0)
+
+    @unittest.skipIf(sys.version_info < (3, 7), "module __getattr__ needs Python 3.7")
+    def test_submodules_are_lazy(self):
+        script = ("import sys, mdfwriter; "
+                  "print(sorted(m for m in ('json', 'mdfwriter.mdf', 'mdfwriter.mdf4') if m in sys.modules)); "
+                  "print(mdfwriter.MDF4.__name__, 'mdfwriter.mdf4' in sys.modules); "
+                  "print(mdfwriter.STRUCT_TYPE is mdfwriter.mdf.STRUCT_TYPE, 'MDF' in dir(mdfwriter))")
+        output = subprocess.check_output([sys.executable, '-c', script]).decode('ascii').split('\n')
+        self.assertEqual(output[:3], ['[]', 'MDF4 True', 'True True'])
+
+    def test_star_import_names(self):
+        import mdfwriter
+        from mdfwriter import mdf
+        names = set(name for name, value in vars(mdf).items()
+                    if not name.startswith('_') and not isinstance(value, type(mdf)) and name != 'logger')
+        self.assertEqual(names - set(mdfwriter.__all__), set())
+        namespace = {}
+        exec('from mdfwriter import *', namespace)
+        self.assertTrue(namespace['STRUCT_TYPE'] is mdf.STRUCT_TYPE)
+        self.assertTrue(namespace['TriggeredMDF'] is mdfwriter.trigger.TriggeredMDF)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,169 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from mdfwriter.mdf import MDF, ChannelGroup, Channel, CANmsg, CANSignal
+from mdfwriter.reader import MDFReader, merge_files, signal_layout
+
+
+class Test_Reader(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _can_message(self):
+        message = CANmsg('Message')
+        message.messageID = 0x123
+        signal = CANSignal('Speed', 'Vehicle speed')
+        signal.units = 'km/h'
+        signal.startBit = 8
+        signal.bitCount = 16
+        signal.scale = 0.5
+        message.add_signal(signal)
+        return message
+
+    def _channel_group(self):
+        channel_group = ChannelGroup('Channel Group 1', 'Description')
+        channel_group.add_channel(Channel("Name", "Units", "Description"))
+        channel_group.add_channel(Channel("Name2", "Units2", "Description2"))
+        return channel_group
+
+    def _write_file(self, name, start_time, records, sorted_output=False, groups=None):
+        file_name = os.path.join(self.directory, name)
+        mdf = MDF(file_name, 'sadaleo', 'UnitTest', 'UnitTest', sorted_output=sorted_output)
+        mdf.set_start_time_ns(int(time.mktime(time.strptime('01:02:2020 ' + start_time, '%d:%m:%Y %H:%M:%S')))
+                              * 1000000000)
+        for channel_group in groups or (self._channel_group(), self._can_message()):
+            mdf.add_channel_group(channel_group)
+        mdf.start_file()
+        for group_name, timestamp, value in records:
+            mdf.write(group_name, timestamp, value)
+        mdf.close_file()
+        return file_name
+
+    def _read_all(self, file_name):
+        reader = MDFReader(file_name)
+        records = []
+        for data_group in range(len(reader.dataGroups)):
+            records.extend((timestamp, reader.groups[record_id - 1].name, record)
+                           for timestamp, record_id, record in reader.records(data_group))
+        reader.close()
+        return reader, sorted(records)
+
+    def test_read_header_and_groups(self):
+        for sorted_output in (False, True):
+            file_name = self._write_file('test.mdf', '10:00:00', [('Channel Group 1', 1.5, [1, 2]),
+                                                                   ('Message', 2.5, 0x0102)], sorted_output)
+            reader, records = self._read_all(file_name)
+            self.assertEqual((reader.date, reader.time, reader.author), ('01:02:2020', '10:00:00', 'sadaleo'))
+            self.assertEqual([group.numberOfRecords for group in reader.groups], [1, 1])
+            self.assertEqual([group.recordSize for group in reader.groups], [16, 16])
+            self.assertEqual(reader.groups[1].canID, 0x123)
+            signal = reader.groups[1].channelGroup.signalList[0]
+            self.assertEqual((signal.name, signal.units, signal.startBit, signal.bitCount, signal.scale),
+                             ('Speed', 'km/h', 8, 16, 0.5))
+            self.assertEqual([channel.name for channel in reader.groups[0].channelGroup.channel_list],
+                             ['Name', 'Name2'])
+            self.assertEqual([record[:2] for record in records], [(1.5, 'Channel Group 1'), (2.5, 'Message')])
+
+    def test_merge_rebases_and_orders(self):
+        first_records = [('Channel Group 1', i, [i, 0]) for i in range(0, 20, 2)]
+        first_records.insert(2, ('Message', 3.5, 7))
+        first = self._write_file('first.mdf', '10:00:00', first_records)
+        second = self._write_file('second.mdf', '10:00:10', [('Channel Group 1', i, [i + 10, 1]) for i in range(10)],
+                                  sorted_output=True)
+        merged = os.path.join(self.directory, 'merged.mdf')
+        mdf = MDF(merged, 'sadaleo', 'UnitTest', 'UnitTest', buffer_size=1048576)
+        self.assertEqual(merge_files([second, first], mdf), 21)
+        self.assertEqual([cg_block.numberOfRecords for cg_block in mdf.cgBlockList], [20, 1])
+        reader, records = self._read_all(merged)
+        self.assertEqual(reader.time, '10:00:00')
+        timestamps = [record[0] for record in records]
+        self.assertEqual(timestamps, sorted(timestamps))
+        self.assertEqual(timestamps.count(10.0), 2)  # 10 s in the first file and 0 s in the second
+        # Records are written in merge order, so reading the unsorted file back needs no sorting
+        reader = MDFReader(merged)
+        self.assertEqual([timestamp for timestamp, _, _ in reader.records(0)], timestamps)
+        reader.close()
+
+    def test_merge_separate_groups(self):
+        first = self._write_file('first.mdf', '10:00:00', [('Message', 1, 1)], groups=[self._can_message()])
+        second = self._write_file('second.mdf', '10:00:00', [('Channel Group 1', 2, [1, 2])],
+                                  groups=[self._channel_group()])
+        merged = os.path.join(self.directory, 'merged.mdf')
+        merge_files([first, second], MDF(merged, 'sadaleo', 'UnitTest', 'UnitTest', sorted_output=True))
+        reader, records = self._read_all(merged)
+        self.assertEqual([group.name for group in reader.groups], ['Message', 'Channel Group 1'])
+        self.assertEqual([record[:2] for record in records], [(1, 'Message'), (2, 'Channel Group 1')])
+
+    def test_merge_swapped_group_order(self):
+        other = ChannelGroup('Channel Group 2', 'Description')
+        other.add_channel(Channel("Name3", "Units3", "Description3"))
+        first = self._write_file('first.mdf', '10:00:00', [('Channel Group 1', 1, [1, 2]), ('Channel Group 2', 2, [3])],
+                                 groups=[self._channel_group(), other])
+        second = self._write_file('second.mdf', '10:00:00',
+                                  [('Channel Group 1', 3, [4, 5]), ('Channel Group 2', 4, [6])],
+                                  groups=[other, self._channel_group()])
+        merged = os.path.join(self.directory, 'merged.mdf')
+        self.assertEqual(merge_files([first, second], MDF(merged, 'sadaleo', 'UnitTest', 'UnitTest')), 4)
+        reader = MDFReader(merged)
+        try:
+            self.assertEqual([(group.name, group.numberOfRecords) for group in reader.groups],
+                             [('Channel Group 1', 2), ('Channel Group 2', 2)])
+            self.assertEqual(reader.find_group('Channel Group 2').recordID, 2)
+        finally:
+            reader.close()
+
+    def _signals(self):
+        temperature = CANSignal('Temperature')
+        temperature.endianness = 1
+        temperature.signedness = 1
+        temperature.startBit = 39  # MSB is bit 7 of byte 4
+        temperature.bitCount = 12
+        temperature.offset = 10
+        gear = CANSignal('Gear')
+        gear.startBit = 60
+        gear.bitCount = 4
+        gear.is_enum = True
+        gear.value_dict = {'0': 'P', '1': 'D'}
+        return temperature, gear
+
+    def test_signal_layout(self):
+        signal = CANSignal('Signal')
+        signal.startBit, signal.bitCount = 4, 12
+        self.assertEqual(signal_layout(signal, 8), [(0, 0xF0, -4), (1, 0xFF, 4)])
+        signal.endianness, signal.startBit, signal.bitCount = 1, 7, 16
+        self.assertEqual(signal_layout(signal, 8), [(0, 0xFF, 8), (1, 0xFF, 0)])
+        signal.startBit = 63
+        self.assertRaises(ValueError, signal_layout, signal, 8)
+
+    def test_read_signal(self):
+        message = self._can_message()
+        for signal in self._signals():
+            message.add_signal(signal)
+        payloads = [b'\x00\x10\x00\x00\xff\xe0\x00\x10', b'\x00\xff\xff\x00\x01\x00\x00\x20']
+        for sorted_output in (False, True):
+            file_name = self._write_file('signals.mdf', '10:00:00', [('Channel Group 1', 0.5, [1, 2])] +
+                                         [('Message', index, payload) for index, payload in enumerate(payloads)],
+                                         sorted_output, groups=[self._channel_group(), message])
+            reader = MDFReader(file_name)
+            try:
+                temperature, gear = self._signals()
+                timestamps, values = reader.read_signal(0x123, 'Speed')
+                self.assertEqual((list(timestamps), list(values)), ([0.0, 1.0], [8.0, 32767.5]))
+                self.assertEqual(list(reader.read_signal(0x123, temperature, raw=True)[1]), [-2, 16])
+                self.assertEqual(list(reader.read_signal(0x123, temperature)[1]), [8.0, 26.0])
+                self.assertEqual(list(reader.read_signal('Message', gear)[1]), ['D', None])
+                # value descriptions are read back from the CC block
+                self.assertEqual(list(reader.read_signal(0x123, 'Gear')[1]), ['D', None])
+                self.assertRaises(ValueError, reader.read_signal, reader.groups[0], temperature)
+                self.assertRaises(KeyError, reader.read_signal, 0x124, temperature)
+            finally:
+                reader.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import multiprocessing
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+from mdfwriter.mdf import MDF, ChannelGroup, Channel
+from mdfwriter.mdf4 import MDF4
+from mdfwriter.shard import ShardLayout, ShardWriter, merge_shards, read_shard_header
+from tests.mdf4_utils import read_data_groups
+
+
+def _layout():
+    channel_group_1 = ChannelGroup('Channel Group 1', 'Description')
+    channel_group_1.add_channel(Channel("Name", "Units", "Description"))
+    channel_group_2 = ChannelGroup('Channel Group 2', 'Description')
+    channel_group_2.add_channel(Channel("Name2", "Units2", "Description2"))
+    channel_group_2.add_channel(Channel("Name3", "Units3", "Description3"))
+    return ShardLayout([channel_group_1, channel_group_2])
+
+
+def _write_shard(file_name, layout, shard_index):
+    shard = ShardWriter(file_name, layout, shard_index)
+    shard.start_file()
+    if shard_index == 0:
+        shard.write_many('Channel Group 1', [(i, [i]) for i in range(0, 100, 2)])
+    else:
+        for i in range(1, 100, 2):
+            shard.write('Channel Group 2', i, [i, -i])
+    shard.close_file()
+
+
+class Test_Shard(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.layout = _layout()
+        self.shards = [os.path.join(self.directory, 'run.shard%d' % i) for i in range(2)]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _expected_records(self, record_ids=True):
+        records = []
+        for i in range(100):
+            if i % 2 == 0:
+                records.append((struct.pack('<B', 1) if record_ids else b'') + struct.pack('<df', i, i))
+            else:
+                records.append((struct.pack('<B', 2) if record_ids else b'') + struct.pack('<dff', i, i, -i))
+        return records
+
+    def test_shard_header_counts(self):
+        _write_shard(self.shards[1], self.layout, 1)
+        with open(self.shards[1], 'rb') as f:
+            shard_index, _, counts = read_shard_header(f)
+            self.assertEqual((shard_index, counts), (1, [0, 50]))
+            self.assertEqual(f.read(), b''.join(self._expected_records()[1::2]))
+
+    def test_merge_worker_processes(self):
+        workers = [multiprocessing.Process(target=_write_shard, args=(self.shards[i], self.layout, i))
+                   for i in range(2)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+            self.assertEqual(worker.exitcode, 0)
+        file_name = os.path.join(self.directory, 'run.mdf')
+        mdf = MDF(file_name, 'sadaleo', 'UnitTest', 'UnitTest')
+        self.assertEqual(merge_shards(self.shards, mdf, self.layout), 100)
+        self.assertEqual([cg_block.numberOfRecords for cg_block in mdf.cgBlockList], [50, 50])
+        with open(file_name, 'rb') as f:
+            data = f.read()
+        self.assertEqual(data[mdf.datapointer:], b''.join(self._expected_records()))
+        for k in range(2):
+            location = mdf.cgPointers['cg' + str(k + 1)]['numberOfRecordsPointer']
+            self.assertEqual(struct.unpack_from('<I', data, location)[0], 50)
+
+    def test_merge_into_sorted_mdf4(self):
+        for shard_index in range(2):
+            _write_shard(self.shards[shard_index], self.layout, shard_index)
+        file_name = os.path.join(self.directory, 'run.mf4')
+        merge_shards(self.shards, self.layout.apply(MDF4(file_name, 'sadaleo', 'UnitTest', 'UnitTest',
+                                                         sorted_output=True)))
+        with open(file_name, 'rb') as f:
+            groups = read_data_groups(f.read())
+        expected = self._expected_records(record_ids=False)
+        self.assertEqual(groups, [(0, [50], b''.join(expected[0::2])), (0, [50], b''.join(expected[1::2]))])
+
+    def test_layout_mismatch(self):
+        _write_shard(self.shards[0], self.layout, 0)
+        mdf = MDF(os.path.join(self.directory, 'run.mdf'), 'sadaleo', 'UnitTest', 'UnitTest')
+        mdf.add_channel_group(self.layout.channelGroups[1])
+        self.assertRaises(ValueError, merge_shards, self.shards[:1], mdf)
+        self.assertTrue(mdf.file.closed)
+        self.assertFalse(os.path.exists(mdf.filename))
+
+    def test_corrupt_shard(self):
+        for shard_index in range(2):
+            _write_shard(self.shards[shard_index], self.layout, shard_index)
+        with open(self.shards[1], 'ab') as f:
+            f.write(struct.pack('<Bdff', 9, 100, 0, 0))
+        for file_size_limit in (None, 2000):
+            mdf = MDF(os.path.join(self.directory, 'run1.mdf'), 'sadaleo', 'UnitTest', 'UnitTest')
+            mdf.FILE_SIZE_LIMIT = file_size_limit  # rolls over to run2.mdf2.mdf and on during the merge
+            with self.assertRaises(ValueError) as context:
+                merge_shards(self.shards, mdf, self.layout)
+            self.assertIn('Unknown record ID 9', str(context.exception))
+            self.assertTrue(mdf.file.closed)
+            self.assertFalse(os.path.exists(mdf.file.name))
+        self.assertTrue(mdf.fileIndex > 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
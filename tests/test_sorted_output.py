@@ -0,0 +1,83 @@
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+from mdfwriter.mdf import MDF, ChannelGroup, Channel
+
+
+def read_link(data, offset):
+    return struct.unpack_from('<l', data, offset)[0]
+
+
+def read_data_groups(data):
+    """Returns a list of (numberOfRecordIDs, dataPointer, numberOfRecords, data_size) for every DG in the file."""
+    groups = []
+    dg = read_link(data, 68)  # HDBlock.firstDGPointer
+    while dg:
+        cg = read_link(data, dg + 8)
+        record_ids = struct.unpack_from('<H', data, dg + 22)[0]
+        data_size, records = struct.unpack_from('<HI', data, cg + 20)
+        groups.append((record_ids, read_link(data, dg + 16), records, data_size))
+        dg = read_link(data, dg + 4)
+    return groups
+
+
+class Test_SortedOutput(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _write_file(self, name, **kwargs):
+        file_name = os.path.join(self.directory, name)
+        mdf = MDF(file_name, 'sadaleo', 'UnitTest', 'UnitTest', **kwargs)
+        mdf.set_start_time_ns(1580547600000000000)  # identical headers for byte comparisons
+        channel_group_1 = ChannelGroup('Channel Group 1', 'Description')
+        channel_group_1.add_channel(Channel("Name", "Units", "Description"))
+        channel_group_1.add_channel(Channel("Name2", "Units2", "Description2"))
+        channel_group_2 = ChannelGroup('Channel Group 2', 'Description')
+        channel_group_2.add_channel(Channel("Name3", "Units3", "Description3"))
+        mdf.add_channel_group(channel_group_1)
+        mdf.add_channel_group(channel_group_2)
+        mdf.start_file()
+        for i in range(10):
+            mdf.write('Channel Group 1', i, [i, i * 2])
+            mdf.write('Channel Group 2', i + 0.5, [i * 3])
+        mdf.close_file()
+        with open(file_name, 'rb') as f:
+            return f.read()
+
+    def test_unsorted_is_single_data_group(self):
+        data = self._write_file('unsorted.mdf')
+        self.assertEqual(struct.unpack_from('<H', data, 80)[0], 1)  # HDBlock.numberOfDGs
+        groups = read_data_groups(data)
+        self.assertEqual(len(groups), 1)
+        self.assertEqual(groups[0][0], 1)
+
+    def test_sorted_has_one_data_group_per_channel_group(self):
+        data = self._write_file('sorted.mdf', sorted_output=True)
+        self.assertEqual(struct.unpack_from('<H', data, 80)[0], 2)
+        groups = read_data_groups(data)
+        self.assertEqual([g[0] for g in groups], [0, 0])
+        self.assertEqual([(g[2], g[3]) for g in groups], [(10, 16), (10, 12)])
+
+    def test_sorted_group_data_is_contiguous(self):
+        data = self._write_file('sorted.mdf', sorted_output=True)
+        groups = read_data_groups(data)
+        _, pointer, records, size = groups[0]
+        values = [struct.unpack_from('<dff', data, pointer + size * i) for i in range(records)]
+        self.assertEqual(values, [(float(i), float(i), float(i * 2)) for i in range(10)])
+        _, pointer, records, size = groups[1]
+        values = [struct.unpack_from('<df', data, pointer + size * i) for i in range(records)]
+        self.assertEqual(values, [(i + 0.5, float(i * 3)) for i in range(10)])
+        self.assertEqual(groups[0][1] + 10 * 16, groups[1][1])
+
+    def test_spilled_buffers_match_memory_buffers(self):
+        in_memory = self._write_file('memory.mdf', sorted_output=True)
+        spilled = self._write_file('spilled.mdf', sorted_output=True, spill_budget=0, spill_dir=self.directory)
+        budgeted = self._write_file('budgeted.mdf', sorted_output=True, spill_budget=64)
+        # Only the header date/time may differ between the files
+        self.assertEqual(in_memory[100:], spilled[100:])
+        self.assertEqual(in_memory[100:], budgeted[100:])
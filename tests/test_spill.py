@@ -0,0 +1,61 @@
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+from mdfwriter.spill import SpillBuffer, copy_file
+
+
+class Test_SpillBuffer(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _records(self, key, count):
+        return [struct.pack('<Bd', key, i) for i in range(count)]
+
+    def test_memory_stays_within_budget(self):
+        spill_buffer = SpillBuffer(memory_budget=100, spill_dir=self.directory)
+        for i in range(50):
+            spill_buffer.append(1, struct.pack('<d', i))
+            spill_buffer.append(2, struct.pack('<dd', i, i))
+            self.assertTrue(spill_buffer.memoryBytes <= 100)
+        self.assertTrue(spill_buffer.spillCount > 0)
+        self.assertEqual(spill_buffer.totalBytes, 50 * 24)
+        self.assertEqual(spill_buffer.records(1), 50)
+        self.assertEqual(spill_buffer.size(2), 50 * 16)
+        spill_buffer.close()
+
+    def test_write_to_preserves_order(self):
+        for budget in (None, 0, 40):
+            spill_buffer = SpillBuffer(memory_budget=budget, spill_dir=self.directory)
+            first = self._records(1, 20)
+            second = self._records(2, 7)
+            for i in range(20):
+                spill_buffer.append(1, first[i])
+                if i < 7:
+                    spill_buffer.append(2, second[i])
+            with tempfile.TemporaryFile(dir=self.directory) as destination:
+                destination.write(b'header')
+                self.assertEqual(spill_buffer.write_to(2, destination), 7 * 9)
+                self.assertEqual(spill_buffer.write_to(1, destination), 20 * 9)
+                self.assertEqual(destination.tell(), 6 + 27 * 9)
+                destination.seek(0)
+                self.assertEqual(destination.read(), b'header' + b''.join(second) + b''.join(first))
+            self.assertEqual(spill_buffer.totalBytes, 0)
+            self.assertEqual(spill_buffer.memoryBytes, 0)
+            spill_buffer.close()
+
+    def test_copy_file_appends_at_position(self):
+        source_path = os.path.join(self.directory, 'source')
+        with open(source_path, 'wb') as f:
+            f.write(b'0123456789' * 1000)
+        with open(source_path, 'rb') as source:
+            with open(os.path.join(self.directory, 'destination'), 'wb+') as destination:
+                destination.write(b'abc')
+                self.assertEqual(copy_file(source, destination, 5000), 5000)
+                destination.write(b'xyz')
+                destination.seek(0)
+                self.assertEqual(destination.read(), b'abc' + (b'0123456789' * 500) + b'xyz')
@@ -0,0 +1,115 @@
+import calendar
+import os
+import shutil
+import struct
+import tempfile
+import time
+import unittest
+from mdfwriter.mdf import MDF, ChannelGroup, Channel
+from mdfwriter.mdf4 import MDF4
+from mdfwriter.policies import MinInterval
+from mdfwriter.reader import MDFReader
+
+START_TIME_NS = 1580547600123456789
+
+
+class Test_StartTime(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.file_name = os.path.join(self.directory, 'test.mdf')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _start_file(self, mdf_class=MDF):
+        mdf = mdf_class(self.file_name, 'sadaleo', 'UnitTest', 'UnitTest')
+        mdf.set_start_time_ns(START_TIME_NS)
+        channel_group = ChannelGroup('Channel Group 1', 'Description')
+        channel_group.add_channel(Channel("Name", "Units", "Description"))
+        mdf.add_channel_group(channel_group)
+        mdf.start_file()
+        return mdf
+
+    def _read(self):
+        with open(self.file_name, 'rb') as f:
+            return f.read()
+
+    def test_header_stores_nanoseconds(self):
+        mdf = self._start_file()
+        mdf.close_file()
+        data = self._read()
+        self.assertEqual(struct.unpack_from('<2sH', data, 64), (b'HD', 208))
+        local_time_ns, utc_offset = struct.unpack_from('<Qh', data, 64 + 164)
+        self.assertEqual(local_time_ns - utc_offset * 3600 * 1000000000, START_TIME_NS)
+        self.assertEqual(data[64 + 176:64 + 208].rstrip(b'\0'), b'Local PC Reference Time')
+        reader = MDFReader(self.file_name)
+        self.assertEqual(reader.startTimeNs, START_TIME_NS)
+        self.assertEqual(reader.time, time.strftime('%H:%M:%S', time.localtime(START_TIME_NS // 1000000000)))
+        reader.close()
+
+    @unittest.skipUnless(hasattr(time, 'tzset'), "time.tzset is not available")
+    def test_half_hour_time_zones(self):
+        tz = os.environ.get('TZ')
+        try:
+            for zone, hours in (('IST-5:30', 5), ('NST3:30', -4)):  # India and Newfoundland without DST
+                os.environ['TZ'] = zone
+                time.tzset()
+                self._start_file().close_file()
+                local_time_ns, utc_offset = struct.unpack_from('<Qh', self._read(), 64 + 164)
+                reader = MDFReader(self.file_name)
+                strings = calendar.timegm(time.strptime(reader.date + ' ' + reader.time, '%d:%m:%Y %H:%M:%S'))
+                self.assertEqual(local_time_ns // 1000000000, strings)
+                self.assertEqual(utc_offset, hours)
+                self.assertEqual(reader.startTimeNs, START_TIME_NS)
+                reader.close()
+        finally:
+            if tz is None:
+                os.environ.pop('TZ', None)
+            else:
+                os.environ['TZ'] = tz
+            time.tzset()
+
+    def test_write_ticks(self):
+        mdf = self._start_file()
+        mdf.write_ticks('Channel Group 1', mdf.startTick + 1500000000, [1])
+        mdf.write_many_ticks('Channel Group 1', [(mdf.startTick + 2000000000 + i, [i]) for i in range(0, 3000, 1000)])
+        mdf.close_file()
+        reader = MDFReader(self.file_name)
+        timestamps = [timestamp for timestamp, _, _ in reader.records(0)]
+        reader.close()
+        self.assertEqual(timestamps, [1.5, 2.0, 2.000001, 2.000002])
+
+    def test_write_many_ticks_with_policy(self):
+        mdf = self._start_file()
+        mdf.set_recording_policy('Channel Group 1', MinInterval(1.0))
+        mdf.write_many_ticks('Channel Group 1', iter([(mdf.startTick + i * 500000000, [i]) for i in range(5)]))
+        mdf.close_file()
+        reader = MDFReader(self.file_name)
+        timestamps = [timestamp for timestamp, _, _ in reader.records(0)]
+        reader.close()
+        self.assertEqual(timestamps, [0, 1.0, 2.0])
+
+    def test_define_start_time_after_start(self):
+        mdf = self._start_file()
+        tick = mdf.startTick
+        mdf.write('Channel Group 1', 0, [1])
+        mdf.define_start_time('12:34:56')
+        mdf.write('Channel Group 1', 1, [2])
+        mdf.close_file()
+        expected = int(time.mktime(time.strptime(mdf.HDBlock.date + ' 12:34:56', '%d:%m:%Y %H:%M:%S')))
+        self.assertEqual(mdf.get_epoch_time(), expected)
+        self.assertEqual(mdf.startTick - tick, expected * 1000000000 - START_TIME_NS)
+        reader = MDFReader(self.file_name)
+        self.assertEqual((reader.time, reader.startTimeNs), ('12:34:56', expected * 1000000000))
+        self.assertEqual([timestamp for timestamp, _, _ in reader.records(0)], [0, 1])
+        reader.close()
+
+    def test_mdf4_start_time(self):
+        mdf = self._start_file(MDF4)
+        mdf.set_start_time_ns(START_TIME_NS + 5)
+        mdf.close_file()
+        self.assertEqual(struct.unpack_from('<Q', self._read(), mdf.startTimePointer)[0], START_TIME_NS + 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+from mdfwriter.mdf import MDF, ChannelGroup, Channel, StringChannel
+from mdfwriter.mdf4 import MDF4
+from mdfwriter.reader import MDFReader
+from tests.mdf4_utils import read_data_groups
+
+
+class Test_StringChannel(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.file_name = os.path.join(self.directory, 'test.mdf')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _write_file(self, mdf_class=MDF, **kwargs):
+        mdf = mdf_class(self.file_name, 'sadaleo', 'UnitTest', 'UnitTest', **kwargs)
+        channel_group = ChannelGroup('Diagnostics', 'Description')
+        channel_group.add_channel(Channel("Code", "-", "Description"))
+        channel_group.add_channel(StringChannel("Text", 8, "Diagnostic text"))
+        channel_group.add_channel(Channel("Level", "-", "Description"))
+        mdf.add_channel_group(channel_group)
+        mdf.start_file()
+        mdf.write('Diagnostics', 0, [1, b'short', 2])
+        mdf.write('Diagnostics', 1, [3, memoryview(b'from a buffer'), 4])
+        mdf.write_many('Diagnostics', [(2, [5, bytearray(b'12345678'), 6]), (3, [7, u'text', 8])])
+        mdf.close_file()
+        with open(self.file_name, 'rb') as f:
+            return mdf, f.read()
+
+    def _expected_records(self, prefix=b''):
+        return b''.join(prefix + struct.pack('<df8sf', *values) for values in
+                        [(0, 1, b'short', 2), (1, 3, b'from a b', 4), (2, 5, b'12345678', 6), (3, 7, b'text', 8)])
+
+    def test_unsorted_records(self):
+        mdf, data = self._write_file()
+        self.assertEqual(data[mdf.datapointer:], self._expected_records(b'\x01'))
+        self.assertEqual(mdf.cgBlockList[0].data_size, 24)
+
+    def test_sorted_records(self):
+        mdf, data = self._write_file(sorted_output=True)
+        self.assertTrue(data.endswith(self._expected_records()))
+
+    def test_channel_blocks(self):
+        mdf, data = self._write_file()
+        cn_block = mdf.cnBlockList[2]
+        self.assertEqual((cn_block.signalType, cn_block.firstBitNo, cn_block.numberOfBits), (7, 96, 64))
+        self.assertEqual(mdf.cnBlockList[3].firstBitNo, 160)
+        self.assertEqual((mdf.cc_blockList[2].conversionID, mdf.cc_blockList[2].blockSize), (65535, 46))
+        reader = MDFReader(self.file_name)
+        channels = reader.groups[0].channelGroup.channel_list
+        self.assertTrue(isinstance(channels[1], StringChannel))
+        self.assertEqual((channels[1].name, channels[1].width), ('Text', 8))
+        self.assertEqual(reader.groups[0].recordSize, 24)
+        reader.close()
+
+    def test_mdf4_records(self):
+        mdf, data = self._write_file(MDF4, sorted_output=True)
+        self.assertEqual(read_data_groups(data), [(0, [4], self._expected_records())])
+
+    def test_wrong_value_type(self):
+        mdf = MDF(self.file_name, 'sadaleo', 'UnitTest', 'UnitTest')
+        channel_group = ChannelGroup('Data', 'Description')
+        channel_group.add_channel(Channel("Value", "-", "Description"))
+        mdf.add_channel_group(channel_group)
+        mdf.start_file()
+        self.assertRaises(struct.error, mdf.write, 'Data', 0, ['text'])
+        mdf.close_file()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import os
+import shutil
+import tempfile
+import unittest
+from mdfwriter.mdf import MDF, ChannelGroup, Channel, StringChannel, CANmsg, CANSignal
+from mdfwriter.mdf4 import MDF4
+from mdfwriter.reader import MDFReader
+from mdfwriter.template import MDFTemplate
+
+START_TIME_NS = 1580551200 * 1000000000
+
+
+def _channel_groups():
+    channel_group = ChannelGroup('Channel Group 1', 'Description')
+    channel_group.add_channel(Channel("Name", "Units", "Description"))
+    channel_group.add_channel(StringChannel("State", 8, "Description2"))
+    message = CANmsg('Message')
+    message.messageID = 0x123
+    signal = CANSignal('Speed', 'Vehicle speed')
+    signal.units = 'km/h'
+    signal.startBit = 8
+    signal.bitCount = 16
+    signal.scale = 0.5
+    message.add_signal(signal)
+    return [channel_group, message]
+
+
+def _write(mdf):
+    mdf.set_start_time_ns(START_TIME_NS)
+    mdf.write('Channel Group 1', 0.5, [1.0, 'idle'])
+    mdf.write_many('Message', [(i, i) for i in range(10)])
+    mdf.close_file()
+
+
+class Test_Template(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _read_bytes(self, name):
+        with open(os.path.join(self.directory, name), 'rb') as f:
+            return f.read()
+
+    def test_same_file_as_mdf(self):
+        for sorted_output in (False, True):
+            template = MDFTemplate(_channel_groups(), 'Bench run', sorted_output=sorted_output)
+            mdf = MDF(os.path.join(self.directory, 'built.mdf'), 'sadaleo', 'UnitTest', 'DUT', 'Bench run',
+                      sorted_output=sorted_output)
+            for channel_group in _channel_groups():
+                mdf.add_channel_group(channel_group)
+            mdf.start_file()
+            _write(mdf)
+            _write(MDF.from_template(template, os.path.join(self.directory, 'template.mdf'), 'sadaleo', 'UnitTest',
+                                     'DUT'))
+            self.assertEqual(self._read_bytes('template.mdf'), self._read_bytes('built.mdf'))
+
+    def test_files_are_independent(self):
+        template = MDFTemplate(_channel_groups(), description_size=32)
+        first = MDF.from_template(template, os.path.join(self.directory, 'first.mdf'), 'first', file_description='1st')
+        second = MDF.from_template(template, os.path.join(self.directory, 'second.mdf'), 'second', 'Project')
+        first.write('Channel Group 1', 1, [1.0, 'a'])
+        second.write_many('Channel Group 1', [(i, [i, 'b']) for i in range(3)])
+        late = ChannelGroup('Late')
+        late.add_channel(Channel("Late", "Units"))
+        second.add_channel_group(late)
+        second.write('Late', 3, [3])
+        first.close_file()
+        second.close_file()
+        self.assertEqual([cg_block.numberOfRecords for cg_block in template.cgBlockList], [0, 0])
+        first, second = MDFReader(first.filename), MDFReader(second.filename)
+        try:
+            self.assertEqual((first.author, first.project, first.description), ('first', '', '1st'))
+            self.assertEqual((second.author, second.project, second.description), ('second', 'Project', ''))
+            self.assertEqual([group.numberOfRecords for group in first.groups], [1, 0])
+            self.assertEqual([group.numberOfRecords for group in second.groups], [3, 0, 1])
+        finally:
+            first.close()
+            second.close()
+
+    def test_description_size(self):
+        template = MDFTemplate(_channel_groups(), 'Run', description_size=8)
+        self.assertRaises(ValueError, MDF.from_template, template, os.path.join(self.directory, 'long.mdf'),
+                          file_description='Too long')
+        self.assertRaises(ValueError, MDFTemplate, _channel_groups(), 'Too long', description_size=8)
+
+    def test_unsupported_writer(self):
+        template = MDFTemplate(_channel_groups())
+        self.assertRaises(ValueError, MDF4.from_template, template, os.path.join(self.directory, 'test.mf4'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+from mdfwriter.mdf import MDF, ChannelGroup, Channel, CANmsg, CANSignal
+from mdfwriter.mdf4 import MDF4
+from mdfwriter.reader import MDFReader
+
+LONG_NAME = 'Powertrain_Inverter_Rear_Phase_Current_Filtered'
+LONG_DESCRIPTION = 'Filtered phase current of the rear inverter. ' * 4
+
+
+class Test_TextBlocks(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.file_name = os.path.join(self.directory, 'test.mdf')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _write_file(self, mdf_class=MDF, **kwargs):
+        mdf = mdf_class(self.file_name, 'sadaleo', 'UnitTest', 'UnitTest', **kwargs)
+        for index in range(2):
+            message = CANmsg('Message%d' % index)
+            message.messageID = index
+            signal = CANSignal(LONG_NAME, LONG_DESCRIPTION)
+            signal.bitCount = 16
+            message.add_signal(signal)
+            mdf.add_channel_group(message)
+        channel_group = ChannelGroup('Channel Group 1', 'Description')
+        channel_group.add_channel(Channel(LONG_NAME, 'A', 'Short description'))
+        channel_group.add_channel(Channel('Short', 'A', LONG_DESCRIPTION))
+        mdf.add_channel_group(channel_group)
+        mdf.start_file()
+        mdf.write('Channel Group 1', 0, [1, 2])
+        mdf.close_file()
+        with open(self.file_name, 'rb') as f:
+            return mdf, f.read()
+
+    def test_long_texts_are_shared(self):
+        mdf, data = self._write_file()
+        self.assertEqual(len(mdf.txBlockList), 2 + 3)  # shared long texts and the group names
+        self.assertEqual(data.count(LONG_NAME.encode('ascii')), 1)
+        self.assertEqual(data.count(LONG_NAME[:31].encode('ascii') + b'\0'), 3)  # truncated in the CN blocks
+        self.assertEqual(data.count(LONG_DESCRIPTION.encode('ascii')), 1)
+        name_block = mdf.txBlockList[0]
+        self.assertEqual(struct.unpack_from('<2sH', data, name_block.address), (b'TX', len(LONG_NAME) + 5))
+        self.assertEqual(mdf.datapointer, mdf.txBlockList[-1].address + mdf.txBlockList[-1].blocksize)
+        self.assertTrue(data.endswith(struct.pack('<Bdff', 3, 0, 1, 2)))
+
+    def test_reader_restores_long_texts(self):
+        for sorted_output in (False, True):
+            self._write_file(sorted_output=sorted_output)
+            reader = MDFReader(self.file_name)
+            groups = [group.channelGroup for group in reader.groups]
+            signals = groups[0].signalList + groups[1].signalList
+            self.assertEqual([(signal.name, signal.description) for signal in signals], [(LONG_NAME, LONG_DESCRIPTION)] * 2)
+            self.assertEqual([(channel.name, channel.description) for channel in groups[2].channel_list],
+                             [(LONG_NAME, 'Short description'), ('Short', LONG_DESCRIPTION)])
+            reader.close()
+
+    def test_ce_blocks_are_shared(self):
+        for late in (None, 0, 4096):  # late groups behind the data or in the header reserve
+            mdf = MDF(self.file_name, 'sadaleo', 'UnitTest', 'UnitTest', header_reserve=late or 0)
+            messages = []
+            for index in range(3):
+                message = CANmsg('Message%d' % index)
+                message.messageID = 0x100 + index
+                for bit in range(3):
+                    signal = CANSignal('Signal%d_%d' % (index, bit), 'Bit')
+                    signal.startBit = bit
+                    signal.bitCount = 1
+                    message.add_signal(signal)
+                messages.append(message)
+            for message in messages[:2 if late is not None else 3]:
+                mdf.add_channel_group(message)
+            mdf.start_file()
+            if late is not None:
+                mdf.add_channel_group(messages[2])
+            mdf.write('Message2', 0, 1)
+            mdf.close_file()
+            self.assertEqual(len(mdf.ceBlockList), 3)
+            with open(self.file_name, 'rb') as f:
+                data = f.read()
+            self.assertEqual(data.count(b'CE\x80\x00\x13\x00'), 3)
+            reader = MDFReader(self.file_name)
+            self.assertEqual([group.channelGroup.messageID for group in reader.groups], [0x100, 0x101, 0x102])
+            reader.close()
+            for cg_block in mdf.cgBlockList:
+                addresses = set(cn_block.ceBlock.address for cn_block in cg_block.cnBlockList[1:])
+                self.assertEqual(len(addresses), 1)
+                address = addresses.pop()
+                self.assertEqual(struct.unpack_from('<2sHHI', data, address), (b'CE', 128, 19, cg_block.messageID))
+
+    def test_mdf4_texts_are_shared(self):
+        mdf, data = self._write_file(MDF4)
+        self.assertEqual(data.count(LONG_NAME.encode('ascii')), 1)
+        self.assertEqual(data.count(LONG_DESCRIPTION.encode('ascii')), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+import os
+import shutil
+import tempfile
+import unittest
+from mdfwriter.mdf import ChannelGroup, Channel, CANmsg
+from mdfwriter.reader import MDFReader
+from mdfwriter.trigger import TriggeredMDF
+
+
+class Test_Trigger(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.file_name = os.path.join(self.directory, 'test.mdf')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _start(self, **kwargs):
+        mdf = TriggeredMDF(self.file_name, 'sadaleo', 'UnitTest', 'UnitTest', pre_trigger=2, post_trigger=1, **kwargs)
+        channel_group = ChannelGroup('Battery', 'Description')
+        channel_group.add_channel(Channel("Voltage", "V", "Description"))
+        message = CANmsg('DTC')
+        message.messageID = 0x7E8
+        mdf.add_channel_group(channel_group)
+        mdf.add_channel_group(message)
+        mdf.start_file()
+        return mdf
+
+    def _records(self):
+        reader = MDFReader(self.file_name)
+        records = []
+        for data_group in range(len(reader.dataGroups)):
+            records.extend((timestamp, record_id) for timestamp, record_id, _ in reader.records(data_group))
+        reader.close()
+        return sorted(records)
+
+    def test_signal_threshold(self):
+        for sorted_output in (False, True):
+            mdf = self._start(sorted_output=sorted_output)
+            mdf.add_trigger('Battery', lambda value: value[0] > 60)
+            mdf.write_many('Battery', [(t, [65 if t == 11 else 50]) for t in range(20)])
+            mdf.close_file()
+            self.assertEqual(mdf.triggerEvents, [(11, 'Battery')])
+            self.assertEqual([timestamp for timestamp, _ in self._records()], [9, 10, 11, 12])
+            self.assertEqual(mdf.discardedRecords, 16)  # every record that was not written
+
+    def test_can_id_and_api_trigger(self):
+        mdf = self._start()
+        mdf.add_trigger('DTC')
+        for t in range(10):
+            mdf.write('Battery', t, [t])
+            if t == 4:
+                mdf.write('DTC', t + 0.5, 1)
+        mdf.remove_trigger('DTC')
+        mdf.write('DTC', 9.5, 1)
+        mdf.trigger(reason='button')
+        mdf.write('Battery', 10, [10])
+        mdf.write('Battery', 11, [11])
+        mdf.close_file()
+        self.assertEqual(mdf.triggerEvents, [(4.5, 'DTC'), (9.5, 'button')])
+        self.assertEqual(self._records(), [(3, 1), (4, 1), (4.5, 2), (5, 1), (8, 1), (9, 1), (9.5, 2), (10, 1)])
+
+    def test_overlapping_windows_merge(self):
+        mdf = self._start()
+        mdf.add_trigger('Battery', lambda value: value[0] in (3, 4))
+        mdf.write_many('Battery', [(t, [t]) for t in range(8)])
+        mdf.close_file()
+        self.assertEqual(mdf.triggerEvents, [(3, 'Battery')])
+        self.assertEqual([timestamp for timestamp, _ in self._records()], [1, 2, 3, 4, 5])
+
+    def test_ring_size(self):
+        mdf = self._start(ring_size=3 * 13)  # three Battery records
+        mdf.write_many('Battery', [(t * 0.1, [t]) for t in range(10)])
+        self.assertEqual(len(mdf.ring), 3)
+        mdf.trigger()
+        mdf.close_file()
+        self.assertEqual(len(self._records()), 3)
+
+    def test_rollover_keeps_ring(self):
+        self.file_name = os.path.join(self.directory, 'run1.mdf')
+        mdf = self._start()
+        mdf.FILE_SIZE_LIMIT = 1  # every flushed record starts a new file
+        mdf.write_many('Battery', [(t, [t]) for t in range(10)])
+        mdf.trigger()
+        self.assertEqual(mdf.discardedRecords, 7)
+        mdf.close_file()
+        self.assertEqual(mdf.discardedRecords, 7)
+        self.assertEqual(mdf.fileIndex, 4)
+
+    def test_dropped_metrics(self):
+        mdf = self._start()
+        mdf.enable_metrics()
+        mdf.write_many('Battery', [(t, [t]) for t in range(10)])
+        self.assertEqual(mdf.metrics.groupRecords, {})
+        mdf.trigger()
+        mdf.write('Battery', 10, [10])
+        mdf.write('Battery', 15, [15])  # in the ring at close
+        mdf.close_file()
+        self.assertEqual(mdf.metrics.droppedRecords, mdf.discardedRecords)
+        self.assertEqual(mdf.discardedRecords, 8)
+        self.assertEqual(mdf.metrics.groupRecords, {'Battery': 4})
+        self.assertEqual(mdf.metrics.groupBytes, {'Battery': 4 * 13})
+
+
+if __name__ == '__main__':
+    unittest.main()